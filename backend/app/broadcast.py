@@ -0,0 +1,181 @@
+# app/broadcast.py
+import asyncio
+import json
+import time
+from collections import deque
+
+from fastapi import WebSocket
+
+from app import config, metrics
+from app.preview import AdaptiveRate, PreviewFrame, PreviewLevel
+from app.state_sync import DELTA_PREFIX
+
+_RESYNC = object()  # in a text queue: a buckets snapshot, built when it is sent
+
+
+class Subscriber:
+    """
+    One connected client. Every send to its WebSocket goes through run(), so the
+    receive loop and the frame fan-out never write to the socket concurrently.
+
+    Frames are a single "latest" slot: a slow client skips straight to the
+    newest frame instead of building a backlog. Text messages (control acks,
+    buckets_update) are queued in order and always go before the next frame.
+    They are never dropped: past `max_texts` queued, the bucket deltas are
+    replaced by one snapshot from `resync` (they are superseded by it), and a
+    client still that far behind on control messages alone is disconnected.
+
+    `rate` picks this client's JPEG quality, preview size and frame rate from
+    how long its sends take and how many frames pile up meanwhile.
+
+    `mode` "annotated" sends count header + JPEG with the boxes drawn in;
+    "vector" sends an "overlay" text message, then the bare JPEG (the
+    camera's own bytes where possible) for the client to draw over.
+    """
+
+    def __init__(self, websocket: WebSocket, max_texts: int = 64, rate: AdaptiveRate = None, mode: str = None,
+                 resync=None):
+        self.websocket = websocket
+        self.max_texts = max_texts
+        self.resync = resync  # () -> buckets snapshot message (BucketStateSync.snapshot_message)
+        self.overflowed = False
+        self.mode = mode or config.PREVIEW_MODE
+        self.offset = 0  # legacy set_offset, added to the count in the frame header
+        self.skipped_frames = 0
+        self.rate = rate if rate is not None else default_rate()
+        self._frame = None  # PreviewFrame
+        self._arrived = 0   # frames pushed since the last one we took
+        self._texts = deque()
+        self._wake = asyncio.Event()
+        self._closed = False
+
+    def push_frame(self, frame: PreviewFrame):
+        if self._frame is not None:
+            self.skipped_frames += 1
+        self._frame = frame
+        self._arrived += 1
+        self._wake.set()
+
+    def send_text(self, text: str):
+        if self._closed:
+            return
+        self._texts.append(text)
+        if len(self._texts) > self.max_texts:
+            self._collapse_texts()
+        self._wake.set()
+
+    def _collapse_texts(self):
+        if self.resync is not None:
+            kept, resync = deque(), False
+            for text in self._texts:
+                if text is _RESYNC or text.startswith(DELTA_PREFIX):
+                    if not resync:
+                        kept.append(_RESYNC)  # where the first delta was, so order is kept
+                        resync = True
+                else:
+                    kept.append(text)
+            self._texts = kept
+        if len(self._texts) > self.max_texts:
+            print(f"Subscriber {len(self._texts)} messages behind, disconnecting")
+            self.overflowed = True
+            self.close()
+
+    def send_json(self, data: dict):
+        self.send_text(json.dumps(data))
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+
+    async def run(self):
+        """Sender loop, one task per client. Returns when closed or the socket fails."""
+        last_frame_at = 0.0
+        try:
+            while not self._closed:
+                await self._wake.wait()
+                self._wake.clear()
+                while self._texts and not self._closed:
+                    text = self._texts.popleft()
+                    await self.websocket.send_text(self.resync() if text is _RESYNC else text)
+                if self._frame is None or self._closed:
+                    continue
+                # preview frame-rate cap: come back when this client is due a frame
+                wait = last_frame_at + self.rate.min_interval - time.monotonic()
+                if wait > 0:
+                    # still wake early for text messages
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake.set()
+                    continue
+                frame, self._frame = self._frame, None
+                self._arrived = 0
+                start = time.monotonic()
+                offset = self.offset or 0
+                if self.mode == "vector":
+                    data = await frame.raw(self.rate.level)
+                    sent_at = time.monotonic()
+                    await self.websocket.send_text(frame.overlay_message(offset))
+                else:
+                    # binary frame: 4-byte BE unsigned total count + JPEG bytes, shared by
+                    # every client at this level
+                    data = await frame.framed(self.rate.level, offset)
+                    sent_at = time.monotonic()
+                await self.websocket.send_bytes(data)
+                last_frame_at = time.monotonic()
+                metrics.SEND_SECONDS.observe(last_frame_at - sent_at)
+                metrics.PREVIEW_BYTES_SENT.labels(self.mode).inc(len(data))
+                # frames that arrived while we were busy = this client's backlog
+                self.rate.observe(last_frame_at - start, self._arrived)
+            if self.overflowed:
+                # 1013 try again later: the client reconnects for the current state
+                await self.websocket.close(code=1013, reason="too far behind")
+        except Exception as e:
+            # client went away mid-send
+            print("Subscriber send error, dropping client:", e)
+        finally:
+            self._closed = True
+
+
+def default_rate() -> AdaptiveRate:
+    if config.PREVIEW_ADAPTIVE:
+        return AdaptiveRate()
+    return AdaptiveRate(ladder=(PreviewLevel(config.PREVIEW_QUALITY, 1.0, None),), start=0, adaptive=False)
+
+
+class BroadcastHub:
+    """Fans frames and state messages from the engine out to every subscriber."""
+
+    def __init__(self):
+        self.subscribers = set()
+
+    @property
+    def vector_clients(self) -> int:
+        return sum(1 for sub in self.subscribers if sub.mode == "vector")
+
+    def subscribe(self, websocket: WebSocket, mode: str = None, resync=None) -> Subscriber:
+        sub = Subscriber(websocket, mode=mode, resync=resync)
+        self.subscribers.add(sub)
+        metrics.CLIENTS.inc()  # one hub per line, the gauge is the total
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        if sub in self.subscribers:
+            self.subscribers.discard(sub)
+            metrics.CLIENTS.inc(-1)
+        sub.close()
+
+    def publish_frame(self, frame: PreviewFrame):
+        for sub in self.subscribers:
+            sub.push_frame(frame)
+
+    def publish_text(self, text: str):
+        for sub in self.subscribers:
+            sub.send_text(text)
+
+    def publish_json(self, data: dict):
+        self.publish_text(json.dumps(data))
+
+    def __len__(self):
+        return len(self.subscribers)
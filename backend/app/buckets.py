@@ -0,0 +1,60 @@
+# app/buckets.py
+import asyncio
+import json
+from pathlib import Path
+
+from app.persistence import BucketStore
+
+# --- Bucket persistence/configuration ---
+BUCKET_COUNT = 14
+DEFAULT_SET_VALUE = 800
+BUCKETS_FILE = Path(__file__).parent / "buckets.json"
+BUCKETS_JOURNAL = Path(__file__).parent / "buckets.journal"
+
+
+class LineBuckets:
+    """
+    The authoritative bucket list of one counting line, its lock and its
+    write-behind store (snapshot + append-only journal, off the hot path).
+    """
+
+    def __init__(self, snapshot_path: Path, journal_path: Path,
+                 bucket_count: int = BUCKET_COUNT, set_value: int = DEFAULT_SET_VALUE):
+        self.bucket_count = bucket_count
+        self.default_set_value = set_value
+        self.store = BucketStore(snapshot_path, journal_path, flush_interval=1.0, snapshot_interval=30.0)
+        self.buckets = self.store.load(self._default, bucket_count)
+        self.lock = asyncio.Lock()  # protect concurrent access if multiple clients connect
+
+    def _default(self):
+        return [
+            {"id": i + 1, "count": 0, "set_value": self.default_set_value, "filled": False}
+            for i in range(self.bucket_count)
+        ]
+
+    def save(self, ids=None, urgent: bool = True):
+        """
+        Queue buckets for persistence; returns immediately.
+        ids limits the journal entry to the buckets that changed. urgent writes
+        within milliseconds instead of on the next flush interval.
+        """
+        self.store.record(self.buckets, ids=ids, urgent=urgent)
+
+    def close(self):
+        self.store.close()
+
+
+def buckets_message(buckets) -> str:
+    return json.dumps({"type": "buckets_update", "buckets": buckets})
+
+# the single-line setup (no lines.json): loaded at module import
+DEFAULT_LINE_BUCKETS = LineBuckets(BUCKETS_FILE, BUCKETS_JOURNAL)
+BUCKETS = DEFAULT_LINE_BUCKETS.buckets
+BUCKETS_LOCK = DEFAULT_LINE_BUCKETS.lock
+STORE = DEFAULT_LINE_BUCKETS.store
+
+def load_buckets_from_disk():
+    return STORE.load(DEFAULT_LINE_BUCKETS._default, BUCKET_COUNT)
+
+def save_buckets_to_disk(buckets, ids=None, urgent: bool = True):
+    STORE.record(buckets, ids=ids, urgent=urgent)
@@ -0,0 +1,57 @@
+# app/calibration.py
+from fastapi import APIRouter, HTTPException
+
+from app import config
+from app.color_lut import COLOR_LUT_FILE, save_color_lut
+from app.detection import COCONUT_HSV_RANGES, ColorLut, color_lut, set_color_lut
+from app.engine import get_manager
+from app.models import ColorCalibration
+
+router = APIRouter()
+
+
+def _apply(lut: ColorLut):
+    set_color_lut(lut)
+    get_manager().reload_color_lut()
+
+
+@router.get("/calibration/color")
+def get_color_calibration():
+    """The colour table in use: where it came from, its size and how much of colour space it accepts."""
+    return {"enabled": config.COLOR_LUT, **color_lut().describe()}
+
+
+@router.post("/calibration/color")
+def calibrate_color(payload: ColorCalibration):
+    """
+    Rebuild the colour table from sample pixels, e.g. after switching between
+    wet and dry nuts. Accepts JSON
+    { coconut: [[b,g,r], …], background: [[b,g,r], …], spread: 1, extend: false }
+    The table is saved and every line switches to it on its next frame.
+    """
+    pixels = payload.coconut + payload.background
+    if not payload.coconut and not payload.extend:
+        raise HTTPException(status_code=400, detail="No coconut samples given")
+    if any(not 0 <= v <= 255 for px in pixels for v in px):
+        raise HTTPException(status_code=400, detail="Pixel values must be within 0..255")
+    if not 0 <= payload.spread <= 8:
+        raise HTTPException(status_code=400, detail="spread must be within 0..8")
+
+    lut = color_lut().calibrate(payload.coconut, payload.background, spread=payload.spread, extend=payload.extend)
+    try:
+        save_color_lut(lut)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not save colour table: {e}")
+    _apply(lut)
+    return {"status": "ok", "enabled": config.COLOR_LUT, **lut.describe()}
+
+
+@router.delete("/calibration/color")
+def reset_color_calibration():
+    """Forget the calibration and go back to the HSV ranges in app/detection.py."""
+    try:
+        COLOR_LUT_FILE.unlink(missing_ok=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not remove colour table: {e}")
+    _apply(ColorLut.from_hsv_ranges(COCONUT_HSV_RANGES, config.COLOR_LUT_BITS))
+    return {"status": "ok", "enabled": config.COLOR_LUT, **color_lut().describe()}
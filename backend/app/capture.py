@@ -0,0 +1,278 @@
+# app/capture.py
+import os
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+import cv2
+
+
+class CaptureSettings(NamedTuple):
+    width: int = 320           # ask the camera for the processing size directly
+    height: int = 240
+    fps: float = 30.0
+    fourcc: str = "MJPG"       # "" = leave the camera's default pixel format
+    buffer_size: int = 1       # frames the driver may queue (CAP_PROP_BUFFERSIZE)
+    latest_only: bool = True   # cameras: keep grabbing, decode only the newest frame on read()
+    loop: bool = False         # video files: replay forever at their own fps, as a camera stand-in
+    keep_jpeg: bool = False    # MJPG cameras: keep each frame's JPEG bytes for preview passthrough
+
+
+def settings_from_config() -> CaptureSettings:
+    from app import config
+    return CaptureSettings(config.CAMERA_WIDTH, config.CAMERA_HEIGHT, config.CAMERA_FPS, config.CAMERA_FOURCC,
+                           config.CAMERA_BUFFER_SIZE, config.CAMERA_LATEST_ONLY, config.CAMERA_LOOP,
+                           config.PREVIEW_PASSTHROUGH)
+
+
+class Camera:
+    """
+    cv2.VideoCapture with the camera set up for counting.
+
+    On open the pixel format, resolution, frame rate and driver buffer depth
+    are requested (V4L2 on Linux) and whatever the driver actually agreed to
+    is kept in `negotiated`. MJPG at the processing size avoids both USB
+    bandwidth limits and a resize per frame.
+
+    With latest_only, a grabber thread calls grab() as fast as the camera
+    delivers, so no stale frames pile up in the driver; read() then decodes
+    (retrieve()) only the newest one. Frames nobody reads are never decoded.
+    `fps` is the rate the camera actually delivers, not what it was asked for.
+
+    With keep_jpeg on an MJPG camera, OpenCV is asked for the undecoded
+    frames (CAP_PROP_CONVERT_RGB=0); read() decodes them itself and keeps the
+    camera's JPEG bytes for take_jpeg(), so previews can be sent untouched.
+
+    A video file with loop=True behaves like a camera: it is paced at its own
+    frame rate, restarts at the end and reports is_live, so the whole live
+    path can be exercised without hardware (or use a v4l2loopback device).
+    """
+
+    def __init__(self, source=0, settings: CaptureSettings = CaptureSettings()):
+        self.source = source
+        self.settings = settings
+        self.cap = None
+        self.negotiated = {}
+        self.fps = 0.0  # delivered frames per second (EWMA)
+        self.grabbed = 0
+        self.retrieved = 0
+        self._jpeg = None
+        self._last_frame_at = None
+        self._next_due = 0.0
+        self._cond = threading.Condition()
+        self._grabber = None
+        self._stop = threading.Event()
+        self._fresh = False
+        self._grabbing = False
+        self._retrieving = False
+        self._waiting = 0
+        self._ended = False
+
+    @property
+    def is_file(self) -> bool:
+        return isinstance(self.source, str) and os.path.isfile(self.source)
+
+    @property
+    def is_live(self) -> bool:
+        """Frames arrive in real time and may be dropped (cameras, looping files)."""
+        return not self.is_file or self.settings.loop
+
+    def is_open(self) -> bool:
+        return bool(self.cap and self.cap.isOpened())
+
+    # ─── open / close ────────────────────────────────────────────
+    def _video_capture(self):
+        source = self.source
+        is_device = isinstance(source, int) or (isinstance(source, str) and source.startswith("/dev/video"))
+        if is_device and sys.platform.startswith("linux"):
+            cap = cv2.VideoCapture(source, cv2.CAP_V4L2)
+            if cap.isOpened():
+                return cap
+            cap.release()
+        return cv2.VideoCapture(source)
+
+    def _configure(self, cap):
+        s = self.settings
+        if not self.is_file:
+            # pixel format first: some drivers only offer large sizes / high fps in MJPG
+            if s.fourcc:
+                cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*s.fourcc))
+            if s.width and s.height:
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, s.width)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, s.height)
+            if s.fps:
+                cap.set(cv2.CAP_PROP_FPS, s.fps)
+            if s.buffer_size:
+                cap.set(cv2.CAP_PROP_BUFFERSIZE, s.buffer_size)
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        self.negotiated = {
+            "fourcc": "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)).strip("\x00") if fourcc > 0 else "",
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": cap.get(cv2.CAP_PROP_FPS),
+            "buffer_size": int(cap.get(cv2.CAP_PROP_BUFFERSIZE)),
+        }
+        if s.keep_jpeg and not self.is_file and self.negotiated["fourcc"] == "MJPG":
+            # undecoded frames; only safe once the camera has really agreed to MJPG
+            self.negotiated["jpeg_passthrough"] = bool(cap.set(cv2.CAP_PROP_CONVERT_RGB, 0))
+
+    def open(self, retries: int = 3, delay: float = 0.2) -> bool:
+        """
+        Open and configure the source and verify a frame can be read.
+        Returns True if OK, False otherwise. delay: seconds between attempts
+        (USB camera warm-up).
+        """
+        self.release()
+        for attempt in range(1, retries + 1):
+            cap = self._video_capture()
+            if not cap.isOpened():
+                cap.release()
+                time.sleep(delay)
+                continue
+            self._configure(cap)
+            ret, _ = cap.read()
+            if ret:
+                self.cap = cap
+                self._start()
+                return True
+            cap.release()
+            time.sleep(delay)
+        return False
+
+    def _start(self):
+        self.fps = 0.0
+        self._last_frame_at = None
+        self._next_due = time.monotonic()
+        self._fresh = self._ended = False
+        self._stop.clear()
+        if self.settings.latest_only and self.is_live:
+            self._grabber = threading.Thread(target=self._grab_loop, name="camera-grab", daemon=True)
+            self._grabber.start()
+
+    def release(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._grabber is not None:
+            self._grabber.join(2.0)
+            self._grabber = None
+        if self.cap is not None:
+            try:
+                self.cap.release()
+            finally:
+                self.cap = None
+
+    def describe(self) -> dict:
+        return {"source": str(self.source), "requested": self.settings._asdict(), "negotiated": self.negotiated,
+                "delivered_fps": round(self.fps, 1), "grabbed": self.grabbed, "retrieved": self.retrieved}
+
+    # ─── frames ──────────────────────────────────────────────────
+    def _decoded(self, frame):
+        """Pass BGR frames through; decode raw MJPEG buffers and keep their bytes."""
+        if frame is None or frame.ndim == 3:
+            self._jpeg = None
+            return frame
+        jpeg = frame.reshape(-1)
+        self._jpeg = jpeg
+        return cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+
+    def take_jpeg(self):
+        """The camera's own JPEG of the frame read last (uint8 array), or None. Call from the reading thread."""
+        jpeg, self._jpeg = self._jpeg, None
+        return jpeg
+
+    def _tick(self):
+        now = time.perf_counter()
+        if self._last_frame_at is not None:
+            dt = now - self._last_frame_at
+            if dt > 0:
+                self.fps = 1.0 / dt if self.fps == 0.0 else self.fps + 0.1 * (1.0 / dt - self.fps)
+        self._last_frame_at = now
+
+    def read(self):
+        """The next (cameras: newest) frame, or None at end of stream / camera lost."""
+        if self.cap is None:
+            return None
+        if self._grabber is not None:
+            return self._read_latest()
+        ret, frame = self.cap.read()
+        if not ret and self.settings.loop and self.is_file:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if not ret:
+            return None
+        if self.settings.loop and self.is_file:
+            self._pace()
+        self.grabbed += 1
+        self.retrieved += 1
+        self._tick()
+        return self._decoded(frame)
+
+    def _pace(self):
+        fps = self.negotiated.get("fps") or self.settings.fps or 30.0
+        self._next_due += 1.0 / fps
+        wait = self._next_due - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        else:
+            self._next_due = time.monotonic()  # fell behind, don't try to catch up
+
+    def _read_latest(self, timeout: float = 5.0):
+        with self._cond:
+            self._waiting += 1
+            try:
+                ready = self._cond.wait_for(lambda: (self._fresh and not self._grabbing) or self._ended, timeout)
+            finally:
+                self._waiting -= 1
+            if not ready or not self._fresh:
+                return None
+            self._fresh = False
+            self._retrieving = True
+        try:
+            ret, frame = self.cap.retrieve()
+        finally:
+            with self._cond:
+                self._retrieving = False
+                self._cond.notify_all()
+        if not ret:
+            return None
+        self.retrieved += 1
+        return self._decoded(frame)
+
+    def _grab(self) -> bool:
+        if not (self.settings.loop and self.is_file):
+            return self.cap.grab()
+        self._pace()
+        if self.cap.grab():
+            return True
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return self.cap.grab()
+
+    def _grab_loop(self):
+        failures = 0
+        cond = self._cond
+        while not self._stop.is_set():
+            with cond:
+                # a reader waiting for the frame just grabbed gets it before the next grab
+                cond.wait_for(lambda: self._stop.is_set() or not (self._retrieving or (self._fresh and self._waiting)))
+                if self._stop.is_set():
+                    break
+                self._grabbing = True
+            ok = self._grab()
+            with cond:
+                self._grabbing = False
+                if ok:
+                    failures = 0
+                    self._fresh = True
+                    self.grabbed += 1
+                    self._tick()
+                else:
+                    failures += 1
+                    if failures >= 10:
+                        self._ended = True
+                cond.notify_all()
+            if self._ended:
+                break
+            if not ok:
+                time.sleep(0.01)
@@ -0,0 +1,136 @@
+# app/color_lut.py
+import io
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from app.persistence import atomic_write_bytes
+
+COLOR_LUT_FILE = Path(__file__).parent / "color_lut.npz"
+
+
+class ColorLut:
+    """
+    BGR -> coconut/not-coconut lookup table.
+
+    Each channel is cut to its top `bits` bits (64 levels for bits=6), so the
+    table has 2**(3*bits) entries (256 KB for 64³) holding 0 or 255. Pixels
+    are classified with one gather: the index b·n² + g·n + r is formed by a
+    single cv2.transform over the masked frame, and the table is indexed with
+    it. The cost is the same for three HSV ranges or for an arbitrary colour
+    region learned from samples, and there is no HSV conversion.
+
+    Built from the configured HSV ranges (from_hsv_ranges) or calibrated from
+    sample pixels of nuts and belt (calibrate).
+    """
+
+    def __init__(self, table: np.ndarray, bits: int = 6, source: str = "ranges", updated_at: float = None):
+        if not 3 <= bits <= 7:
+            raise ValueError("bits must be within 3..7")
+        n = 1 << bits
+        table = np.asarray(table, dtype=np.uint8).reshape(-1)
+        if table.size != n ** 3:
+            raise ValueError(f"table has {table.size} entries, expected {n ** 3} for {bits} bits")
+        self.table = np.where(table > 0, 255, 0).astype(np.uint8)
+        self.bits = bits
+        self.source = source
+        self.updated_at = updated_at or time.time()
+        shift = 8 - bits
+        self._keep = (0xFF << shift) & 0xFF
+        # masked channel values are multiples of 2**shift: scale them into b·n² + g·n + r
+        self._index = np.array([[n * n / (1 << shift), n / (1 << shift), 1.0 / (1 << shift)]], dtype=np.float32)
+
+    @property
+    def levels(self) -> int:
+        return 1 << self.bits
+
+    # ─── building ────────────────────────────────────────────────
+    @staticmethod
+    def bin_centres(bits: int) -> np.ndarray:
+        """(n³, 1, 3) uint8 BGR image of every bin's centre colour, in table order."""
+        n, shift = 1 << bits, 8 - bits
+        c = (np.arange(n) << shift) + (1 << shift) // 2
+        grid = np.stack(np.meshgrid(c, c, c, indexing="ij"), axis=-1)
+        return grid.reshape(-1, 1, 3).astype(np.uint8)
+
+    @classmethod
+    def from_hsv_ranges(cls, ranges, bits: int = 6) -> "ColorLut":
+        """Table equal to OR-ing cv2.inRange over the HSV ranges, sampled at each bin's centre."""
+        hsv = cv2.cvtColor(cls.bin_centres(bits), cv2.COLOR_BGR2HSV)
+        table = np.zeros(hsv.shape[0], dtype=np.uint8)
+        for lower, upper in ranges:
+            table |= cv2.inRange(hsv, lower, upper).reshape(-1)
+        return cls(table, bits, source="ranges")
+
+    def bins_of(self, pixels) -> np.ndarray:
+        """Table index of each BGR pixel in an (N, 3) array."""
+        q = np.asarray(pixels, dtype=np.int64).reshape(-1, 3) >> (8 - self.bits)
+        n = self.levels
+        return q[:, 0] * n * n + q[:, 1] * n + q[:, 2]
+
+    def calibrate(self, coconut, background=(), spread: int = 1, extend: bool = False) -> "ColorLut":
+        """
+        A new table from sample pixels (BGR triples).
+
+        A bin is coconut if more coconut than background samples fell in it.
+        Coconut bins are grown by `spread` bins in every direction (a few
+        samples then cover the shades in between) but never into a bin that
+        has background samples. extend=True keeps this table's coconut bins
+        and adds the new ones; background samples still clear their bins.
+        """
+        n = self.levels
+        size = n ** 3
+        fg = np.bincount(self.bins_of(coconut), minlength=size) if len(coconut) else np.zeros(size, np.int64)
+        bg = np.bincount(self.bins_of(background), minlength=size) if len(background) else np.zeros(size, np.int64)
+        hit = fg > bg
+        if spread > 0 and hit.any():
+            from scipy import ndimage  # only for recalibration, not worth its import time at startup
+            grown = ndimage.binary_dilation(hit.reshape(n, n, n), iterations=spread).reshape(-1)
+            hit |= grown & (bg == 0)
+        if extend:
+            hit |= (self.table > 0) & (bg <= fg)
+        return ColorLut(hit.astype(np.uint8), self.bits, source="samples")
+
+    # ─── hot path ────────────────────────────────────────────────
+    def mask(self, frame: np.ndarray) -> np.ndarray:
+        """uint8 mask (0/255) of the frame's coconut-coloured pixels."""
+        q = cv2.bitwise_and(frame, (self._keep, self._keep, self._keep, 0))
+        index = cv2.transform(q.astype(np.float32), self._index)
+        return self.table[index.astype(np.intp)]
+
+    # ─── persistence ─────────────────────────────────────────────
+    def describe(self) -> dict:
+        return {"source": self.source, "bits": self.bits, "levels": self.levels,
+                "coverage": round(float(np.count_nonzero(self.table)) / self.table.size, 4),
+                "updated_at": self.updated_at}
+
+    def to_bytes(self) -> bytes:
+        buf = io.BytesIO()
+        meta = json.dumps({"bits": self.bits, "source": self.source, "updated_at": self.updated_at})
+        np.savez_compressed(buf, table=np.packbits(self.table > 0), meta=np.array(meta))
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ColorLut":
+        with np.load(io.BytesIO(data)) as f:
+            meta = json.loads(str(f["meta"]))
+            bits = int(meta["bits"])
+            table = np.unpackbits(f["table"])[: (1 << bits) ** 3]
+        return cls(table, bits, source=meta.get("source", "samples"), updated_at=meta.get("updated_at"))
+
+
+def load_color_lut(path: Path = COLOR_LUT_FILE):
+    """The calibrated table on disk, or None if there is none (or it is unreadable)."""
+    try:
+        if path.exists():
+            return ColorLut.from_bytes(path.read_bytes())
+    except Exception as e:
+        print("Error loading color_lut.npz:", e)
+    return None
+
+
+def save_color_lut(lut: ColorLut, path: Path = COLOR_LUT_FILE):
+    atomic_write_bytes(path, lut.to_bytes())
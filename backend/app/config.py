@@ -10,6 +10,14 @@ START_BUTTON_PIN = 22 #16
 STOP_BUTTON_PIN  = 16 #12 
 CONVEYOR_RELAY_PIN = 23 #was 25
 BUZZER_PIN = 24 # Relay 3
+# "lgpio": the Pi's chip; the server does not start if it cannot be opened
+# (counting with a relay that never opens would overfill every bucket).
+# "sim": an in-memory chip, only for development off the Pi and tests
+GPIO_BACKEND = os.getenv("GPIO_BACKEND", "lgpio")
+GPIO_CHIP = int(os.getenv("GPIO_CHIP", 0))
+GPIO_DEBOUNCE_MS = float(os.getenv("GPIO_DEBOUNCE_MS", 10))
+# SCHED_FIFO priority of the relay thread (needs CAP_SYS_NICE, else nice -10)
+GPIO_RELAY_PRIORITY = int(os.getenv("GPIO_RELAY_PRIORITY", 50))
 
 # ─── SMTP configuration ─────────────────────────────────────────────
 # Data is pulled from a .env file in the same directory as this script.
@@ -18,4 +26,143 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 EMAIL_FROM    = os.getenv("EMAIL_FROM")
-EMAIL_TO      = os.getenv("EMAIL_TO")
\ No newline at end of file
+EMAIL_TO      = os.getenv("EMAIL_TO")
+# "auto": implicit SSL on 465, STARTTLS otherwise; "ssl"; "starttls"; "none"
+# (plain SMTP, e.g. a local relay or a stand-in test server). No SMTP_USER = no login.
+SMTP_SECURITY = os.getenv("SMTP_SECURITY", "auto")
+# reports saved within this many seconds of the first unsent one go out as one email
+MAIL_BATCH_WINDOW = float(os.getenv("MAIL_BATCH_WINDOW", 30))
+# failed sends are retried after MAIL_RETRY_MIN seconds, doubling up to MAIL_RETRY_MAX
+MAIL_RETRY_MIN = float(os.getenv("MAIL_RETRY_MIN", 30))
+MAIL_RETRY_MAX = float(os.getenv("MAIL_RETRY_MAX", 1800))
+# keep the SMTP session open this long after a send (no handshake + login per email)
+MAIL_SESSION_IDLE = float(os.getenv("MAIL_SESSION_IDLE", 60))
+# attachments (the new report rows) larger than this are sent gzipped
+MAIL_COMPRESS_OVER = int(os.getenv("MAIL_COMPRESS_OVER", 256 * 1024))
+
+# ─── Detector selection ─────────────────────────────────────────────
+# hsv_watershed (default, accurate on touching nuts), pyramid (same, coarse
+# candidates then watershed only inside them), yolo_onnx (trained model, needs
+# onnxruntime + an exported .onnx) or mog2 (cheapest).
+DETECTOR = os.getenv("DETECTOR", "hsv_watershed")
+YOLO_ONNX_PATH = os.getenv("YOLO_ONNX_PATH", "../runs/detect/train2/weights/best.onnx")
+YOLO_CONF = float(os.getenv("YOLO_CONF", 0.3))
+
+# sizes on the belt; converted to pixels with the camera calibration below,
+# so they survive a camera move or a different processing resolution
+DETECTOR_PX_PER_CM = float(os.getenv("DETECTOR_PX_PER_CM", 3.0))        # in the 320x240 processed frame
+COCONUT_MIN_DIAMETER_CM = float(os.getenv("COCONUT_MIN_DIAMETER_CM", 10.0))
+COCONUT_MIN_SEPARATION_CM = float(os.getenv("COCONUT_MIN_SEPARATION_CM", 4.0))  # between two nut centres
+# explicit pixel overrides (processed frame), e.g. the old DETECTOR_MIN_AREA=700
+_min_area = os.getenv("DETECTOR_MIN_AREA")
+DETECTOR_MIN_AREA = float(_min_area) if _min_area else None
+_min_distance = os.getenv("DETECTOR_MIN_DISTANCE")
+DETECTOR_MIN_DISTANCE = int(_min_distance) if _min_distance else None
+# colour classification: one lookup table gather per pixel instead of HSV
+# conversion + three range tests. The table starts from the HSV ranges in
+# app/detection.py and can be recalibrated from sample pixels
+# (POST /calibration/color, saved to app/color_lut.npz).
+COLOR_LUT = os.getenv("COLOR_LUT", "1") == "1"
+COLOR_LUT_BITS = int(os.getenv("COLOR_LUT_BITS", 6))  # per channel: 6 -> 64³ bins
+# pyramid detector: size of the candidate search image relative to the processed frame
+PYRAMID_COARSE_SCALE = float(os.getenv("PYRAMID_COARSE_SCALE", 0.5))
+
+# ─── Camera ─────────────────────────────────────────────────────────
+# webcam index (e.g. "0") or a video file path such as ../videos/250_coconuts.mp4
+_camera_source = os.getenv("CAMERA_SOURCE", "0")
+CAMERA_SOURCE = int(_camera_source) if _camera_source.isdigit() else _camera_source
+
+# ─── Client state sync ──────────────────────────────────────────────
+# max bucket delta messages per second sent to each client
+BUCKETS_SYNC_HZ = float(os.getenv("BUCKETS_SYNC_HZ", 5))
+
+# ─── Preview stream ─────────────────────────────────────────────────
+# adaptive: each client's JPEG quality, size and frame rate follow its link.
+# Off: every frame at PREVIEW_QUALITY, full size.
+PREVIEW_ADAPTIVE = os.getenv("PREVIEW_ADAPTIVE", "1") == "1"
+PREVIEW_QUALITY = int(os.getenv("PREVIEW_QUALITY", 50))
+# global preview cap: counting runs on every frame, previews are cut to this
+# many per second before any drawing or encoding (0 = no cap)
+PREVIEW_FPS = float(os.getenv("PREVIEW_FPS", 0))
+# "annotated": boxes drawn into the JPEG (any client). "vector": the JPEG is
+# sent untouched and the boxes follow as an "overlay" message the client
+# draws. A client can also pick with /ws?preview=vector.
+PREVIEW_MODE = os.getenv("PREVIEW_MODE", "annotated")
+# vector clients get the camera's own MJPEG bytes, no decode/draw/re-encode
+# (MJPG cameras only; otherwise one shared un-annotated encode)
+PREVIEW_PASSTHROUGH = os.getenv("PREVIEW_PASSTHROUGH", "1") == "1"
+# keep counting with no client connected (unattended shifts); frames are
+# then never drawn or encoded
+COUNT_HEADLESS = os.getenv("COUNT_HEADLESS", "0") == "1"
+
+# ─── Counting lines ─────────────────────────────────────────────────
+# several conveyors on one box: a JSON list of lines (see models.LineConfig),
+# each with its own camera, detector, buckets and relay. Without the file
+# there is one line built from the settings above.
+LINES_FILE = os.getenv("LINES_FILE", os.path.join(os.path.dirname(__file__), "lines.json"))
+# run each line's capture/detect/track in its own process:
+# "auto" = only when more than one line is configured, "1" = always, "0" = never
+LINE_PROCESSES = os.getenv("LINE_PROCESSES", "auto")
+
+# ─── Motion gate ────────────────────────────────────────────────────
+# skip detection on frames where nothing moved in the counting band (belt
+# gaps, conveyor stopped); tracks are held until something moves again
+MOTION_GATE = os.getenv("MOTION_GATE", "1") == "1"
+MOTION_THRESHOLD = int(os.getenv("MOTION_THRESHOLD", 12))           # grey levels
+MOTION_MIN_CHANGED = float(os.getenv("MOTION_MIN_CHANGED", 0.002))  # fraction of pixels
+MOTION_MAX_SKIP = int(os.getenv("MOTION_MAX_SKIP", 30))             # frames, then detect anyway
+
+# ─── Counting ───────────────────────────────────────────────────────
+# a nut counts when its track crosses the trigger line in this direction:
+# "up" (towards the top of the frame), "down" or "both"
+COUNT_DIRECTION = os.getenv("COUNT_DIRECTION", "up")
+if COUNT_DIRECTION not in ("up", "down", "both"):
+    raise ValueError(f"COUNT_DIRECTION must be 'up', 'down' or 'both', not {COUNT_DIRECTION!r}")
+# pixels a box centre must be past the line before its side changes
+COUNT_HYSTERESIS = float(os.getenv("COUNT_HYSTERESIS", 4))
+# forget a track id this many tracker updates after it was last seen
+COUNT_FORGET_AFTER = int(os.getenv("COUNT_FORGET_AFTER", 10))
+
+# ─── Conveyor stop ──────────────────────────────────────────────────
+# "threshold": stop once a bucket's count reaches its set value (the nuts
+# still on the way land as overfill); "predictive": stop as soon as the count
+# plus the nuts the tracker sees arriving within the stopping time reaches it
+STOP_MODE = os.getenv("STOP_MODE", "threshold")
+if STOP_MODE not in ("threshold", "predictive"):
+    raise ValueError(f"STOP_MODE must be 'threshold' or 'predictive', not {STOP_MODE!r}")
+# seconds the belt keeps delivering after the relay opens (motor run-on plus
+# camera-to-decision delay); the measured relay latency is added to it.
+# Tune from /history/stops (predicted vs actual overfill); too long stops
+# early and leaves buckets short, so err on the short side
+STOP_COAST_S = float(os.getenv("STOP_COAST_S", 0.25))
+# actual overfill is read this long after the stop
+STOP_SETTLE_S = float(os.getenv("STOP_SETTLE_S", 2.0))
+
+# ─── Camera capture ─────────────────────────────────────────────────
+# requested from the camera (V4L2); what it actually delivers is logged on
+# open. Asking for the processing size spares a resize per frame.
+CAMERA_WIDTH = int(os.getenv("CAMERA_WIDTH", 320))
+CAMERA_HEIGHT = int(os.getenv("CAMERA_HEIGHT", 240))
+CAMERA_FPS = float(os.getenv("CAMERA_FPS", 30))
+CAMERA_FOURCC = os.getenv("CAMERA_FOURCC", "MJPG")  # "" = camera default
+CAMERA_BUFFER_SIZE = int(os.getenv("CAMERA_BUFFER_SIZE", 1))
+# grab continuously, decode only the newest frame (no stale frames between a
+# bucket filling and the relay opening)
+CAMERA_LATEST_ONLY = os.getenv("CAMERA_LATEST_ONLY", "1") == "1"
+# replay CAMERA_SOURCE video file forever in real time, as a camera stand-in
+CAMERA_LOOP = os.getenv("CAMERA_LOOP", "0") == "1"
+
+# ─── Count history ──────────────────────────────────────────────────
+# SQLite (WAL) store of reports, bucket fills and per-minute throughput
+HISTORY_DB = os.getenv("HISTORY_DB", os.path.join(os.path.dirname(__file__), "history.db"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", 1.0))  # seconds between batched writes
+# local start times of the shifts, for shift summaries
+SHIFT_STARTS = [t.strip() for t in os.getenv("SHIFT_STARTS", "06:00,14:00,22:00").split(",") if t.strip()]
+
+# ─── USB export ─────────────────────────────────────────────────────
+# /export_report streams history from the database onto the stick; these
+# are the defaults when the request does not say
+EXPORT_GZIP = os.getenv("EXPORT_GZIP", "0") == "1"                     # write .csv.gz
+EXPORT_FSYNC_BYTES = int(os.getenv("EXPORT_FSYNC_BYTES", 4 * 1024 * 1024))  # fsync every N bytes written
+# read the file back from the stick (page cache dropped) and compare checksums
+EXPORT_VERIFY = os.getenv("EXPORT_VERIFY", "1") == "1"
@@ -0,0 +1,245 @@
+# app/counting.py
+import cv2
+import numpy as np
+
+TRIGGER = "trigger"  # id of the line that feeds the buckets (the ROI's trigger line)
+
+# crossing direction, for a line drawn left to right: "up" = towards smaller y.
+# In general "down" is towards the right-hand side of p1 -> p2 on screen.
+DIRECTIONS = {"down": 1, "up": -1, "both": 0}
+
+
+def _direction(value) -> int:
+    if value in DIRECTIONS:
+        return DIRECTIONS[value]
+    if value in (1, -1, 0):
+        return int(value)
+    raise ValueError(f"direction must be one of {tuple(DIRECTIONS)}")
+
+
+class CountLine:
+    """
+    A counting line segment p1 -> p2 in processed-frame pixels.
+
+    signed_distance() is positive on the right-hand side of p1 -> p2 (below a
+    left-to-right line) and negative on the other side. A crossing in
+    `direction` goes from the negative to the positive side (+1, "down"), the
+    other way (-1, "up") or either way (0, "both").
+    """
+
+    kind = "line"
+
+    def __init__(self, p1, p2, direction=-1, region_id: str = TRIGGER):
+        self.id = region_id
+        self.p1 = np.asarray(p1, dtype=np.float64)
+        self.p2 = np.asarray(p2, dtype=np.float64)
+        d = self.p2 - self.p1
+        length = float(np.hypot(*d))
+        if length == 0:
+            raise ValueError(f"counting line {region_id!r} has zero length")
+        self._normal = np.array([-d[1], d[0]]) / length
+        self.direction = _direction(direction)
+
+    @classmethod
+    def horizontal(cls, y: int, width: int = 320, direction=-1, region_id: str = TRIGGER) -> "CountLine":
+        return cls((0, y), (width, y), direction, region_id)
+
+    def signed_distance(self, points: np.ndarray) -> np.ndarray:
+        """(N,) pixels from the line for (N, 2) points. The segment is treated as an infinite line."""
+        return (points - self.p1) @ self._normal
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "line": [self.p1.tolist(), self.p2.tolist()], "direction": self.direction}
+
+
+class CountZone:
+    """
+    A polygon zone. Positive inside, negative outside; a crossing is a track
+    entering the zone. `occupancy` after each update is the number of tracks
+    currently inside.
+    """
+
+    kind = "zone"
+    direction = 1
+
+    def __init__(self, polygon, region_id: str):
+        if len(polygon) < 3:
+            raise ValueError(f"zone {region_id!r} needs at least 3 points")
+        self.id = region_id
+        self.polygon = np.asarray(polygon, dtype=np.float32).reshape(-1, 1, 2)
+
+    def signed_distance(self, points: np.ndarray) -> np.ndarray:
+        return np.array([cv2.pointPolygonTest(self.polygon, (float(x), float(y)), True) for x, y in points])
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "zone": self.polygon.reshape(-1, 2).tolist()}
+
+
+def region_from_dict(data: dict):
+    """{"id", "line": [[x,y],[x,y]], "direction"} or {"id", "zone": [[x,y], ...]}, as in lines.json."""
+    region_id = data.get("id")
+    if not region_id or region_id == TRIGGER:
+        raise ValueError(f"count region needs an id other than {TRIGGER!r}")
+    if "line" in data:
+        p1, p2 = data["line"]
+        return CountLine(p1, p2, data.get("direction", "both"), region_id)
+    if "zone" in data:
+        return CountZone(data["zone"], region_id)
+    raise ValueError(f"count region {region_id!r} needs a 'line' or a 'zone'")
+
+
+class LineCounter:
+    """
+    Directional line/zone crossing counter over tracker output.
+
+    For every track id and region it keeps the last side the box centre was
+    decisively on: further than `hysteresis` pixels from the line (or zone
+    edge). Centres inside that band keep the previous side, so a nut jostling
+    on the line cannot flip back and forth. A track counts once per region,
+    when it moves from one side to the other in the region's direction.
+
+    A track first seen already past a line never counts for it: that is how
+    a coconut SORT re-identifies after the crossing, or one that was only
+    picked up beyond the line, would otherwise be counted twice.
+
+    Ids not seen for `forget_after` updates are dropped, so the state is the
+    live tracks plus a few recently lost ones, however long the shift.
+    """
+
+    def __init__(self, regions, hysteresis: float = 4.0, forget_after: int = 10):
+        self.hysteresis = hysteresis
+        self.forget_after = forget_after
+        self.regions = []
+        self.counts = {}
+        self.occupancy = {}
+        self._tracks = {}  # id -> [last seen update, sides (int8 per region), counted (bool per region)]
+        self._updates = 0
+        for region in regions:
+            self.add(region)
+
+    @property
+    def tracked_ids(self) -> int:
+        return len(self._tracks)
+
+    def add(self, region):
+        if region.id in self.counts:
+            raise ValueError(f"duplicate count region id {region.id!r}")
+        self.regions.append(region)
+        self.counts[region.id] = 0
+        self.occupancy[region.id] = 0
+        # existing tracks know nothing about the new region yet
+        for state in self._tracks.values():
+            state[1] = np.append(state[1], np.int8(0))
+            state[2] = np.append(state[2], False)
+
+    def replace(self, region):
+        """Swap in a region with the same id (e.g. the trigger line moved). Its count is kept, sides are relearnt."""
+        k = next(i for i, r in enumerate(self.regions) if r.id == region.id)
+        self.regions[k] = region
+        for state in self._tracks.values():
+            state[1][k] = 0
+
+    def reset(self):
+        self._tracks.clear()
+        self._updates = 0
+        for region_id in self.counts:
+            self.counts[region_id] = 0
+            self.occupancy[region_id] = 0
+
+    def update(self, tracked: np.ndarray) -> dict:
+        """
+        tracked: SORT output (M, 5) [x1, y1, x2, y2, id]. Call on every
+        tracker update. Returns the new crossings per region id.
+        """
+        self._updates += 1
+        now = self._updates
+        new = dict.fromkeys(self.counts, 0)
+        if len(tracked):
+            centres = (tracked[:, :2] + tracked[:, 2:4]) / 2.0
+            h = self.hysteresis
+            # (regions, M) side of each centre: +1 / -1, 0 inside the hysteresis band
+            sides = np.zeros((len(self.regions), len(tracked)), dtype=np.int8)
+            for k, region in enumerate(self.regions):
+                d = region.signed_distance(centres)
+                sides[k, d > h] = 1
+                sides[k, d < -h] = -1
+                if region.kind == "zone":
+                    self.occupancy[region.id] = int(np.count_nonzero(d >= 0))
+            n = len(self.regions)
+            for i, track_id in enumerate(tracked[:, 4].astype(np.int64).tolist()):
+                state = self._tracks.get(track_id)
+                if state is None:
+                    state = self._tracks[track_id] = [now, np.zeros(n, np.int8), np.zeros(n, bool)]
+                state[0] = now
+                prev, counted = state[1], state[2]
+                for k, region in enumerate(self.regions):
+                    side = sides[k, i]
+                    if side == 0 or side == prev[k]:
+                        continue
+                    if prev[k] != 0 and not counted[k] and (region.direction == 0 or side == region.direction):
+                        counted[k] = True
+                        new[region.id] += 1
+                    prev[k] = side
+        else:
+            for region in self.regions:
+                if region.kind == "zone":
+                    self.occupancy[region.id] = 0
+        if len(self._tracks) > len(tracked):
+            self._tracks = {i: s for i, s in self._tracks.items() if now - s[0] <= self.forget_after}
+        for region_id, c in new.items():
+            self.counts[region_id] += c
+        return new
+
+    def arrivals(self, tracked: np.ndarray, velocities: np.ndarray, region_id: str = TRIGGER) -> np.ndarray:
+        """
+        Tracker updates until each track not yet counted for a line region
+        would count, moving at its velocity: sorted (K,) ETAs. Call after
+        update() with the same rows; velocities are the tracks' (M, 2)
+        [vx, vy] per update (SORT's Kalman state), aligned with them.
+
+        A track the filter has no speed for yet (just spawned) moves at the
+        belt's: the median speed of the tracks heading across the line.
+        """
+        k = next(i for i, r in enumerate(self.regions) if r.id == region_id)
+        region = self.regions[k]
+        if region.kind != "line" or not len(tracked):
+            return np.empty(0)
+        centres = (tracked[:, :2] + tracked[:, 2:4]) / 2.0
+        d = region.signed_distance(centres)
+        rate = region.signed_distance(centres + velocities) - d  # pixels per update along the normal
+        target = np.sign(rate) if region.direction == 0 else np.full(len(d), region.direction)
+        waiting = np.zeros(len(d), dtype=bool)
+        for i, track_id in enumerate(tracked[:, 4].astype(np.int64).tolist()):
+            state = self._tracks.get(track_id)
+            waiting[i] = (state is not None and not state[2][k] and target[i] != 0
+                          and state[1][k] == -target[i])
+        if not waiting.any():
+            return np.empty(0)
+        speed = rate * target
+        moving = speed[waiting & (speed > 0)]
+        if region.direction != 0 and len(moving):
+            belt = float(np.median(moving))
+            speed = np.where(speed < 0.5 * belt, belt, speed)
+        ahead = waiting & (speed > 0)
+        # distance to go: to the far edge of the hysteresis band
+        return np.sort((self.hysteresis - d[ahead] * target[ahead]) / speed[ahead])
+
+    def describe(self) -> dict:
+        return {
+            "hysteresis": self.hysteresis,
+            "tracked_ids": len(self._tracks),
+            "regions": [{**r.to_dict(), "count": self.counts[r.id],
+                         **({"occupancy": self.occupancy[r.id]} if r.kind == "zone" else {})}
+                        for r in self.regions],
+        }
+
+
+def counter_from_config(trigger_line_y: int, line=None, width: int = 320) -> LineCounter:
+    """The ROI's trigger line plus a line's extra count regions (lines.json), directions from config."""
+    from app import config
+    direction = line.count_direction if line is not None else config.COUNT_DIRECTION
+    counter = LineCounter([CountLine.horizontal(trigger_line_y, width, direction)],
+                          hysteresis=config.COUNT_HYSTERESIS, forget_after=config.COUNT_FORGET_AFTER)
+    for data in (line.count_regions if line is not None else ()):
+        counter.add(region_from_dict(data))
+    return counter
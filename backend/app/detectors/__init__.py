@@ -0,0 +1,27 @@
+# app/detectors/__init__.py
+from app.detectors.base import Detector, empty_detections
+
+DETECTORS = ("hsv_watershed", "pyramid", "yolo_onnx", "mog2")
+
+
+def create_detector(name: str, **kwargs) -> Detector:
+    """
+    Build a detector by name. Backends are imported here so a line that never
+    uses YOLO does not need onnxruntime installed.
+    """
+    if name == "hsv_watershed":
+        from app.detectors.hsv_watershed import HsvWatershedDetector
+        return HsvWatershedDetector(**kwargs)
+    if name == "pyramid":
+        from app.detectors.pyramid import PyramidWatershedDetector
+        return PyramidWatershedDetector(**kwargs)
+    if name == "yolo_onnx":
+        from app.detectors.yolo_onnx import YoloOnnxDetector
+        return YoloOnnxDetector(**kwargs)
+    if name == "mog2":
+        from app.detectors.background_subtraction import BackgroundSubtractionDetector
+        return BackgroundSubtractionDetector(**kwargs)
+    raise ValueError(f"Unknown detector '{name}', expected one of {DETECTORS}")
+
+
+__all__ = ["Detector", "DETECTORS", "create_detector", "empty_detections"]
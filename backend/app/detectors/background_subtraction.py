@@ -0,0 +1,47 @@
+# app/detectors/background_subtraction.py
+import cv2
+import numpy as np
+
+from app.detectors.base import empty_detections
+
+
+class BackgroundSubtractionDetector:
+    """
+    MOG2 foreground segmentation + connected components.
+    Very cheap, but touching coconuts merge into one blob and a stopped belt
+    slowly fades into the background model.
+    """
+
+    name = "mog2"
+
+    def __init__(self, min_area: float = 700, history: int = 300, var_threshold: float = 25):
+        self.min_area = min_area
+        self.history = history
+        self.var_threshold = var_threshold
+        self._kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        self.reset()
+
+    def reset(self):
+        self._subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=self.history, varThreshold=self.var_threshold, detectShadows=True
+        )
+
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        fg = self._subtractor.apply(frame)
+        # shadows are marked 127, keep only confident foreground
+        _, fg = cv2.threshold(fg, 200, 255, cv2.THRESH_BINARY)
+        fg = cv2.morphologyEx(fg, cv2.MORPH_OPEN, self._kernel)
+
+        n, _, stats, _ = cv2.connectedComponentsWithStats(fg, connectivity=8)
+        stats = stats[1:]  # drop background component
+        stats = stats[stats[:, cv2.CC_STAT_AREA] >= self.min_area]
+        if len(stats) == 0:
+            return empty_detections()
+
+        detections = np.empty((len(stats), 5), dtype=np.float32)
+        detections[:, 0] = stats[:, cv2.CC_STAT_LEFT]
+        detections[:, 1] = stats[:, cv2.CC_STAT_TOP]
+        detections[:, 2] = stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH]
+        detections[:, 3] = stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT]
+        detections[:, 4] = 1.0
+        return detections
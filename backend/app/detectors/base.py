@@ -0,0 +1,28 @@
+# app/detectors/base.py
+from typing import Protocol, runtime_checkable
+
+import numpy as np
+
+
+def empty_detections() -> np.ndarray:
+    """The (0, 5) array SORT expects when nothing was found."""
+    return np.empty((0, 5), dtype=np.float32)
+
+
+@runtime_checkable
+class Detector(Protocol):
+    """
+    A coconut detector.
+    detect() takes a BGR frame and returns a float32 array (N, 5) of
+    [x1, y1, x2, y2, score] in that frame's pixel coordinates.
+    Detectors may also expose `last_circles` (list of ((x, y), r)) for drawing.
+    """
+
+    name: str
+
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        ...
+
+    def reset(self) -> None:
+        """Forget any state carried between frames (e.g. a background model)."""
+        ...
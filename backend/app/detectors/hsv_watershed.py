@@ -0,0 +1,52 @@
+# app/detectors/hsv_watershed.py
+import cv2
+import numpy as np
+
+from app.detection import coconut_mask, extract_label_blobs
+
+
+class HsvWatershedDetector:
+    """
+    Colour threshold + distance-transform watershed (the original detector).
+    Accurate on touching nuts, but the most expensive per frame.
+    """
+
+    name = "hsv_watershed"
+
+    def __init__(self, min_area: float = 700, min_distance: int = 12):
+        self.min_area = min_area
+        self.min_distance = min_distance
+        self.last_circles = []
+        self.timer = None  # optional app.timing.LapTimer for per-stage profiling
+
+    def reset(self):
+        self.last_circles = []
+
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        # scipy/skimage are slow to import: loaded with the first frame, not at startup
+        from scipy import ndimage
+        from skimage.feature import peak_local_max
+        from skimage.segmentation import watershed
+
+        timer = self.timer
+        # brown, light and dark/wet coconut colours
+        final_mask = coconut_mask(frame)
+        eroded_mask = cv2.erode(final_mask, None, iterations=3)
+        if timer: timer.lap("hsv_masks")
+
+        D = ndimage.distance_transform_edt(eroded_mask)
+        if timer: timer.lap("distance_transform")
+        localMax = peak_local_max(D, min_distance=self.min_distance, labels=eroded_mask) # was 20
+
+        marker_mask = np.zeros(D.shape, dtype=bool)
+        if localMax.shape[0] > 0:
+            marker_mask[tuple(localMax.T)] = True
+
+        markers, _ = ndimage.label(marker_mask)
+        labels = watershed(-D, markers, mask=eroded_mask) 
+        if timer: timer.lap("watershed")
+
+        # boxes, areas and enclosing circles for all labels in one pass
+        detections, self.last_circles = extract_label_blobs(labels, min_area=self.min_area)
+        if timer: timer.lap("contours")
+        return detections
@@ -0,0 +1,109 @@
+# app/detectors/pyramid.py
+import cv2
+import numpy as np
+
+from app.detection import coconut_mask, extract_label_blobs
+from app.detectors.base import empty_detections
+
+
+class PyramidWatershedDetector:
+    """
+    Coarse-to-fine version of the HSV watershed.
+
+    The colour mask is first computed on a downscaled copy of the frame
+    (`coarse_scale`, 0.5 turns 320x240 into 160x120) and split into connected
+    candidate blobs. Only inside each candidate's box, back at the detection
+    resolution, is the mask rebuilt and the distance transform + watershed run
+    to refine the box and split touching nuts. Empty belt is paid for at a
+    quarter of the pixels, and each watershed works on a small crop.
+
+    Sizes are given for the detection resolution (see config: they come from
+    the calibration in cm) and scaled to the coarse level here.
+    """
+
+    name = "pyramid"
+
+    def __init__(self, min_area: float = 700, min_distance: int = 12, coarse_scale: float = 0.5,
+                 erode_iterations: int = 3):
+        self.min_area = min_area
+        self.min_distance = min_distance
+        self.coarse_scale = coarse_scale
+        self.erode_iterations = erode_iterations
+        self.last_circles = []
+        self.timer = None  # optional app.timing.LapTimer for per-stage profiling
+
+    @property
+    def _coarse_erosion(self) -> int:
+        return max(1, round(self.erode_iterations * self.coarse_scale))
+
+    def reset(self):
+        self.last_circles = []
+
+    def _candidates(self, frame: np.ndarray):
+        """Connected blobs of the coarse mask: (label image, stats) at the coarse level."""
+        s = self.coarse_scale
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (max(1, int(w * s)), max(1, int(h * s))), interpolation=cv2.INTER_AREA)
+        mask = coconut_mask(small)
+        mask = cv2.erode(mask, None, iterations=self._coarse_erosion)
+        n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        # generous: erosion at the coarse level eats proportionally more of a blob
+        keep = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] >= 0.5 * self.min_area * s * s) + 1
+        return labels, stats, keep
+
+    def _refine(self, crop: np.ndarray, region: np.ndarray):
+        """Watershed one candidate crop; region masks out pixels of other candidates."""
+        # scipy/skimage are slow to import: loaded with the first frame, not at startup
+        from scipy import ndimage
+        from skimage.feature import peak_local_max
+        from skimage.segmentation import watershed
+
+        mask = cv2.bitwise_and(coconut_mask(crop), region)
+        mask = cv2.erode(mask, None, iterations=self.erode_iterations)
+        D = ndimage.distance_transform_edt(mask)
+        peaks = peak_local_max(D, min_distance=self.min_distance, labels=mask)
+        marker_mask = np.zeros(D.shape, dtype=bool)
+        if peaks.shape[0] > 0:
+            marker_mask[tuple(peaks.T)] = True
+        markers, _ = ndimage.label(marker_mask)
+        labels = watershed(-D, markers, mask=mask)
+        return extract_label_blobs(labels, min_area=self.min_area)
+
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        timer = self.timer
+        labels, stats, keep = self._candidates(frame)
+        if timer: timer.lap("coarse_candidates")
+        if len(keep) == 0:
+            self.last_circles = []
+            return empty_detections()
+
+        h, w = frame.shape[:2]
+        inv = 1.0 / self.coarse_scale
+        pad = int(self.min_distance)  # context around the candidate for the distance transform
+        grow = int(round(self._coarse_erosion * inv)) + 1  # undo the coarse erosion
+        all_dets, all_circles = [], []
+        for label in keep:
+            cx, cy, cw, ch = stats[label, :4]
+            x1 = max(0, int(cx * inv) - pad)
+            y1 = max(0, int(cy * inv) - pad)
+            x2 = min(w, int((cx + cw) * inv) + pad)
+            y2 = min(h, int((cy + ch) * inv) + pad)
+            # this candidate's own coarse pixels, upscaled and grown by the
+            # coarse erosion, so a neighbour sticking into the box is not found twice
+            coarse_region = (labels[cy:cy + ch, cx:cx + cw] == label).astype(np.uint8) * 255
+            region = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            rx, ry = int(cx * inv) - x1, int(cy * inv) - y1
+            up = cv2.resize(coarse_region, (int(cw * inv), int(ch * inv)), interpolation=cv2.INTER_NEAREST)
+            up = up[:region.shape[0] - ry, :region.shape[1] - rx]
+            region[ry:ry + up.shape[0], rx:rx + up.shape[1]] = up
+            region = cv2.dilate(region, None, iterations=grow)
+
+            dets, circles = self._refine(frame[y1:y2, x1:x2], region)
+            if len(dets):
+                dets[:, [0, 2]] += x1
+                dets[:, [1, 3]] += y1
+                all_dets.append(dets)
+                all_circles.extend(((x + x1, y + y1), r) for (x, y), r in circles)
+        if timer: timer.lap("refine")
+        self.last_circles = all_circles
+        return np.concatenate(all_dets) if all_dets else empty_detections()
@@ -0,0 +1,100 @@
+# app/detectors/yolo_onnx.py
+"""
+YOLOv8 detector running on ONNX Runtime (CPU), no torch/ultralytics at runtime.
+
+Export the trained weights once on a dev machine (needs ultralytics):
+    python -m app.detectors.yolo_onnx ../runs/detect/train2/weights/best.pt --imgsz 320
+"""
+import argparse
+
+import cv2
+import numpy as np
+
+from app.detectors.base import empty_detections
+
+
+class YoloOnnxDetector:
+    """
+    Trained YOLOv8s exported to ONNX. Best accuracy, highest cost on a Pi;
+    use a small --imgsz export (e.g. 320) to trade accuracy for FPS.
+    """
+
+    name = "yolo_onnx"
+
+    def __init__(self, model_path: str, conf_threshold: float = 0.3, iou_threshold: float = 0.45, threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("yolo_onnx detector needs onnxruntime (pip install onnxruntime)") from e
+
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        # static export: [1, 3, H, W]
+        self.input_h, self.input_w = int(inp.shape[2]), int(inp.shape[3])
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+
+    def reset(self):
+        pass
+
+    def _letterbox(self, frame: np.ndarray):
+        """Resize keeping aspect ratio and pad to the model input size."""
+        h, w = frame.shape[:2]
+        scale = min(self.input_w / w, self.input_h / h)
+        nw, nh = int(round(w * scale)), int(round(h * scale))
+        pad_x = (self.input_w - nw) // 2
+        pad_y = (self.input_h - nh) // 2
+        canvas = np.full((self.input_h, self.input_w, 3), 114, dtype=np.uint8)
+        canvas[pad_y:pad_y + nh, pad_x:pad_x + nw] = cv2.resize(frame, (nw, nh))
+        blob = cv2.dnn.blobFromImage(canvas, 1 / 255.0, swapRB=True)
+        return blob, scale, pad_x, pad_y
+
+    def detect(self, frame: np.ndarray) -> np.ndarray:
+        blob, scale, pad_x, pad_y = self._letterbox(frame)
+        out = self.session.run(None, {self.input_name: blob})[0]  # (1, 4 + classes, anchors)
+        preds = out[0].T
+        scores = preds[:, 4:].max(axis=1)
+        keep = scores >= self.conf_threshold
+        if not keep.any():
+            return empty_detections()
+        preds, scores = preds[keep], scores[keep]
+
+        # cx, cy, w, h in letterboxed pixels -> x, y, w, h in frame pixels
+        boxes = np.empty((len(preds), 4), dtype=np.float32)
+        boxes[:, 0] = (preds[:, 0] - preds[:, 2] / 2 - pad_x) / scale
+        boxes[:, 1] = (preds[:, 1] - preds[:, 3] / 2 - pad_y) / scale
+        boxes[:, 2] = preds[:, 2] / scale
+        boxes[:, 3] = preds[:, 3] / scale
+
+        idx = cv2.dnn.NMSBoxes(boxes.tolist(), scores.tolist(), self.conf_threshold, self.iou_threshold)
+        idx = np.asarray(idx, dtype=int).reshape(-1)
+        if len(idx) == 0:
+            return empty_detections()
+
+        h, w = frame.shape[:2]
+        detections = np.empty((len(idx), 5), dtype=np.float32)
+        detections[:, 0] = np.clip(boxes[idx, 0], 0, w)
+        detections[:, 1] = np.clip(boxes[idx, 1], 0, h)
+        detections[:, 2] = np.clip(boxes[idx, 0] + boxes[idx, 2], 0, w)
+        detections[:, 3] = np.clip(boxes[idx, 1] + boxes[idx, 3], 0, h)
+        detections[:, 4] = scores[idx]
+        return detections
+
+
+def export_onnx(weights: str, imgsz: int = 320) -> str:
+    """Export ultralytics .pt weights to a static ONNX graph, returns the .onnx path."""
+    from ultralytics import YOLO
+
+    return YOLO(weights).export(format="onnx", imgsz=imgsz, opset=12, simplify=True, dynamic=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export trained YOLO weights for the yolo_onnx detector")
+    parser.add_argument("weights", help="path to best.pt, e.g. ../runs/detect/train2/weights/best.pt")
+    parser.add_argument("--imgsz", type=int, default=320)
+    args = parser.parse_args()
+    print("Exported:", export_onnx(args.weights, args.imgsz))
@@ -1,10 +1,11 @@
 # Libraries for email
 import smtplib
+import time
 from email.message import EmailMessage
 from datetime import datetime
 from pathlib import Path
 
-from app import config #GPIO and SMTP configurations
+from app import config, metrics #GPIO and SMTP configurations
 
 # Data is pulled config.py
 SMTP_HOST     = config.SMTP_HOST
@@ -14,24 +15,94 @@ SMTP_PASSWORD = config.SMTP_PASSWORD
 EMAIL_FROM    = config.EMAIL_FROM
 EMAIL_TO      = config.EMAIL_TO
 
-# ─── helper to send email ───────────────────────────────────────────
-def send_report_email(report_path: Path):
+# ─── message ────────────────────────────────────────────────────────
+def build_report_email(body: str, attachment: bytes, filename: str, subject: str = None) -> EmailMessage:
     msg = EmailMessage()
-    msg["Subject"] = f"Coconut Report {datetime.now():%Y-%m-%d %H:%M:%S}"
+    msg["Subject"] = subject or f"Coconut Report {datetime.now():%Y-%m-%d %H:%M:%S}"
     msg["From"]    = EMAIL_FROM
     msg["To"]      = EMAIL_TO
-    msg.set_content("Please find attached the latest coconut count report.")
-    with report_path.open("rb") as f:
-        data = f.read()
-    msg.add_attachment(data, maintype="text", subtype="csv", filename=report_path.name)
-
-    # implicit SSL on 465, STARTTLS on others (e.g. 587)
-    if SMTP_PORT == 465:
-        smtp = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT)
+    msg.set_content(body)
+    if filename.endswith(".gz"):
+        msg.add_attachment(attachment, maintype="application", subtype="gzip", filename=filename)
     else:
-        smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
-        smtp.starttls()
+        msg.add_attachment(attachment, maintype="text", subtype="csv", filename=filename)
+    return msg
+
+# ─── SMTP session ───────────────────────────────────────────────────
+class SmtpSession:
+    """
+    One SMTP connection kept open between messages, so a burst of emails is
+    one TLS handshake and login. Checked with NOOP before reuse (servers drop
+    idle clients); any error closes it and the next send reconnects.
+    """
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, user: str = SMTP_USER,
+                 password: str = SMTP_PASSWORD, security: str = config.SMTP_SECURITY, timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.security = security
+        self.timeout = timeout
+        self.last_used = 0.0  # time.monotonic() of the last send
+        self._smtp = None
+
+    @property
+    def connected(self) -> bool:
+        return self._smtp is not None
 
-    smtp.login(SMTP_USER, SMTP_PASSWORD)
-    smtp.send_message(msg)
-    smtp.quit()
\ No newline at end of file
+    def _connect(self) -> smtplib.SMTP:
+        # implicit SSL on 465, STARTTLS on others (e.g. 587)
+        implicit = self.security == "ssl" or (self.security == "auto" and self.port == 465)
+        if implicit:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if not implicit and self.security in ("auto", "starttls"):
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+        except BaseException:
+            smtp.close()
+            raise
+        metrics.MAIL_SMTP_CONNECTS.inc()
+        return smtp
+
+    def send(self, msg: EmailMessage):
+        if self._smtp is not None:
+            try:
+                alive = self._smtp.noop()[0] == 250
+            except (smtplib.SMTPException, OSError):
+                alive = False
+            if not alive:
+                self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(msg)
+        except BaseException:
+            self.close()
+            raise
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+# ─── helper to send email ───────────────────────────────────────────
+def send_report_email(report_path: Path):
+    """One-off: mail a report file over a session of its own (the report queue is app.mailer)."""
+    with report_path.open("rb") as f:
+        data = f.read()
+    msg = build_report_email("Please find attached the latest coconut count report.", data, report_path.name)
+    session = SmtpSession()
+    try:
+        session.send(msg)
+    finally:
+        session.close()
@@ -0,0 +1,366 @@
+# app/engine.py
+import asyncio
+import bisect
+import time
+import traceback
+
+from app import config, metrics
+from app.broadcast import BroadcastHub
+from app.buckets import LineBuckets
+from app.counting import counter_from_config
+from app.gpio_controller import GPIOController, close_gpio_service, get_gpio_service
+from app.history import get_history
+from app.line_worker import LineProcess, ProcessPipeline
+from app.lines import line_buckets, line_files, load_lines, use_processes
+from app.models import LineConfig
+from app.pipeline import FramePipeline
+from app.preview import PreviewFrame
+from app.roi import Roi, load_roi, save_roi
+from app.state_sync import BucketStateSync
+from app.video_streamer import VideoStreamer, detector_from_config
+
+
+class CountingEngine:
+    """
+    The camera -> detector -> tracker -> buckets -> GPIO loop of one line.
+
+    Shared by every WebSocket client of the line: frames and bucket updates are
+    produced once and fanned out through `hub`, so a second tab or a supervisor
+    display costs a send, not another capture and watershed.
+
+    With in_process=True capture, detection and tracking run in a worker
+    process (app.line_worker) instead of threads of this one.
+    """
+
+    def __init__(self, line: LineConfig = None, buckets: LineBuckets = None, in_process: bool = False):
+        self.line = line or LineConfig.default()
+        self.buckets = buckets or line_buckets(self.line)
+        self.hub = BroadcastHub()
+        # versioned, throttled bucket deltas for every client
+        self.state = BucketStateSync(self.hub, self.buckets.buckets, max_hz=config.BUCKETS_SYNC_HZ)
+        self.roi_path = line_files(self.line)[2]
+        roi = load_roi(self.line.trigger_line_y, self.roi_path)
+        self.in_process = in_process
+        if in_process:
+            self.streamer = LineProcess(self.line, roi)
+        else:
+            self.streamer = VideoStreamer(source=self.line.source, roi=roi,
+                                          detector=detector_from_config(self.line.detector), line_id=self.line.id,
+                                          counter=counter_from_config(roi.trigger_line_y, self.line, roi.frame_w))
+        self.selected_bucket = None  # bucket id (1..bucket_count) or None
+        self.history = get_history()
+        self._settling = None  # the last bucket stop, until its actual overfill is recorded
+        self._gpio = None
+        self._task = None
+
+    @property
+    def gpio(self) -> GPIOController:
+        """This line's pins on the shared GPIO service, claimed on first use."""
+        if self._gpio is None:
+            self._gpio = get_gpio_service().line(self.line)
+        return self._gpio
+
+    def set_roi(self, roi: Roi):
+        """Apply a new region of interest / counting band, persist it and tell every client."""
+        self.streamer.set_roi(roi)
+        save_roi(roi, self.roi_path)
+        self.hub.publish_json(self.roi_message())
+
+    def roi_message(self) -> dict:
+        return {"type": "roi", **self.streamer.roi.to_dict()}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def stop_conveyor(self, reason: str = "operator", count: bool = True):
+        """
+        Queued to the GPIO relay thread: returns at once, never waits on the chip.
+        count=False only makes sure the relay is open (counting starts with the
+        belt held), it is not a stop in coconut_conveyor_stops_total.
+        """
+        if count:
+            metrics.CONVEYOR_STOPS.labels(self.line.id, reason).inc()
+        try:
+            self.gpio.stop_conveyor()
+        except Exception as e:
+            print("Error stopping conveyor:", e)
+
+    # ─── bucket stops ────────────────────────────────────────────
+    def stop_latency(self) -> float:
+        """Seconds from a stop decision until the belt stops delivering: measured relay latency + belt run-on."""
+        relay = self._gpio.relay_latency if self._gpio is not None else None
+        return (relay or 0.0) + self.line.stop_coast_s
+
+    def _predict_stop(self, arrivals):
+        """
+        Predictive stop mode: stop the belt as soon as the selected bucket's
+        count plus the nuts arriving within the stopping time reaches its set
+        value. Those nuts still land and are counted into the bucket.
+        """
+        buckets = self.buckets.buckets
+        idx = self.selected_bucket - 1
+        if not 0 <= idx < len(buckets):
+            return
+        b = buckets[idx]
+        if b.get("filled") or (self._settling is not None and self._settling["bucket"] == b["id"]):
+            return
+        set_value = int(b.get("set_value", self.buckets.default_set_value))
+        count = int(b.get("count", 0))
+        latency = self.stop_latency()
+        in_flight = bisect.bisect_right(arrivals, latency)
+        if count < set_value <= count + in_flight:
+            self.stop_conveyor("bucket_predicted")
+            self._begin_stop(b, set_value, in_flight, latency, "predictive")
+            self.hub.publish_json({"type": "bucket_stopped", "bucket": b["id"], "in_flight": in_flight})
+
+    def _begin_stop(self, b: dict, set_value: int, in_flight: int, latency: float, mode: str):
+        if self._settling is not None:
+            self.settle_stop()
+        self._settling = {"bucket": b["id"], "mode": mode, "set_value": set_value, "count": int(b["count"]),
+                          "in_flight": in_flight, "latency": latency, "ts": time.time(),
+                          "due": time.monotonic() + latency + config.STOP_SETTLE_S}
+
+    def settle_stop(self):
+        """
+        Record how the last bucket stop came out, predicted vs actual overfill
+        (history 'stops', metrics, log). Due STOP_SETTLE_S after the belt
+        stopped; also called on reset and when counting ends.
+        """
+        s, self._settling = self._settling, None
+        if s is None:
+            return
+        b = next((b for b in self.buckets.buckets if b["id"] == s["bucket"]), None)
+        if b is None:
+            return
+        actual = int(b.get("count", 0)) - s["set_value"]
+        predicted = s["count"] + s["in_flight"] - s["set_value"]
+        self.history.record_stop(self.line.id, s["bucket"], s["mode"], s["set_value"], s["count"], s["in_flight"],
+                                 s["latency"], actual, ts=s["ts"])
+        metrics.STOP_OVERFILL.labels(self.line.id, s["mode"]).observe(actual)
+        metrics.STOP_FORECAST_ERROR.labels(self.line.id).observe(actual - predicted)
+        print(f"Line {self.line.id} bucket {s['bucket']}: {s['mode']} stop at {s['count']}/{s['set_value']}, "
+              f"{s['in_flight']} in flight within {s['latency'] * 1e3:.0f} ms; "
+              f"overfill predicted {predicted:+d}, actual {actual:+d}")
+        self.hub.publish_json({"type": "stop_settled", "bucket": s["bucket"], "mode": s["mode"],
+                               "predicted": predicted, "actual": actual})
+
+    # ─── lifecycle ───────────────────────────────────────────────
+    async def start(self) -> bool:
+        """Open the camera and start counting. Returns False if the camera is unavailable."""
+        if self.running:
+            return True
+        # open() sleeps between retries, keep it off the event loop
+        ok = await asyncio.to_thread(self.streamer.open, 5, 1)
+        if not ok:
+            return False
+        self._task = asyncio.create_task(self._pump_frames())
+        return True
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            # wait for the pipeline threads to let go of the capture
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self.streamer.release()
+
+    async def close(self):
+        """Stop counting and release the camera and GPIO (server shutdown)."""
+        await self.stop()
+        if self._gpio is not None:
+            try:
+                self._gpio.cleanup()
+            except Exception as e:
+                print("Error cleaning GPIO:", e)
+            self._gpio = None
+
+    # ─── frame loop ──────────────────────────────────────────────
+    async def _pump_frames(self):
+        """Attribute delta counts to the selected bucket and broadcast every frame."""
+        prev_count = 0
+        loop = asyncio.get_running_loop()
+        preview_interval = 1.0 / config.PREVIEW_FPS if config.PREVIEW_FPS > 0 else 0.0
+        last_preview = 0.0
+        # capture + processing run on their own threads; this coroutine only fans out
+        if self.in_process:
+            pipeline = ProcessPipeline(self.streamer, loop)
+        else:
+            pipeline = FramePipeline(self.streamer, loop)
+        pipeline.start()
+        try:
+            while True:
+                result = await pipeline.get()
+                if result is None:
+                    # end of file or no frame -> stop
+                    break
+                count, frame, overlay, jpeg, arrivals = result
+                pipeline.update_metrics()
+
+                # compute delta (new counts since last frame)
+                new_count = int(count or 0)
+                delta = new_count - prev_count
+                prev_count = new_count
+
+                if delta > 0 and self.selected_bucket is not None:
+                    await self._add_to_selected_bucket(delta, arrivals)
+                if self.line.stop_mode == "predictive" and self.selected_bucket is not None:
+                    self._predict_stop(arrivals)
+                if self._settling is not None and time.monotonic() >= self._settling["due"]:
+                    self.settle_stop()
+
+                # only frames someone may see become previews; drawing and
+                # encoding happen later, and only if a client takes the frame
+                if self.in_process:
+                    # the worker only ships pixels while someone is watching
+                    self.streamer.preview = bool(len(self.hub))
+                now = loop.time()
+                if frame is not None and len(self.hub) and now - last_preview >= preview_interval:
+                    last_preview = now
+                    self.hub.publish_frame(PreviewFrame(new_count, frame, overlay, jpeg=jpeg,
+                                                        keep_raw=self.hub.vector_clients > 0))
+
+        except asyncio.CancelledError:
+            print("Frame pumping task cancelled")
+        except Exception as e:
+            print("Unhandled error in pump_frames:", e)
+            traceback.print_exc()
+        finally:
+            self.settle_stop()
+            await asyncio.to_thread(pipeline.stop)
+            print("pump_frames exiting")
+
+    async def _add_to_selected_bucket(self, delta: int, arrivals=()):
+        # Attribution: always attribute deltas to the selected bucket, even if that
+        # bucket was already marked "filled". We still mark "filled" the first time
+        # count >= set_value and stop the conveyor then (again, after a predictive
+        # stop: the relay write is idempotent), but we keep incrementing the
+        # bucket's count so overfill is captured until the operator selects
+        # another bucket.
+        buckets = self.buckets.buckets
+        async with self.buckets.lock:
+            idx = self.selected_bucket - 1
+            if not 0 <= idx < len(buckets):
+                return
+            b = buckets[idx]
+            was_filled = bool(b.get("filled", False))
+            b["count"] = int(b.get("count", 0)) + int(delta)
+            self.history.record_count(self.line.id, b["id"], delta)
+            metrics.BUCKET_COUNTED.labels(self.line.id, b["id"]).inc(delta)
+            metrics.BUCKET_COUNT.labels(self.line.id, b["id"]).set(b["count"])
+
+            set_value = int(b.get("set_value", self.buckets.default_set_value))
+            if (not was_filled) and b["count"] >= set_value:
+                b["filled"] = True
+                self.history.record_fill(self.line.id, b["id"], b["count"], b.get("set_value"), "filled")
+                self.stop_conveyor("bucket_full")
+                if self._settling is None or self._settling["bucket"] != b["id"]:
+                    latency = self.stop_latency()
+                    self._begin_stop(b, set_value, bisect.bisect_right(arrivals, latency), latency, "threshold")
+                    self.hub.publish_json({"type": "bucket_stopped", "bucket": b["id"]})
+
+            # queue for persistence and a client delta (will show overfill counts);
+            # both are batched unless the bucket just filled
+            just_filled = b["filled"] and not was_filled
+            self.buckets.save(ids=(b["id"],), urgent=just_filled)
+            self.state.mark(ids=(b["id"],), urgent=just_filled)
+
+
+class LineManager:
+    """
+    Every counting line on this box, by id (lines.json, or the single line
+    from config.py). Engines are created on first use; the first line is the
+    default served at /ws.
+    """
+
+    def __init__(self, lines=None, in_process: bool = None):
+        lines = lines or load_lines()
+        self.lines = {line.id: line for line in lines}
+        self.default_id = lines[0].id
+        self.in_process = use_processes(lines) if in_process is None else in_process
+        self._engines = {}
+
+    def get(self, line_id: str = None):
+        """The engine of line_id (default line if None), or None if there is no such line."""
+        line_id = line_id or self.default_id
+        engine = self._engines.get(line_id)
+        if engine is None:
+            line = self.lines.get(line_id)
+            if line is None:
+                return None
+            engine = self._engines[line_id] = CountingEngine(line, in_process=self.in_process)
+        return engine
+
+    def describe(self) -> list:
+        return [
+            {"id": line.id, "source": line.source, "detector": line.detector,
+             "running": line.id in self._engines and self._engines[line.id].running,
+             "clients": len(self._engines[line.id].hub) if line.id in self._engines else 0}
+            for line in self.lines.values()
+        ]
+
+    def publish_json(self, data: dict, line_id: str = None):
+        """A message for every connected client, or only those of line_id."""
+        for engine in self._engines.values():
+            if line_id is None or engine.line.id == line_id:
+                engine.hub.publish_json(data)
+
+    def claim_gpio(self):
+        """Claim every line's relay and buttons now, so the buttons work before any client connects."""
+        service = get_gpio_service()
+        for line in self.lines.values():
+            try:
+                service.line(line)
+            except Exception as e:
+                print(f"Line {line.id}: could not claim GPIO:", e)
+
+    def reload_color_lut(self):
+        """Line workers pick up a recalibrated colour table (in-process lines already share it)."""
+        for engine in self._engines.values():
+            if engine.in_process:
+                engine.streamer.reload_color_lut()
+
+    async def start_all(self):
+        for line_id in self.lines:
+            if not await self.get(line_id).start():
+                print(f"Line {line_id}: could not open camera")
+
+    async def close(self):
+        for engine in self._engines.values():
+            await engine.close()
+            # write out anything still queued
+            engine.buckets.close()
+        self._engines.clear()
+
+
+_manager = None
+
+
+def get_manager() -> LineManager:
+    """The process-wide line manager, created on first use."""
+    global _manager
+    if _manager is None:
+        _manager = LineManager()
+    return _manager
+
+
+def get_engine(line_id: str = None) -> CountingEngine:
+    """The engine of a line (the default line if None); None for an unknown line."""
+    return get_manager().get(line_id)
+
+
+async def forward_button_events():
+    """Physical button presses, pushed to the clients of their line as {"type": "button", ...}."""
+    events = get_gpio_service().subscribe()
+    try:
+        while True:
+            event = await events.get()
+            get_manager().publish_json(event, line_id=event["line"])
+    finally:
+        get_gpio_service().unsubscribe(events)
+
+
+async def shutdown_engine():
+    if _manager is not None:
+        await _manager.close()
+    await asyncio.to_thread(close_gpio_service)
@@ -1,21 +1,55 @@
 # app/export_utils.py
-from pathlib import Path
-from datetime import datetime
-import shutil
+"""
+Report export to a USB stick.
+
+The history is streamed from the database straight onto the stick in chunks
+(optionally gzip-compressed), so memory stays flat and nothing is staged on
+the SD card first. The file is written under a hidden .part name, fsynced
+every EXPORT_FSYNC_BYTES and at the end, renamed into place, then read back
+from the media and checked against the checksum of what was written. A stick
+pulled halfway leaves no half file behind under the final name.
+
+Progress goes to every WebSocket client as {"type": "export", "state": ...}
+(writing, verifying, done, failed).
+
+Mount discovery is parsed from /proc/mounts once and again only when the
+mount table changes (see UsbMounts).
+"""
+import asyncio
+import errno
+import hashlib
 import os
+import re
+import select
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
 from fastapi import APIRouter, HTTPException
 
+from app import config, metrics
+from app.engine import get_manager
+from app.history import get_history, parse_time, shift_windows
+from app.models import ExportRequest
+from app.persistence import fsync_dir
+
 router = APIRouter()
 
-def _find_writable_usb_mounts():
+TABLES = ("reports", "fills", "stops", "throughput")
+PROGRESS_INTERVAL = 0.25  # seconds between progress messages
+
+
+def _parse_mounts(path: str = "/proc/mounts"):
     """
-    Return a list of candidate mount points that look like removable media
-    and are writable by the current process.
+    Return a list of candidate mount points that look like removable media.
     We look for mountpoints under /media, /run/media, /mnt whose device looks like /dev/sd*
     """
     mounts = []
     try:
-        with open("/proc/mounts", "r", encoding="utf-8") as f:
+        with open(path, "r", encoding="utf-8") as f:
             for line in f:
                 parts = line.split()
                 if len(parts) < 2:
@@ -27,45 +61,291 @@ def _find_writable_usb_mounts():
                 # Only consider typical mount base paths
                 if not (mnt.startswith("/media/") or mnt.startswith("/run/media/") or mnt.startswith("/mnt/")):
                     continue
-                # must be writable by this process
-                if os.access(mnt, os.W_OK):
-                    mounts.append(mnt)
+                # spaces etc. in a stick's label are octal escapes (\040)
+                mounts.append(re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), mnt))
     except FileNotFoundError:
         # Not a linux-like system or /proc not available
         pass
     return mounts
 
-def _get_reports_file() -> Path:
+
+class UsbMounts:
     """
-    Return Path to your reports.csv (adjust if your file lives somewhere else).
-    This assumes reports.csv lives two levels up from this file at backend/reports.csv.
+    Removable-media mount points, cached. A watcher thread blocks in poll() on
+    /proc/mounts, which the kernel wakes (POLLPRI) on every mount and unmount;
+    only then is the table parsed again. Without the watcher the cache is
+    re-read at most every `ttl` seconds.
+
+    `on_change(writable mounts)` is called from the watcher thread.
     """
-    # file layout: backend/app/export_utils.py -> backend/reports.csv
-    return Path(__file__).resolve().parents[1] / "reports.csv"
+
+    def __init__(self, path: str = "/proc/mounts", ttl: float = 2.0):
+        self.path = path
+        self.ttl = ttl
+        self.on_change = None
+        self._lock = threading.Lock()
+        self._mounts = None
+        self._read_at = 0.0
+        self._watching = False
+        self._thread = None
+
+    def candidates(self) -> list:
+        with self._lock:
+            now = time.monotonic()
+            if self._mounts is None or (not self._watching and now - self._read_at > self.ttl):
+                self._mounts = _parse_mounts(self.path)
+                self._read_at = now
+            return list(self._mounts)
+
+    def writable(self) -> list:
+        """Candidate mounts writable by this process (checked on every call, it is cheap)."""
+        return [mnt for mnt in self.candidates() if os.access(mnt, os.W_OK)]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="usb-mounts", daemon=True)
+            self._thread.start()
+
+    def _watch(self):
+        try:
+            f = open(self.path, "rb")
+            poller = select.poll()
+            poller.register(f.fileno(), select.POLLPRI | select.POLLERR)
+        except (OSError, AttributeError) as e:
+            print(f"Not watching {self.path} ({e}), USB mounts re-read every {self.ttl:g} s")
+            return
+        self._watching = True
+        try:
+            while True:
+                if not poller.poll():
+                    continue
+                # a stick being mounted is usually several changes in a row
+                time.sleep(0.2)
+                with self._lock:
+                    self._mounts = None
+                if self.on_change is not None:
+                    try:
+                        self.on_change(self.writable())
+                    except Exception as e:
+                        print("Error reporting USB mount change:", e)
+        finally:
+            self._watching = False
+            f.close()
+
+
+_usb_mounts = UsbMounts()
+
+
+def usb_mounts() -> UsbMounts:
+    return _usb_mounts
+
+
+def watch_usb_mounts(loop: asyncio.AbstractEventLoop):
+    """Start the mount watch; clients get {"type": "usb_mounts", "mounts": [...]} on every change."""
+    def changed(mounts):
+        loop.call_soon_threadsafe(get_manager().publish_json, {"type": "usb_mounts", "mounts": mounts})
+    _usb_mounts.on_change = changed
+    _usb_mounts.start()
+
+
+# ─── export engine ───────────────────────────────────────────────
+class ExportVerifyError(Exception):
+    """The file read back from the stick is not what was written."""
+
+
+def _rows_to_export(table: str, start=None, end=None, line=None) -> int:
+    history = get_history()
+    history.flush()  # include what is still queued
+    return history.count(table, start, end, line)
+
+
+def _read_back_sha256(path: Path) -> str:
+    """Checksum of the file as stored: its cached pages are dropped first, so the read goes to the media."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _unused_path(directory: Path, stem: str, suffix: str) -> Path:
+    """directory/stem+suffix, or stem-2, stem-3, ... if taken: an export never replaces an earlier one."""
+    path, n = directory / f"{stem}{suffix}", 1
+    while path.exists():
+        n += 1
+        path = directory / f"{stem}-{n}{suffix}"
+    return path
+
+
+def export_history(dest_dir: Path, table: str = "reports", start=None, end=None, line=None,
+                   compress: bool = False, verify: bool = True, total: int = None, progress=None) -> dict:
+    """
+    Stream one history table (optionally a time range / line) into dest_dir as
+    CSV or CSV.gz. Blocking; raises OSError (stick full, read-only, pulled) or
+    ExportVerifyError, leaving no partial file behind.
+    """
+    if total is None:
+        total = _rows_to_export(table, start, end, line)
+    stem = f"{table}_{datetime.now():%Y%m%d-%H%M%S}"
+    suffix = ".csv" + (".gz" if compress else "")
+    dest = _unused_path(Path(dest_dir), stem, suffix)
+    tmp = dest.with_name(f".{dest.name}.part")
+    digest = hashlib.sha256()
+    deflate = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # 31: gzip container
+    lines = written = synced = 0
+    t0 = time.perf_counter()
+    last_progress = 0.0
+
+    def report(state: str, **extra):
+        if progress is not None:
+            progress({"type": "export", "state": state, "dest": str(dest), "table": table,
+                      "rows": max(0, lines - 1), "total": total, "bytes": written, **extra})
+
+    try:
+        with open(tmp, "wb") as f:
+            for text in get_history().iter_csv(table, start, end, line):
+                lines += text.count("\n")
+                data = text.encode("utf-8")
+                if deflate is not None:
+                    data = deflate.compress(data)
+                f.write(data)
+                digest.update(data)
+                written += len(data)
+                # bounded dirty data: the final fsync stays short and a pulled
+                # stick is noticed here, not minutes later
+                if written - synced >= config.EXPORT_FSYNC_BYTES:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    synced = written
+                now = time.monotonic()
+                if now - last_progress >= PROGRESS_INTERVAL:
+                    report("writing")
+                    last_progress = now
+            if deflate is not None:
+                data = deflate.flush()
+                f.write(data)
+                digest.update(data)
+                written += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if dest.exists():
+            # another export of the table finished in the same second meanwhile
+            dest = _unused_path(dest.parent, stem, suffix)
+        os.replace(tmp, dest)
+        fsync_dir(dest.parent)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass  # the stick is gone
+        raise
+    metrics.USB_EXPORT_BYTES.inc(written)
+
+    if verify:
+        report("verifying")
+        if _read_back_sha256(dest) != digest.hexdigest():
+            try:
+                dest.unlink()
+            except OSError:
+                pass
+            raise ExportVerifyError(f"{dest} does not match what was written")
+    seconds = time.perf_counter() - t0
+    metrics.USB_EXPORT_SECONDS.observe(seconds)
+    result = {"dest": str(dest), "table": table, "rows": max(0, lines - 1), "bytes": written,
+              "gzip": compress, "sha256": digest.hexdigest(), "verified": verify, "seconds": round(seconds, 2)}
+    report("done", **result)
+    return result
+
+
+def _shift_range(shift: str):
+    """(start, end) of the shift containing a time, or of the "current" / "previous" shift."""
+    now = time.time()
+    if shift == "current":
+        t = now
+    elif shift == "previous":
+        t = shift_windows(now, now + 1)[0][0] - 1
+    else:
+        t = parse_time(shift)
+    return shift_windows(t, t + 1)[0]
+
+
+def _failure(e: Exception, mount: str):
+    """(HTTP status, metrics result, message) for a failed export."""
+    if isinstance(e, ExportVerifyError):
+        return 500, "verify_failed", f"The copy on {mount} did not verify and was removed. Try another USB drive."
+    if isinstance(e, OSError):
+        if e.errno == errno.ENOSPC:
+            return 507, "no_space", f"USB drive {mount} is full"
+        if e.errno in (errno.EACCES, errno.EPERM, errno.EROFS):
+            return 403, "denied", f"Permission denied writing to {mount}"
+        if e.errno in (errno.ENOENT, errno.ENODEV, errno.ENXIO, errno.EIO):
+            return 503, "removed", f"USB drive {mount} was removed or failed during the export, nothing was kept"
+    return 500, "error", f"Failed to export: {e}"
+
+
+_export_lock = threading.Lock()
+
+
+@router.get("/usb/mounts")
+def list_usb_mounts():
+    """Writable removable-media mount points, first one is the default export target."""
+    return {"mounts": usb_mounts().writable()}
+
 
 @router.post("/export_report")
-def export_report():
-    report_file = _get_reports_file()
-    if not report_file.exists():
-        raise HTTPException(status_code=404, detail=f"Report file not found: {str(report_file)}")
+async def export_report(request: Optional[ExportRequest] = None):
+    """
+    Export history to USB. With no body: every saved report, as before.
+    Optional JSON body (models.ExportRequest): table, start/end or shift,
+    line, gzip, mount. Returns when the file is on the stick and verified.
+    """
+    request = request or ExportRequest()
+    if request.table not in TABLES:
+        raise HTTPException(status_code=400, detail=f"table must be one of {TABLES}")
+    try:
+        if request.shift:
+            start, end = _shift_range(request.shift)
+        else:
+            start, end = parse_time(request.start), parse_time(request.end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {e}")
+
+    total = await asyncio.to_thread(_rows_to_export, request.table, start, end, request.line)
+    if not total:
+        if request.table == "reports" and start is None and end is None and not request.line:
+            raise HTTPException(status_code=404, detail="No reports saved yet")
+        raise HTTPException(status_code=404, detail=f"No {request.table} to export in that range")
 
-    mounts = _find_writable_usb_mounts()
+    mounts = usb_mounts().writable()
     if not mounts:
         raise HTTPException(status_code=404, detail="No writable USB mount found. Please insert and mount a USB drive.")
+    if request.mount and request.mount not in mounts:
+        raise HTTPException(status_code=404, detail=f"{request.mount} is not a writable USB mount")
+    dest_mount = request.mount or mounts[0]
 
-    # choose the first candidate. If you prefer, you can surface a list to the client.
-    dest_mount = Path(mounts[0])
+    if not _export_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="An export is already running")
+    loop = asyncio.get_running_loop()
+    manager = get_manager()
 
-    # create destination filename with timestamp
-    ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-    dest_name = f"reports_{ts}.csv"
-    dest_path = dest_mount / dest_name
+    def progress(message: dict):
+        loop.call_soon_threadsafe(manager.publish_json, message)
 
+    compress = config.EXPORT_GZIP if request.gzip is None else request.gzip
     try:
-        shutil.copy2(str(report_file), str(dest_path))
-    except PermissionError:
-        raise HTTPException(status_code=403, detail=f"Permission denied copying to {dest_mount}")
+        # blocking file I/O on a thread of the loop's default executor (shared,
+        # but exports run one at a time), so the event loop stays free
+        result = await asyncio.to_thread(export_history, Path(dest_mount), request.table, start, end,
+                                         request.line, compress, config.EXPORT_VERIFY, total, progress)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to copy file: {e}")
-
-    return {"status": "ok", "dest": str(dest_path)}
+        status, label, detail = _failure(e, dest_mount)
+        print(f"USB export to {dest_mount} failed: {e}")
+        metrics.USB_EXPORTS.labels(label).inc()
+        manager.publish_json({"type": "export", "state": "failed", "error": detail})
+        raise HTTPException(status_code=status, detail=detail)
+    finally:
+        _export_lock.release()
+    metrics.USB_EXPORTS.labels("ok").inc()
+    return {"status": "ok", **result}
@@ -1,72 +1,329 @@
-import sys
+# app/gpio_controller.py
+"""
+GPIO for every conveyor on the box, through one GpioService:
+
+  - the chip is opened once (lgpio; SimulatedGpio only with GPIO_BACKEND=sim)
+    and each line claims its relay, buzzer and button pins on it;
+  - relay and buzzer writes are commands on a queue, executed by one relay
+    thread at real-time priority; callers (the event loop deciding a bucket
+    is full) never wait on the chip. Command-to-write latency is measured
+    (coconut_relay_latency_seconds);
+  - buttons are lgpio edge alerts with kernel debounce. A press acts on the
+    relay from the alert thread directly, and is published with its kernel
+    timestamp as an asyncio event (subscribe()).
+"""
+import asyncio
 import os
-# Add stubs/ to the front of module search path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'stubs')))
-# Modules for GPIO manipulation in Raspberry Pi 
-import RPi.GPIO as GPIO 
-import lgpio
-from .config import START_BUTTON_PIN, STOP_BUTTON_PIN, CONVEYOR_RELAY_PIN, BUZZER_PIN
+import queue
+import threading
+import time
+from collections import deque
+
+from app import config, metrics
+from app.config import START_BUTTON_PIN, STOP_BUTTON_PIN, CONVEYOR_RELAY_PIN, BUZZER_PIN
+
+
+# ─── backends ───────────────────────────────────────────────────────
+class LgpioGpio:
+    """The Pi's GPIO chip through lgpio."""
+
+    name = "lgpio"
+
+    def __init__(self, chip: int = 0):
+        import lgpio
+        self.lgpio = lgpio
+        self.handle = lgpio.gpiochip_open(chip)
+        self._callbacks = {}
+
+    def claim_output(self, pin: int, level: int = 0):
+        self.lgpio.gpio_claim_output(self.handle, pin, level)
+
+    def write(self, pin: int, level: int):
+        self.lgpio.gpio_write(self.handle, pin, level)
+
+    def read(self, pin: int) -> int:
+        return self.lgpio.gpio_read(self.handle, pin)
+
+    def claim_button(self, pin: int, on_press, debounce_us: int):
+        """Pulled-up input; on_press(pin, level, timestamp ns) on every debounced falling edge."""
+        lg = self.lgpio
+        lg.gpio_claim_alert(self.handle, pin, lg.FALLING_EDGE, lg.SET_PULL_UP)
+        lg.gpio_set_debounce_micros(self.handle, pin, debounce_us)
+        self._callbacks[pin] = lg.callback(self.handle, pin, lg.FALLING_EDGE,
+                                           lambda chip, gpio, level, ts: on_press(gpio, level, ts))
+
+    def free(self, pin: int):
+        callback = self._callbacks.pop(pin, None)
+        if callback is not None:
+            callback.cancel()
+        self.lgpio.gpio_free(self.handle, pin)
+
+    def close(self):
+        self.lgpio.gpiochip_close(self.handle)
+
+
+class SimulatedGpio:
+    """
+    In-memory GPIO chip for running off the Pi, tests and benchmarks.
+    press(pin) injects a button press; writes are kept with their time.
+    """
+
+    name = "sim"
 
-class GPIOController:
     def __init__(self):
-        self.chip = lgpio.gpiochip_open(0)  # Open the first GPIO chip
-        # set outputs
-        lgpio.gpio_claim_output(self.chip, CONVEYOR_RELAY_PIN)
-        lgpio.gpio_claim_output(self.chip, BUZZER_PIN)
-        #initialize outputs to low
-        lgpio.gpio_write(self.chip, CONVEYOR_RELAY_PIN, 0)
-        lgpio.gpio_write(self.chip, BUZZER_PIN, 0)
-        # ─── RPi.GPIO setup for the button ────────────────────────────────────────
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(START_BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(STOP_BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-        # ─── Install a falling-edge interrupt with 200 ms debounce ─────────────────
-        GPIO.add_event_detect(
-            START_BUTTON_PIN,
-            GPIO.FALLING,              # detect HIGH → LOW transitions
-            callback=self._on_start_button_pressed,
-            bouncetime=10             # debounce in milliseconds
-        )
-
-        GPIO.add_event_detect(
-            STOP_BUTTON_PIN,
-            GPIO.FALLING,              # detect HIGH → LOW transitions
-            callback=self._on_stop_button_pressed,
-            bouncetime=10             # debounce in milliseconds
-        )
-
-    def _on_start_button_pressed(self, channel):
-        """Callback: button pressed → turn conveyor on."""
-        print("Button pressed, starting conveyor…")
-        if GPIO.input(START_BUTTON_PIN) == 0:
-            if GPIO.input(START_BUTTON_PIN) == 0:
-                lgpio.gpio_write(self.chip, CONVEYOR_RELAY_PIN, 1)
-                lgpio.gpio_write(self.chip, BUZZER_PIN, 0)  # turn off buzzer
-
-    def _on_stop_button_pressed(self, channel):
-        print("Button pressed, stopping conveyor…")
-        if GPIO.input(STOP_BUTTON_PIN) == 0:
-            if GPIO.input(STOP_BUTTON_PIN) == 0:
-                lgpio.gpio_write(self.chip, CONVEYOR_RELAY_PIN, 0)      
+        self.levels = {}
+        self.writes = deque(maxlen=1000)  # (pin, level, time.perf_counter_ns())
+        self._buttons = {}
+
+    def claim_output(self, pin: int, level: int = 0):
+        self.levels[pin] = level
+
+    def write(self, pin: int, level: int):
+        self.levels[pin] = level
+        self.writes.append((pin, level, time.perf_counter_ns()))
+
+    def read(self, pin: int) -> int:
+        return self.levels.get(pin, 1)
+
+    def claim_button(self, pin: int, on_press, debounce_us: int):
+        self.levels[pin] = 1  # pulled up
+        self._buttons[pin] = on_press
+
+    def press(self, pin: int):
+        """A button press (falling edge), delivered on the calling thread like an lgpio alert."""
+        self.levels[pin] = 0
+        on_press = self._buttons.get(pin)
+        if on_press is not None:
+            on_press(pin, 0, time.time_ns())
+        self.levels[pin] = 1
+
+    def free(self, pin: int):
+        self.levels.pop(pin, None)
+        self._buttons.pop(pin, None)
+
+    def close(self):
+        self._buttons.clear()
+
+
+def gpio_backend(kind: str = None, chip: int = None):
+    """
+    GPIO_BACKEND: "lgpio" (raises if the chip cannot be opened) or "sim".
+    The simulator is never a fallback, only chosen explicitly.
+    """
+    kind = kind or config.GPIO_BACKEND
+    if kind == "lgpio":
+        return LgpioGpio(config.GPIO_CHIP if chip is None else chip)
+    if kind == "sim":
+        print("GPIO_BACKEND=sim: relays and buttons are simulated, the conveyor is not controlled")
+        return SimulatedGpio()
+    raise ValueError(f"GPIO_BACKEND must be 'lgpio' or 'sim', not {kind!r}")
+
+
+# ─── one line's pins ────────────────────────────────────────────────
+class GPIOController:
+    """
+    Relay, buzzer and buttons of one conveyor (see models.LineConfig), claimed
+    on the shared GpioService. A buzzer or button pin of None is simply not
+    used. Writes are queued to the relay thread and return at once.
+    """
+
+    def __init__(self, service: "GpioService", line_id: str, relay_pin=CONVEYOR_RELAY_PIN, buzzer_pin=BUZZER_PIN,
+                 start_button_pin=START_BUTTON_PIN, stop_button_pin=STOP_BUTTON_PIN):
+        self.service = service
+        self.line_id = line_id
+        self.relay_pin = relay_pin
+        self.buzzer_pin = buzzer_pin
+        self.start_button_pin = start_button_pin
+        self.stop_button_pin = stop_button_pin
+        self.relay_latency = None  # smoothed command-to-write seconds of the relay
+
+    @property
+    def pins(self) -> list:
+        return [p for p in (self.relay_pin, self.buzzer_pin, self.start_button_pin, self.stop_button_pin)
+                if p is not None]
 
     def start_conveyor(self):
         """Start the conveyor by setting the relay pin high."""
-        lgpio.gpio_write(self.chip, CONVEYOR_RELAY_PIN, 1)
+        self.service.command(self, self.relay_pin, 1)
 
     def stop_conveyor(self):
         """Stop the conveyor by setting the relay pin low."""
-        lgpio.gpio_write(self.chip, CONVEYOR_RELAY_PIN, 0)
+        self.service.command(self, self.relay_pin, 0)
 
     def activate_buzzer(self):
-        """Activate the buzzer by setting the pin high."""
-        lgpio.gpio_write(self.chip, BUZZER_PIN, 1)
+        if self.buzzer_pin is not None:
+            self.service.command(self, self.buzzer_pin, 1)
 
     def deactivate_buzzer(self):
-        """Deactivate the buzzer by setting the pin low."""
-        lgpio.gpio_write(self.chip, BUZZER_PIN, 0)
+        if self.buzzer_pin is not None:
+            self.service.command(self, self.buzzer_pin, 0)
 
     def cleanup(self):
-        """Clean up GPIO settings."""
-        GPIO.cleanup()
-        lgpio.gpiochip_close(self.chip) #see if needed
\ No newline at end of file
+        """Release this line's pins once queued writes are done (other lines keep theirs)."""
+        self.service.release(self.line_id)
+
+
+# ─── the service ────────────────────────────────────────────────────
+class GpioService:
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else gpio_backend()
+        metrics.GPIO_BACKEND.labels(self.backend.name).set(1)
+        self._lines = {}    # line id -> GPIOController
+        self._owners = {}   # pin -> line id
+        self._lock = threading.Lock()
+        self._commands = queue.SimpleQueue()
+        self._subscribers = frozenset()  # (event loop, asyncio.Queue)
+        self._thread = threading.Thread(target=self._run_relay, name="gpio-relay", daemon=True)
+        self._thread.start()
+
+    def line(self, line) -> GPIOController:
+        """The pins of a line (LineConfig), claimed on first use."""
+        with self._lock:
+            ctrl = self._lines.get(line.id)
+            if ctrl is not None:
+                return ctrl
+            ctrl = GPIOController(self, line.id, line.relay_pin, line.buzzer_pin,
+                                  line.start_button_pin, line.stop_button_pin)
+            for pin in ctrl.pins:
+                if pin in self._owners:
+                    raise ValueError(f"line {line.id}: GPIO {pin} is already used by line {self._owners[pin]}")
+            claimed = []
+            try:
+                self.backend.claim_output(ctrl.relay_pin, 0)
+                claimed.append(ctrl.relay_pin)
+                if ctrl.buzzer_pin is not None:
+                    self.backend.claim_output(ctrl.buzzer_pin, 0)
+                    claimed.append(ctrl.buzzer_pin)
+                debounce_us = int(config.GPIO_DEBOUNCE_MS * 1000)
+                for pin, button in ((ctrl.start_button_pin, "start"), (ctrl.stop_button_pin, "stop")):
+                    if pin is not None:
+                        self.backend.claim_button(
+                            pin, lambda gpio, level, ts, c=ctrl, b=button: self._on_press(c, b, gpio, ts), debounce_us)
+                        claimed.append(pin)
+            except Exception:
+                # nothing is recorded as owned yet: give back what was claimed so a retry can have it
+                for pin in claimed:
+                    try:
+                        self.backend.free(pin)
+                    except Exception as e:
+                        print(f"Error freeing GPIO {pin}:", e)
+                raise
+            for pin in ctrl.pins:
+                self._owners[pin] = line.id
+            self._lines[line.id] = ctrl
+            return ctrl
+
+    def command(self, ctrl: GPIOController, pin: int, level: int):
+        """Queue a write for the relay thread."""
+        self._commands.put((ctrl, pin, level, time.perf_counter_ns()))
+
+    def flush(self, timeout: float = 1.0) -> bool:
+        """Wait until every command queued so far is written."""
+        done = threading.Event()
+        self._commands.put(done)
+        return done.wait(timeout)
+
+    def release(self, line_id: str):
+        with self._lock:
+            ctrl = self._lines.pop(line_id, None)
+        if ctrl is None:
+            return
+        self.flush()  # a last stop_conveyor() goes out before the pin is freed
+        with self._lock:
+            for pin in ctrl.pins:
+                self._owners.pop(pin, None)
+                try:
+                    self.backend.free(pin)
+                except Exception as e:
+                    print(f"Error freeing GPIO {pin}:", e)
+
+    def close(self):
+        for line_id in list(self._lines):
+            self.release(line_id)
+        self._commands.put(None)
+        self._thread.join(1.0)
+        self.backend.close()
+
+    # ─── relay thread ────────────────────────────────────────────
+    def _raise_priority(self):
+        """SCHED_FIFO for this thread if allowed (CAP_SYS_NICE), else at least a lower nice value."""
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(config.GPIO_RELAY_PRIORITY))
+            return f"SCHED_FIFO {config.GPIO_RELAY_PRIORITY}"
+        except (AttributeError, OSError):
+            pass
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), -10)
+            return "nice -10"
+        except (AttributeError, OSError):
+            return "normal priority"
+
+    def _run_relay(self):
+        print(f"GPIO relay thread ({self.backend.name}): {self._raise_priority()}")
+        while True:
+            cmd = self._commands.get()
+            if cmd is None:
+                break
+            if isinstance(cmd, threading.Event):
+                cmd.set()
+                continue
+            ctrl, pin, level, queued_ns = cmd
+            try:
+                self.backend.write(pin, level)
+            except Exception as e:
+                print(f"GPIO write {pin}={level} failed:", e)
+                continue
+            if pin == ctrl.relay_pin:
+                latency = (time.perf_counter_ns() - queued_ns) / 1e9
+                metrics.RELAY_LATENCY.labels(ctrl.line_id).observe(latency)
+                ctrl.relay_latency = latency if ctrl.relay_latency is None else 0.8 * ctrl.relay_latency + 0.2 * latency
+
+    # ─── buttons ─────────────────────────────────────────────────
+    def _on_press(self, ctrl: GPIOController, button: str, pin: int, ts_ns: int):
+        """On the alert thread: act on the relay first, then tell the event loops."""
+        if button == "start":
+            ctrl.start_conveyor()
+            ctrl.deactivate_buzzer()
+        else:
+            ctrl.stop_conveyor()
+            metrics.CONVEYOR_STOPS.labels(ctrl.line_id, "button").inc()
+        metrics.BUTTON_PRESSES.labels(ctrl.line_id, button).inc()
+        event = {"type": "button", "line": ctrl.line_id, "button": button, "pin": pin, "ts": ts_ns / 1e9}
+        for loop, events in self._subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, events, event)
+            except RuntimeError:
+                self.unsubscribe(events)  # loop closed
+
+    def subscribe(self, maxsize: int = 64) -> asyncio.Queue:
+        """Button presses as {"type": "button", line, button, pin, ts (unix seconds, kernel edge time)}."""
+        events = asyncio.Queue(maxsize)
+        # replaced, never mutated: the alert thread iterates it without a lock
+        self._subscribers = self._subscribers | {(asyncio.get_running_loop(), events)}
+        return events
+
+    def unsubscribe(self, events: asyncio.Queue):
+        self._subscribers = frozenset(s for s in self._subscribers if s[1] is not events)
+
+
+def _offer(events: asyncio.Queue, event: dict):
+    if not events.full():
+        events.put_nowait(event)
+
+
+_service = None
+
+
+def get_gpio_service() -> GpioService:
+    """The process-wide GPIO service: opens the chip on first use."""
+    global _service
+    if _service is None:
+        _service = GpioService()
+    return _service
+
+
+def close_gpio_service():
+    global _service
+    if _service is not None:
+        _service.close()
+        _service = None
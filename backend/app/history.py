@@ -0,0 +1,598 @@
+# app/history.py
+"""
+Count history in SQLite (WAL mode), replacing the append-only reports.csv.
+
+    reports / report_buckets  one row per /save_report, one child row per bucket
+                              (so a change in bucket count cannot shift columns)
+    fills                     a bucket reaching its set value, or emptied on reset
+    stops                     the belt stopped for a full bucket: predicted vs actual
+                              overfill, to calibrate the predictive stop
+    throughput                nuts per line, bucket and minute (rollup)
+
+Shift summaries are computed from the minute rollups (SHIFT_STARTS).
+
+Like the bucket store, the hot path only queues: a writer thread commits
+everything queued in one transaction every `flush_interval` seconds (at once
+for reports). Counted nuts are summed per minute in memory first, so a busy
+minute is one upsert per bucket, not one insert per nut.
+"""
+import csv
+import io
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from app import config, metrics
+
+HISTORY_DB = Path(config.HISTORY_DB)
+LEGACY_REPORTS_CSV = Path(__file__).parent / "reports.csv"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY, ts REAL NOT NULL, line TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS reports_ts ON reports (ts);
+CREATE INDEX IF NOT EXISTS reports_line_ts ON reports (line, ts);
+CREATE TABLE IF NOT EXISTS report_buckets (
+    report_id INTEGER NOT NULL REFERENCES reports (id), bucket INTEGER NOT NULL,
+    set_value INTEGER, count INTEGER NOT NULL, PRIMARY KEY (report_id, bucket)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fills (
+    id INTEGER PRIMARY KEY, ts REAL NOT NULL, line TEXT NOT NULL, bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL, set_value INTEGER, kind TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS fills_ts ON fills (ts);
+CREATE INDEX IF NOT EXISTS fills_line_ts ON fills (line, ts);
+CREATE TABLE IF NOT EXISTS stops (
+    id INTEGER PRIMARY KEY, ts REAL NOT NULL, line TEXT NOT NULL, bucket INTEGER NOT NULL, mode TEXT NOT NULL,
+    set_value INTEGER NOT NULL, count INTEGER NOT NULL, in_flight INTEGER NOT NULL, latency REAL NOT NULL,
+    predicted INTEGER NOT NULL, actual INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS stops_ts ON stops (ts);
+CREATE TABLE IF NOT EXISTS throughput (
+    line TEXT NOT NULL, minute INTEGER NOT NULL, bucket INTEGER NOT NULL, nuts INTEGER NOT NULL,
+    PRIMARY KEY (line, minute, bucket)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS throughput_minute ON throughput (minute);
+"""
+
+RESOLUTIONS = {"minute": 1, "hour": 60, "day": 1440}  # in minutes
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path), timeout=10.0, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL: a power cut can lose the last commits, never corrupt the file
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def parse_time(value):
+    """Unix seconds from a number, a numeric string or an ISO 8601 date/time (local time if naive)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts).isoformat(sep=" ", timespec="seconds")
+
+
+def shift_windows(start: float, end: float, starts=None):
+    """(shift start, shift end) pairs in unix seconds covering start..end, from 'HH:MM' shift start times."""
+    starts = sorted(starts or config.SHIFT_STARTS)
+    day = datetime.fromtimestamp(start).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    bounds = []
+    while not bounds or bounds[-1] < end:
+        for hhmm in starts:
+            h, m = (int(v) for v in hhmm.split(":"))
+            bounds.append(day.replace(hour=h, minute=m).timestamp())
+        day += timedelta(days=1)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > start and a < end]
+
+
+def _legacy_report(row: list, header: list, first: int):
+    """(ts, line, [(bucket, count), ...]) from a reports.csv row; ValueError if malformed."""
+    ts = datetime.fromisoformat(row[0]).timestamp()
+    line = row[1] if first == 2 else "default"
+    buckets = []
+    for i, value in enumerate(row[first:], start=first):
+        if value == "":
+            continue
+        # bucketN_count from the header, or by position where the row outgrew it
+        name = header[i] if i < len(header) else ""
+        bucket = int(name[6:-6]) if name.startswith("bucket") and name.endswith("_count") else i - first + 1
+        buckets.append((bucket, int(value)))
+    return ts, line, buckets
+
+
+class HistoryStore:
+    """Write-behind SQLite history: record_* on the hot path, queries from any thread."""
+
+    def __init__(self, path: Path = HISTORY_DB, flush_interval: float = 1.0):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self._counts = {}   # (line, minute, bucket) -> nuts not yet written
+        self._fills = []
+        self._stops = []
+        self._reports = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = connect(self.path)
+        self._conn.executescript(SCHEMA)
+        self._import_legacy_csv(LEGACY_REPORTS_CSV)
+
+    # ─── hot path ────────────────────────────────────────────────
+    def record_count(self, line: str, bucket: int, delta: int, ts: float = None):
+        """Nuts attributed to a bucket. Cheap: summed in memory, written by the writer thread."""
+        key = (line, int((ts or time.time()) // 60), int(bucket))
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + int(delta)
+        self._ensure_thread()
+
+    def record_fill(self, line: str, bucket: int, count: int, set_value: int, kind: str = "filled", ts: float = None):
+        """A bucket reached its set value ("filled") or was emptied ("reset")."""
+        with self._lock:
+            self._fills.append((ts or time.time(), line, int(bucket), int(count), set_value, kind))
+        self._ensure_thread()
+
+    def record_stop(self, line: str, bucket: int, mode: str, set_value: int, count: int, in_flight: int,
+                    latency: float, actual: int, ts: float = None):
+        """
+        The belt stopped for a full bucket at `count` nuts with `in_flight`
+        forecast to arrive within `latency` seconds; `actual` nuts over the
+        set value once it settled. ts: time of the stop.
+        """
+        predicted = int(count) + int(in_flight) - int(set_value)
+        with self._lock:
+            self._stops.append((ts or time.time(), line, int(bucket), mode, int(set_value), int(count),
+                                int(in_flight), float(latency), predicted, int(actual)))
+        self._ensure_thread()
+
+    def record_report(self, line: str, buckets, ts: float = None):
+        """Operator report: buckets is [(id, set_value, count), ...]. Written within milliseconds."""
+        with self._lock:
+            self._reports.append((ts or time.time(), line, [tuple(int(v) for v in b) for b in buckets]))
+        self._ensure_thread()
+        self._wake.set()
+
+    # ─── writer thread ───────────────────────────────────────────
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("Error writing count history:", e)
+
+    def flush(self):
+        """
+        Write everything queued, in one transaction. When it returns, everything
+        recorded before the call is committed (a write already under way on the
+        writer thread is waited for), or it raises and the batch stays queued.
+        """
+        with self._write_lock:
+            with self._lock:
+                counts, self._counts = self._counts, {}
+                fills, self._fills = self._fills, []
+                stops, self._stops = self._stops, []
+                reports, self._reports = self._reports, []
+            if not (counts or fills or stops or reports):
+                return
+            t0 = time.perf_counter()
+            try:
+                self._write(counts, fills, stops, reports)
+            except Exception:
+                # the transaction rolled back: put the batch back, ahead of what was recorded meanwhile
+                with self._lock:
+                    for key, n in counts.items():
+                        self._counts[key] = self._counts.get(key, 0) + n
+                    self._fills[:0] = fills
+                    self._stops[:0] = stops
+                    self._reports[:0] = reports
+                raise
+        metrics.HISTORY_WRITE_SECONDS.observe(time.perf_counter() - t0)
+
+    def _write(self, counts: dict, fills: list, stops: list, reports: list):
+        with self._conn:
+            if counts:
+                self._conn.executemany(
+                    "INSERT INTO throughput (line, minute, bucket, nuts) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (line, minute, bucket) DO UPDATE SET nuts = nuts + excluded.nuts",
+                    [(line, minute, bucket, n) for (line, minute, bucket), n in counts.items()])
+            if fills:
+                self._conn.executemany(
+                    "INSERT INTO fills (ts, line, bucket, count, set_value, kind) VALUES (?, ?, ?, ?, ?, ?)", fills)
+            if stops:
+                self._conn.executemany(
+                    "INSERT INTO stops (ts, line, bucket, mode, set_value, count, in_flight, latency, predicted, actual) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", stops)
+            for ts, line, buckets in reports:
+                report_id = self._conn.execute("INSERT INTO reports (ts, line) VALUES (?, ?)", (ts, line)).lastrowid
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO report_buckets (report_id, bucket, set_value, count) VALUES (?, ?, ?, ?)",
+                    [(report_id, b, set_value, count) for b, set_value, count in buckets])
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            print("Error writing count history on close:", e)
+
+    # ─── migration ───────────────────────────────────────────────
+    def _import_legacy_csv(self, path: Path):
+        """
+        Load the old reports.csv once, so its rows stay in the history and
+        exports. A malformed row is skipped (and logged), the rest still go in;
+        a file that cannot be read is left for the next start.
+        """
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_csv_imported'").fetchone():
+            return
+        reports, skipped = [], 0
+        if path.exists():
+            try:
+                with path.open(newline="") as f:
+                    rows = list(csv.reader(f))
+            except (OSError, UnicodeDecodeError, csv.Error) as e:
+                print(f"Error reading {path}, not imported into history:", e)
+                return
+            header = rows[0] if rows else []
+            # exports from this store (emailed as reports.csv) also carry the line
+            first = 2 if header[1:2] == ["line"] else 1
+            for n, row in enumerate(rows[1:], start=2):
+                if not row:
+                    continue
+                try:
+                    reports.append(_legacy_report(row, header, first))
+                except (ValueError, IndexError) as e:
+                    skipped += 1
+                    print(f"Skipping {path} line {n}:", e)
+        with self._conn:
+            for ts, line, buckets in reports:
+                report_id = self._conn.execute("INSERT INTO reports (ts, line) VALUES (?, ?)", (ts, line)).lastrowid
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO report_buckets (report_id, bucket, set_value, count) VALUES (?, ?, ?, ?)",
+                    [(report_id, bucket, None, count) for bucket, count in buckets])
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_csv_imported', ?)", (str(len(reports)),))
+        if reports or skipped:
+            print(f"Imported {len(reports)} reports from {path}" + (f", skipped {skipped} malformed" if skipped else ""))
+
+    # ─── meta ────────────────────────────────────────────────────
+    def meta(self, key: str, default: str = None) -> str:
+        conn = self._reader()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value):
+        with self._write_lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # ─── queries ─────────────────────────────────────────────────
+    def _reader(self) -> sqlite3.Connection:
+        """A connection of its own per query: WAL readers never block the writer."""
+        return connect(self.path)
+
+    @staticmethod
+    def _range(where: list, args: list, column: str, start, end, line, line_column: str = "line"):
+        if start is not None:
+            where.append(f"{column} >= ?")
+            args.append(start)
+        if end is not None:
+            where.append(f"{column} < ?")
+            args.append(end)
+        if line:
+            where.append(f"{line_column} = ?")
+            args.append(line)
+
+    def reports(self, start=None, end=None, line=None, limit: int = 100, after: int = None):
+        """One page of reports, oldest first. Returns (items, cursor of the next page or None)."""
+        where, args = [], []
+        self._range(where, args, "ts", start, end, line)
+        if after is not None:
+            where.append("id > ?")
+            args.append(after)
+        sql = "SELECT id, ts, line FROM reports" + (" WHERE " + " AND ".join(where) if where else "")
+        conn = self._reader()
+        try:
+            rows = conn.execute(sql + " ORDER BY id LIMIT ?", args + [limit + 1]).fetchall()
+            page = rows[:limit]
+            buckets = {}
+            if page:
+                marks = ",".join("?" * len(page))
+                for report_id, bucket, set_value, count in conn.execute(
+                        f"SELECT report_id, bucket, set_value, count FROM report_buckets "
+                        f"WHERE report_id IN ({marks}) ORDER BY report_id, bucket", [r[0] for r in page]):
+                    buckets.setdefault(report_id, []).append({"id": bucket, "set_value": set_value, "count": count})
+        finally:
+            conn.close()
+        items = [{"id": i, "timestamp": iso(ts), "line": ln, "buckets": buckets.get(i, [])} for i, ts, ln in page]
+        return items, (page[-1][0] if len(rows) > limit else None)
+
+    def last_report_id(self) -> int:
+        """Id of the newest written report (0 if none); ids only grow."""
+        conn = self._reader()
+        try:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM reports").fetchone()[0]
+        finally:
+            conn.close()
+
+    def report_summary(self, after: int, until: int) -> list:
+        """
+        Per line, reports with after < id <= until: how many, first and last
+        time, and the buckets of the latest one.
+        """
+        conn = self._reader()
+        try:
+            summary = []
+            for ln, n, first, last, latest in conn.execute(
+                    "SELECT line, COUNT(*), MIN(ts), MAX(ts), MAX(id) FROM reports "
+                    "WHERE id > ? AND id <= ? GROUP BY line ORDER BY line", (after, until)).fetchall():
+                buckets = conn.execute("SELECT bucket, count FROM report_buckets WHERE report_id = ? "
+                                       "ORDER BY bucket", (latest,)).fetchall()
+                summary.append({"line": ln, "reports": n, "first": iso(first), "last": iso(last),
+                                "buckets": dict(buckets)})
+        finally:
+            conn.close()
+        return summary
+
+    def fills(self, start=None, end=None, line=None, limit: int = 100, after: int = None):
+        where, args = [], []
+        self._range(where, args, "ts", start, end, line)
+        if after is not None:
+            where.append("id > ?")
+            args.append(after)
+        sql = ("SELECT id, ts, line, bucket, count, set_value, kind FROM fills"
+               + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id LIMIT ?")
+        conn = self._reader()
+        try:
+            rows = conn.execute(sql, args + [limit + 1]).fetchall()
+        finally:
+            conn.close()
+        page = rows[:limit]
+        items = [{"id": r[0], "timestamp": iso(r[1]), "line": r[2], "bucket": r[3], "count": r[4],
+                  "set_value": r[5], "kind": r[6]} for r in page]
+        return items, (page[-1][0] if len(rows) > limit else None)
+
+    def stops(self, start=None, end=None, line=None, limit: int = 100, after: int = None):
+        where, args = [], []
+        self._range(where, args, "ts", start, end, line)
+        if after is not None:
+            where.append("id > ?")
+            args.append(after)
+        sql = ("SELECT id, ts, line, bucket, mode, set_value, count, in_flight, latency, predicted, actual FROM stops"
+               + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id LIMIT ?")
+        conn = self._reader()
+        try:
+            rows = conn.execute(sql, args + [limit + 1]).fetchall()
+        finally:
+            conn.close()
+        page = rows[:limit]
+        items = [{"id": r[0], "timestamp": iso(r[1]), "line": r[2], "bucket": r[3], "mode": r[4], "set_value": r[5],
+                  "count": r[6], "in_flight": r[7], "latency": r[8], "predicted": r[9], "actual": r[10]}
+                 for r in page]
+        return items, (page[-1][0] if len(rows) > limit else None)
+
+    def stop_calibration(self, start=None, end=None, line=None) -> list:
+        """
+        Per line and stop mode: stops, mean actual overfill, and the forecast
+        error (actual - predicted) as mean (bias) and mean absolute. A positive
+        bias means more nuts arrive than forecast: raise the line's stop_coast_s.
+        """
+        where, args = [], []
+        self._range(where, args, "ts", start, end, line)
+        conn = self._reader()
+        try:
+            rows = conn.execute(
+                "SELECT line, mode, COUNT(*), AVG(actual), AVG(actual - predicted), AVG(ABS(actual - predicted)), "
+                "AVG(latency) FROM stops" + (" WHERE " + " AND ".join(where) if where else "")
+                + " GROUP BY line, mode ORDER BY line, mode", args).fetchall()
+        finally:
+            conn.close()
+        return [{"line": ln, "mode": mode, "stops": n, "mean_overfill": round(overfill, 2), "bias": round(bias, 2),
+                 "mean_abs_error": round(abs_error, 2), "mean_latency": round(latency, 4)}
+                for ln, mode, n, overfill, bias, abs_error, latency in rows]
+
+    def _throughput_query(self, start, end, line, bucket, resolution: str):
+        step = RESOLUTIONS[resolution]
+        where, args = [], []
+        self._range(where, args, "minute", None if start is None else int(start // 60),
+                    None if end is None else int(-(-end // 60)), line)
+        if bucket is not None:
+            where.append("bucket = ?")
+            args.append(bucket)
+        period = f"(minute / {step}) * {step}" if step > 1 else "minute"
+        sql = (f"SELECT {period} AS period, line, SUM(nuts) FROM throughput"
+               + (" WHERE " + " AND ".join(where) if where else "") + " GROUP BY period, line")
+        return sql, args
+
+    def throughput(self, start=None, end=None, line=None, bucket=None, resolution: str = "minute",
+                   limit: int = 500, after: str = None):
+        """Nuts per period and line. Cursor: 'period:line' of the last row."""
+        sql, args = self._throughput_query(start, end, line, bucket, resolution)
+        having = ""
+        if after:
+            period, _, after_line = after.partition(":")
+            having = " HAVING (period, line) > (?, ?)"
+            args += [int(period), after_line]
+        conn = self._reader()
+        try:
+            rows = conn.execute(sql + having + " ORDER BY period, line LIMIT ?", args + [limit + 1]).fetchall()
+        finally:
+            conn.close()
+        page = rows[:limit]
+        items = [{"period": iso(p * 60), "line": ln, "nuts": n} for p, ln, n in page]
+        return items, (f"{page[-1][0]}:{page[-1][1]}" if len(rows) > limit else None)
+
+    def shifts(self, start: float, end: float, line=None):
+        """Per shift (SHIFT_STARTS) and line: nuts counted, per bucket, and buckets filled."""
+        conn = self._reader()
+        summaries = []
+        try:
+            for a, b in shift_windows(start, end):
+                where, args = [], []
+                self._range(where, args, "minute", int(a // 60), int(b // 60), line)
+                per_line = {}
+                for ln, bucket, nuts in conn.execute(
+                        "SELECT line, bucket, SUM(nuts) FROM throughput WHERE " + " AND ".join(where)
+                        + " GROUP BY line, bucket ORDER BY line, bucket", args):
+                    s = per_line.setdefault(ln, {"nuts": 0, "buckets": {}, "filled": 0})
+                    s["nuts"] += nuts
+                    s["buckets"][bucket] = nuts
+                where, args = [], []
+                self._range(where, args, "ts", a, b, line)
+                for ln, filled in conn.execute(
+                        "SELECT line, COUNT(*) FROM fills WHERE kind = 'filled' AND " + " AND ".join(where)
+                        + " GROUP BY line", args):
+                    per_line.setdefault(ln, {"nuts": 0, "buckets": {}, "filled": 0})["filled"] = filled
+                for ln, s in sorted(per_line.items()):
+                    summaries.append({"start": iso(a), "end": iso(b), "line": ln, **s})
+        finally:
+            conn.close()
+        return summaries
+
+    # ─── CSV export ──────────────────────────────────────────────
+    def count(self, kind: str = "reports", start=None, end=None, line=None) -> int:
+        """Data rows iter_csv(kind, ...) will produce (for export progress)."""
+        if kind == "throughput":
+            sql, args = self._throughput_query(start, end, line, None, "minute")
+            sql = f"SELECT COUNT(*) FROM ({sql})"
+        elif kind in ("reports", "fills", "stops"):
+            where, args = [], []
+            self._range(where, args, "ts", start, end, line)
+            sql = f"SELECT COUNT(*) FROM {kind}" + (" WHERE " + " AND ".join(where) if where else "")
+        else:
+            raise ValueError(f"unknown history table {kind!r}")
+        conn = self._reader()
+        try:
+            return conn.execute(sql, args).fetchone()[0]
+        finally:
+            conn.close()
+
+    def iter_csv(self, kind: str = "reports", start=None, end=None, line=None, chunk: int = 500, ids=None):
+        """
+        CSV text in pieces of about `chunk` rows, read through a cursor: memory
+        stays flat however long the history. Reports are one row each:
+        timestamp, line, bucket1_count … bucketN_count over every bucket in range.
+        `ids` = (after, until) limits reports / fills / stops to after < id <= until.
+        """
+        if kind not in ("reports", "fills", "stops", "throughput"):
+            raise ValueError(f"unknown history table {kind!r}")
+        if ids is not None and kind == "throughput":
+            raise ValueError("throughput rows have no ids")
+        conn = self._reader()
+        try:
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            args = (conn, writer, start, end, line) + ((ids,) if ids is not None else ())
+            rows = getattr(self, f"_csv_{kind}")(*args)
+            n = 0
+            for row in rows:
+                writer.writerow(row)
+                n += 1
+                if n >= chunk:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+                    n = 0
+            yield buf.getvalue()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _ids(where: list, args: list, column: str, ids):
+        if ids is not None:
+            where.append(f"{column} > ? AND {column} <= ?")
+            args.extend(ids)
+
+    def _csv_reports(self, conn, writer, start, end, line, ids=None):
+        where, args = [], []
+        self._range(where, args, "r.ts", start, end, line, line_column="r.line")
+        self._ids(where, args, "r.id", ids)
+        cond = " WHERE " + " AND ".join(where) if where else ""
+        ids = [b for (b,) in conn.execute(
+            "SELECT DISTINCT b.bucket FROM reports r JOIN report_buckets b ON b.report_id = r.id"
+            + cond + " ORDER BY b.bucket", args)]
+        column = {b: 2 + i for i, b in enumerate(ids)}
+        writer.writerow(["timestamp", "line"] + [f"bucket{b}_count" for b in ids])
+        current, row = None, None
+        for report_id, ts, ln, bucket, count in conn.execute(
+                "SELECT r.id, r.ts, r.line, b.bucket, b.count FROM reports r "
+                "LEFT JOIN report_buckets b ON b.report_id = r.id" + cond + " ORDER BY r.id, b.bucket", args):
+            if report_id != current:
+                if row is not None:
+                    yield row
+                current, row = report_id, [iso(ts), ln] + [""] * len(ids)
+            if bucket is not None:
+                row[column[bucket]] = count
+        if row is not None:
+            yield row
+
+    def _csv_fills(self, conn, writer, start, end, line, ids=None):
+        where, args = [], []
+        self._range(where, args, "ts", start, end, line)
+        self._ids(where, args, "id", ids)
+        writer.writerow(["timestamp", "line", "bucket", "count", "set_value", "kind"])
+        for ts, *rest in conn.execute("SELECT ts, line, bucket, count, set_value, kind FROM fills"
+                                      + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id", args):
+            yield [iso(ts)] + rest
+
+    def _csv_stops(self, conn, writer, start, end, line, ids=None):
+        where, args = [], []
+        self._range(where, args, "ts", start, end, line)
+        self._ids(where, args, "id", ids)
+        columns = ["line", "bucket", "mode", "set_value", "count", "in_flight", "latency", "predicted", "actual"]
+        writer.writerow(["timestamp"] + columns)
+        for ts, *rest in conn.execute(f"SELECT ts, {', '.join(columns)} FROM stops"
+                                      + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id", args):
+            yield [iso(ts)] + rest
+
+    def _csv_throughput(self, conn, writer, start, end, line):
+        sql, args = self._throughput_query(start, end, line, None, "minute")
+        writer.writerow(["minute", "line", "nuts"])
+        for minute, ln, nuts in conn.execute(sql + " ORDER BY period, line", args):
+            yield [iso(minute * 60), ln, nuts]
+
+    def write_csv(self, path: Path, kind: str = "reports", **query) -> Path:
+        """Everything queued so far, exported to a CSV file (e.g. an email attachment)."""
+        self.flush()
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            for text in self.iter_csv(kind, **query):
+                f.write(text)
+        return path
+
+
+_history = None
+
+
+def get_history() -> HistoryStore:
+    """The process-wide history store, opened on first use."""
+    global _history
+    if _history is None:
+        _history = HistoryStore(HISTORY_DB, flush_interval=config.HISTORY_FLUSH_INTERVAL)
+    return _history
+
+
+def close_history():
+    if _history is not None:
+        _history.close()
@@ -0,0 +1,107 @@
+# app/history_api.py
+import time
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.history import RESOLUTIONS, get_history, parse_time
+
+router = APIRouter()
+
+
+def _range(start, end):
+    """start/end query parameters: unix seconds or ISO 8601 (local time)."""
+    try:
+        return parse_time(start), parse_time(end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {e}")
+
+
+def _cursor(after: Optional[str]):
+    if after is None:
+        return None
+    if not after.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return int(after)
+
+
+def _throughput_cursor(after: Optional[str]):
+    """'period:line' as returned in `next` by /history/throughput."""
+    if after is None:
+        return None
+    period, sep, _ = after.partition(":")
+    if not sep or not period.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+
+@router.get("/history/reports")
+def history_reports(start: str = None, end: str = None, line: str = None,
+                    limit: int = Query(100, ge=1, le=1000), after: str = None):
+    """Saved reports, oldest first. Pass `next` back as `after` for the following page."""
+    start, end = _range(start, end)
+    items, cursor = get_history().reports(start, end, line, limit, _cursor(after))
+    return {"items": items, "next": cursor}
+
+
+@router.get("/history/fills")
+def history_fills(start: str = None, end: str = None, line: str = None,
+                  limit: int = Query(100, ge=1, le=1000), after: str = None):
+    """Buckets reaching their set value ("filled") and emptied on reset ("reset"), oldest first."""
+    start, end = _range(start, end)
+    items, cursor = get_history().fills(start, end, line, limit, _cursor(after))
+    return {"items": items, "next": cursor}
+
+
+@router.get("/history/stops")
+def history_stops(start: str = None, end: str = None, line: str = None,
+                  limit: int = Query(100, ge=1, le=1000), after: str = None):
+    """
+    Conveyor stops for full buckets, oldest first: count and nuts forecast in
+    flight at the stop, predicted and actual overfill. `calibration` sums up
+    the forecast error over the range, per line and stop mode.
+    """
+    start, end = _range(start, end)
+    history = get_history()
+    items, cursor = history.stops(start, end, line, limit, _cursor(after))
+    return {"items": items, "next": cursor, "calibration": history.stop_calibration(start, end, line)}
+
+
+@router.get("/history/throughput")
+def history_throughput(start: str = None, end: str = None, line: str = None, bucket: int = None,
+                       resolution: str = "minute", limit: int = Query(500, ge=1, le=5000), after: str = None):
+    """Nuts counted per minute / hour / day and line."""
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {tuple(RESOLUTIONS)}")
+    start, end = _range(start, end)
+    items, cursor = get_history().throughput(start, end, line, bucket, resolution, limit, _throughput_cursor(after))
+    return {"items": items, "next": cursor}
+
+
+@router.get("/history/shifts")
+def history_shifts(start: str = None, end: str = None, line: str = None):
+    """Shift summaries (SHIFT_STARTS): nuts per line and bucket, buckets filled. Default: the last 7 days."""
+    start, end = _range(start, end)
+    if end is None:
+        end = time.time()
+    if start is None:
+        start = end - 7 * 86400
+    if end - start > 366 * 86400:
+        raise HTTPException(status_code=400, detail="Range too long, at most one year")
+    return {"items": get_history().shifts(start, end, line)}
+
+
+@router.get("/history/export.csv")
+def history_export(table: str = "reports", start: str = None, end: str = None, line: str = None):
+    """Stream a history table as CSV, read in chunks (no temporary file, flat memory)."""
+    if table not in ("reports", "fills", "stops", "throughput"):
+        raise HTTPException(status_code=400, detail="table must be reports, fills, stops or throughput")
+    start, end = _range(start, end)
+    history = get_history()
+    history.flush()  # include what is still queued
+    return StreamingResponse(
+        history.iter_csv(table, start, end, line),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{table}_{time.strftime("%Y%m%d-%H%M%S")}.csv"'},
+    )
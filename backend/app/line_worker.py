@@ -0,0 +1,298 @@
+# app/line_worker.py
+"""
+One counting line's capture -> detector -> tracker in its own process.
+
+Several conveyors on one Pi/NUC each need a full core for the watershed;
+threads would share one GIL. The worker only counts: buckets, GPIO and the
+WebSocket clients stay in the server process, so a crashed or stalled worker
+can never hold the relay, and the engine treats it like any other source
+that ended.
+
+    worker:  capture thread -> count_frame -> results queue
+    server:  receive thread (ProcessPipeline) -> asyncio -> CountingEngine
+
+Frames only cross the process boundary while someone is watching the line
+(`preview`); otherwise a result is just the count and a few timings.
+"""
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import traceback
+
+from app import config, metrics
+from app.detection import set_color_lut
+from app.models import LineConfig
+from app.pipeline import DropOldestQueue, FramePipeline
+from app.roi import Roi
+from app.timing import LapTimer
+
+# spawn, not fork: the server process has an event loop, camera and GPIO handles
+_CTX = mp.get_context("spawn")
+_END = "end"
+
+
+def _apply_commands(streamer, commands):
+    while True:
+        try:
+            cmd = commands.get_nowait()
+        except queue.Empty:
+            return
+        if cmd[0] == "reset":
+            streamer.reset()
+        elif cmd[0] == "roi":
+            streamer.set_roi(Roi.from_dict(cmd[1]))
+        elif cmd[0] == "color_lut":
+            set_color_lut(None)  # recalibrated: load the new table from disk
+
+
+def _run_line(line: dict, roi: dict, results, commands, preview, stop, retries: int, delay: float):
+    """Worker process entry point."""
+    from app.counting import counter_from_config
+    from app.video_streamer import VideoStreamer, detector_from_config
+
+    streamer = None
+    try:
+        roi = Roi.from_dict(roi)
+        streamer = VideoStreamer(source=line["source"], roi=roi, detector=detector_from_config(line["detector"]),
+                                 line_id=line["id"],
+                                 counter=counter_from_config(roi.trigger_line_y, LineConfig(**line), roi.frame_w))
+        ok = streamer.open(retries, delay)
+        results.put(("opened", ok))
+        if not ok:
+            return
+        timer = LapTimer()
+        streamer.timer = timer
+        block = not streamer.is_live
+        raw_frames = DropOldestQueue(2)
+        capture_stop = threading.Event()
+
+        def capture_loop():
+            try:
+                while not (stop.is_set() or capture_stop.is_set()):
+                    t0 = time.perf_counter()
+                    raw_frame = streamer.grab_frame()
+                    if raw_frame is None:
+                        break
+                    raw_frames.put((raw_frame, streamer.take_jpeg(), time.perf_counter() - t0),
+                                   block=block, stop_event=capture_stop)
+            except Exception as e:
+                print(f"[line {line['id']}] Error in capture thread:", e)
+            finally:
+                raw_frames.put(None, block=True, stop_event=capture_stop)
+
+        capture = threading.Thread(target=capture_loop, name="line-capture", daemon=True)
+        capture.start()
+        dropped = 0
+        try:
+            while not stop.is_set():
+                _apply_commands(streamer, commands)
+                try:
+                    item = raw_frames.get(timeout=0.1)
+                except TimeoutError:
+                    continue
+                if item is None:
+                    break
+                raw_frame, jpeg, capture_s = item
+                timer.start()
+                count, frame, overlay = streamer.count_frame(raw_frame)
+                samples = timer.samples
+                # frames the motion gate skipped have no detection/tracking laps
+                stats = (capture_s, samples["detection"][-1] if "detection" in samples else None,
+                         samples["tracking"][-1] if "tracking" in samples else None,
+                         samples["motion_gate"][-1] if "motion_gate" in samples else None,
+                         streamer.saved_seconds, streamer.tracker.live_tracks, raw_frames.dropped + dropped,
+                         streamer.camera.fps, streamer.crossings, streamer.counter.tracked_ids, streamer.arrivals)
+                timer.clear()
+                if not preview.value:
+                    frame = overlay = jpeg = None
+                try:
+                    # recorded files: every result, in order; cameras: drop rather than lag
+                    results.put(("frame", count, frame, overlay, jpeg, stats), block=block, timeout=1.0 if block else None)
+                except queue.Full:
+                    dropped += 1
+        finally:
+            capture_stop.set()
+            raw_frames.clear()
+            capture.join(2.0)
+    except Exception as e:
+        print(f"[line {line['id']}] worker error:", e)
+        traceback.print_exc()
+    finally:
+        if streamer is not None:
+            streamer.release()
+        try:
+            results.put((_END,), timeout=1.0)
+        except queue.Full:
+            pass
+
+
+class LineProcess:
+    """
+    Server-side handle on a line's worker process. Stands in for VideoStreamer
+    in CountingEngine: open / release / reset / set_roi / roi / is_live.
+    """
+
+    def __init__(self, line: LineConfig, roi: Roi, result_depth: int = 4):
+        self.line = line
+        self.source = line.source
+        self.roi = roi
+        self.result_depth = result_depth
+        self.results = None
+        self._commands = None
+        self._stop = None
+        self._proc = None
+        self._preview = _CTX.Value("b", 0, lock=False)
+
+    @property
+    def is_live(self) -> bool:
+        return not (isinstance(self.source, str) and os.path.isfile(self.source)) or config.CAMERA_LOOP
+
+    @property
+    def trigger_line_y(self) -> int:
+        return self.roi.trigger_line_y
+
+    @property
+    def preview(self) -> bool:
+        return bool(self._preview.value)
+
+    @preview.setter
+    def preview(self, on: bool):
+        self._preview.value = 1 if on else 0
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.is_alive()
+
+    def open(self, retries: int = 3, delay: float = 0.2) -> bool:
+        """Start the worker and wait until it has read a first frame. Blocking: call via asyncio.to_thread."""
+        self.release()
+        self.results = _CTX.Queue(self.result_depth)
+        self._commands = _CTX.Queue()
+        self._stop = _CTX.Event()
+        self._proc = _CTX.Process(
+            target=_run_line,
+            args=(self.line.model_dump(), self.roi.to_dict(), self.results, self._commands,
+                  self._preview, self._stop, retries, delay),
+            name=f"line-{self.line.id}",
+            daemon=True,
+        )
+        self._proc.start()
+        # the child pays for its own imports (cv2, detector) before the camera opens
+        deadline = time.monotonic() + 30.0 + retries * (delay + 5.0)
+        while time.monotonic() < deadline:
+            try:
+                msg = self.results.get(timeout=0.5)
+            except queue.Empty:
+                if not self._proc.is_alive():
+                    break
+                continue
+            if msg[0] == "opened":
+                if msg[1]:
+                    return True
+                break
+        self.release()
+        return False
+
+    def _send(self, *cmd):
+        if self.alive:
+            self._commands.put(cmd)
+
+    def reset(self):
+        # a stopped line starts from zero anyway: the next worker is a fresh process
+        self._send("reset")
+
+    def set_roi(self, roi: Roi):
+        self.roi = roi
+        self._send("roi", roi.to_dict())
+
+    def reload_color_lut(self):
+        self._send("color_lut")
+
+    def release(self):
+        if self._proc is None:
+            return
+        self._stop.set()
+        self._proc.join(3.0)
+        if self._proc.is_alive():
+            self._proc.terminate()
+            self._proc.join(1.0)
+        for q in (self.results, self._commands):
+            q.cancel_join_thread()
+            q.close()
+        self._proc = None
+        print(f"Released line {self.line.id} worker.")
+
+    close = release
+
+
+class ProcessPipeline(FramePipeline):
+    """
+    FramePipeline over a LineProcess: one thread receives the worker's results
+    and hands them to the event loop, with the same get() / update_metrics()
+    and bounded, drop-oldest output as the threaded pipeline.
+    """
+
+    def __init__(self, line: LineProcess, loop, output_depth: int = 2):
+        super().__init__(line, loop, output_depth=output_depth, line_id=line.line.id)
+        self.dropped_ipc = 0
+        line_id = line.line.id
+        self._live_tracks = metrics.LIVE_TRACKS.labels(line_id)
+        self._frames_processed = metrics.FRAMES_PROCESSED.labels(line_id)
+        self._frames_skipped = metrics.FRAMES_SKIPPED.labels(line_id)
+        self._seconds_saved = metrics.DETECTION_SECONDS_SAVED.labels(line_id)
+        self._camera_fps = metrics.CAMERA_FPS.labels(line_id)
+        self._tracked_ids = metrics.COUNTER_TRACKED_IDS.labels(line_id)
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._receive_loop, name=f"line-{self.streamer.line.id}-receive", daemon=True)]
+        self._threads[0].start()
+
+    def update_metrics(self):
+        super().update_metrics()
+        metrics.DROPPED_FRAMES.labels(self.line_id, "ipc").set(self.dropped_ipc)
+
+    def _receive_loop(self):
+        results = self.streamer.results
+        try:
+            while not self._stop.is_set():
+                try:
+                    msg = results.get(timeout=0.1)
+                except queue.Empty:
+                    if not self.streamer.alive:
+                        break
+                    continue
+                if msg[0] != "frame":
+                    break
+                _, count, frame, overlay, jpeg, stats = msg
+                (capture_s, detection_s, tracking_s, gate_s, saved_s, live_tracks, self.dropped_ipc, camera_fps,
+                 crossings, tracked_ids, arrivals) = stats
+                # the worker's own registry is not scraped; record its timings here
+                metrics.CAPTURE_SECONDS.observe(capture_s)
+                self._camera_fps.set(camera_fps)
+                if gate_s is not None:
+                    metrics.MOTION_GATE_SECONDS.observe(gate_s)
+                if saved_s is not None:
+                    self._frames_skipped.inc()
+                    self._seconds_saved.inc(saved_s)
+                else:
+                    metrics.DETECTION_SECONDS.observe(detection_s)
+                    metrics.TRACKING_SECONDS.observe(tracking_s)
+                    self._live_tracks.set(live_tracks)
+                    self._frames_processed.inc()
+                    self._tracked_ids.set(tracked_ids)
+                    for region_id, n in crossings.items():
+                        if n:
+                            metrics.REGION_CROSSINGS.labels(self.streamer.line.id, region_id).inc(n)
+                self._publish_threadsafe((count, frame, overlay, jpeg, arrivals))
+        except (EOFError, OSError) as e:
+            print(f"Line {self.streamer.line.id} worker went away:", e)
+        except Exception as e:
+            print("Error in line receive thread:", e)
+            traceback.print_exc()
+        finally:
+            self._publish_threadsafe(self._END)
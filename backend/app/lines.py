@@ -0,0 +1,68 @@
+# app/lines.py
+import json
+import re
+from pathlib import Path
+
+from app import config
+from app.buckets import BUCKETS_FILE, BUCKETS_JOURNAL, DEFAULT_LINE_BUCKETS, LineBuckets
+from app.counting import region_from_dict
+from app.models import LineConfig
+from app.roi import ROI_FILE
+
+LINES_FILE = Path(config.LINES_FILE)
+DATA_DIR = Path(__file__).parent
+
+
+def load_lines(path: Path = LINES_FILE) -> list:
+    """
+    Counting lines from lines.json, e.g.
+
+        [{"id": "a", "source": 0, "relay_pin": 23, "buzzer_pin": 24},
+         {"id": "b", "source": "/dev/video2", "relay_pin": 25, "detector": "mog2"}]
+
+    Without the file: the one line described by config.py.
+    """
+    if not path.exists():
+        return [LineConfig.default()]
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if isinstance(data, dict):
+        data = data.get("lines", [])
+    lines = [LineConfig(**entry) for entry in data]
+    if not lines:
+        raise ValueError(f"{path} lists no lines")
+    ids = [line.id for line in lines]
+    for line_id in ids:
+        # used in URLs (/ws/{line_id}) and file names
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", line_id):
+            raise ValueError(f"{path}: invalid line id {line_id!r}")
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"{path}: duplicate line ids")
+    for line in lines:
+        for region in line.count_regions:
+            region_from_dict(region)  # fail at startup, not in the worker
+    relays = [line.relay_pin for line in lines]
+    if len(set(relays)) != len(relays):
+        raise ValueError(f"{path}: two lines share a relay pin")
+    return lines
+
+
+def line_files(line: LineConfig):
+    """(buckets snapshot, buckets journal, roi) paths for a line. The default line keeps the original files."""
+    if line.id == "default":
+        return BUCKETS_FILE, BUCKETS_JOURNAL, ROI_FILE
+    return (DATA_DIR / f"buckets_{line.id}.json",
+            DATA_DIR / f"buckets_{line.id}.journal",
+            DATA_DIR / f"roi_{line.id}.json")
+
+
+def line_buckets(line: LineConfig) -> LineBuckets:
+    if line.id == "default":
+        return DEFAULT_LINE_BUCKETS
+    snapshot, journal, _ = line_files(line)
+    return LineBuckets(snapshot, journal, bucket_count=line.bucket_count, set_value=line.set_value)
+
+
+def use_processes(lines: list) -> bool:
+    if config.LINE_PROCESSES == "auto":
+        return len(lines) > 1
+    return config.LINE_PROCESSES == "1"
@@ -0,0 +1,185 @@
+# app/mailer.py
+"""
+Report email queue: /save_report only notifies, one worker thread sends.
+
+The spool is the count history itself. A report is on disk (history.db) as
+soon as it is saved, and meta 'mail_sent_report_id' marks the last one
+delivered; every email carries the reports after that mark. So
+
+  - saves within MAIL_BATCH_WINDOW of the first unsent one go out as one email,
+  - a failed send is retried with backoff (MAIL_RETRY_MIN doubling up to
+    MAIL_RETRY_MAX) and picks up whatever was saved meanwhile,
+  - nothing is lost to a network outage or a restart (at worst, a power cut
+    between the send and the mark repeats one email).
+
+The attachment is only the new report rows, gzipped above MAIL_COMPRESS_OVER,
+with a per-line summary in the body. The SMTP session stays open for
+MAIL_SESSION_IDLE seconds after a send.
+"""
+import gzip
+import threading
+import time
+from datetime import datetime
+
+from app import config, metrics
+from app.email_utils import SmtpSession, build_report_email
+from app.history import HistoryStore, get_history
+
+SENT_MARK = "mail_sent_report_id"
+
+
+class ReportMailer:
+    def __init__(self, history: HistoryStore, session: SmtpSession = None, window: float = 30.0,
+                 retry_min: float = 30.0, retry_max: float = 1800.0, session_idle: float = 60.0,
+                 compress_over: int = 256 * 1024):
+        self.history = history
+        self.session = session or SmtpSession()
+        self.window = window
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.session_idle = session_idle
+        self.compress_over = compress_over
+        self.failures = 0       # consecutive failed sends
+        self.last_error = None
+        self._due = None        # time.monotonic() of the next send, None = nothing pending
+        self._notified = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        if history.meta(SENT_MARK) is None:
+            # first start: what was saved until now went out the old way
+            history.flush()
+            history.set_meta(SENT_MARK, history.last_report_id())
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.session.host)
+
+    def pending(self) -> int:
+        """Saved reports not yet delivered (written ones; a save in the last moment may still be queued)."""
+        return self.history.last_report_id() - int(self.history.meta(SENT_MARK, 0))
+
+    def start(self):
+        """Send what a previous run left unsent (after the batching window)."""
+        backlog = self.pending()
+        metrics.MAIL_SPOOLED.set(backlog)
+        if backlog:
+            print(f"{backlog} saved reports not emailed yet")
+            self.notify()
+
+    def notify(self):
+        """A report was saved: it goes out, with any others saved meanwhile, after the batching window."""
+        if not self.enabled:
+            return  # kept in the history until SMTP is configured
+        with self._lock:
+            self._notified += 1
+            if self._due is None:
+                self._due = time.monotonic() + self.window
+        self._ensure_thread()
+        self._wake.set()
+
+    # ─── worker thread ───────────────────────────────────────────
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="report-mailer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            deadlines = []
+            with self._lock:
+                if self._due is not None:
+                    deadlines.append(self._due)
+            if self.session.connected:
+                deadlines.append(self.session.last_used + self.session_idle)
+            self._wake.wait(max(0.0, min(deadlines) - now) if deadlines else None)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            now = time.monotonic()
+            if self.session.connected and now - self.session.last_used >= self.session_idle:
+                self.session.close()
+            with self._lock:
+                due = self._due
+            if due is not None and now >= due:
+                self._send_pending()
+        self.session.close()
+
+    def _send_pending(self):
+        with self._lock:
+            notified = self._notified
+        after = until = 0
+        try:
+            self.history.flush()  # reports saved a moment ago
+            after = int(self.history.meta(SENT_MARK, 0))
+            until = self.history.last_report_id()
+            if until > after:
+                t0 = time.perf_counter()
+                self.session.send(self._message(after, until))
+                metrics.MAIL_SEND_SECONDS.observe(time.perf_counter() - t0)
+                self.history.set_meta(SENT_MARK, until)
+                metrics.MAIL_SENDS.labels("sent").inc()
+                metrics.MAIL_REPORTS_SENT.inc(until - after)
+            # reports saved while sending are still spooled
+            metrics.MAIL_SPOOLED.set(self.pending())
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            delay = min(self.retry_max, self.retry_min * 2 ** (self.failures - 1))
+            with self._lock:
+                self._due = time.monotonic() + delay
+            metrics.MAIL_SENDS.labels("failed").inc()
+            metrics.MAIL_SPOOLED.set(max(0, until - after))
+            print(f"Report email failed ({e}); {max(0, until - after)} reports kept, retry in {delay:g} s")
+            return
+        self.failures = 0
+        self.last_error = None
+        with self._lock:
+            # a save that arrived while sending gets its own window
+            self._due = None if self._notified == notified else time.monotonic() + self.window
+
+    def _message(self, after: int, until: int):
+        summary = self.history.report_summary(after, until)
+        n = sum(s["reports"] for s in summary)
+        data = "".join(self.history.iter_csv("reports", ids=(after, until))).encode("utf-8")
+        filename = "reports.csv"
+        if len(data) > self.compress_over:
+            data = gzip.compress(data)
+            filename += ".gz"
+        body = [f"Please find attached the {n} new coconut count report{'s' if n != 1 else ''} ({filename})."]
+        for s in summary:
+            buckets = ", ".join(f"{b}: {c}" for b, c in s["buckets"].items())
+            body += ["", f"Line {s['line']}: {s['reports']} report(s), {s['first']} to {s['last']}",
+                     f"  latest: {sum(s['buckets'].values())} nuts ({buckets})"]
+        subject = f"Coconut Report {datetime.now():%Y-%m-%d %H:%M:%S}" + (f" ({n} reports)" if n > 1 else "")
+        return build_report_email("\n".join(body), data, filename, subject=subject)
+
+    def close(self):
+        """Stop the worker; unsent reports stay spooled for the next start."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+        self.session.close()
+
+
+_mailer = None
+
+
+def get_mailer() -> ReportMailer:
+    """The process-wide report mailer, created on first use."""
+    global _mailer
+    if _mailer is None:
+        _mailer = ReportMailer(get_history(), window=config.MAIL_BATCH_WINDOW, retry_min=config.MAIL_RETRY_MIN,
+                               retry_max=config.MAIL_RETRY_MAX, session_idle=config.MAIL_SESSION_IDLE,
+                               compress_over=config.MAIL_COMPRESS_OVER)
+    return _mailer
+
+
+def close_mailer():
+    if _mailer is not None:
+        _mailer.close()
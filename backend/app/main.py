@@ -1,22 +1,51 @@
 
+import asyncio
 import uvicorn
-from fastapi import FastAPI, BackgroundTasks
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pathlib import Path
 
 from app.websocket_handler import ws_endpoint
-from app.email_utils import send_report_email  # Function to send email with report
-from app.report_writer import write_report  # Function to write report to CSV
-from app.email_utils import send_report_email # Function to send email with report
+from app import config
+from app.metrics import REGISTRY
+from app.engine import forward_button_events, get_manager, shutdown_engine
+from app.history import close_history, get_history  # SQLite count history
+from app.mailer import close_mailer, get_mailer  # report email queue
 from app.models import ReportPayload  # Pydantic model for report payload
-from app.export_utils import router as export_router
+from app.export_utils import router as export_router, watch_usb_mounts
+from app.calibration import router as calibration_router
+from app.history_api import router as history_router
 
 
 
 # ─── fastapi setup ─────────────────────────────────────────────────
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # USB sticks coming and going are pushed to the clients
+    watch_usb_mounts(asyncio.get_running_loop())
+    # opening the history database (and a first-run reports.csv import) blocks
+    await asyncio.to_thread(get_history)
+    # reports a previous run could not email yet
+    await asyncio.to_thread(get_mailer().start)
+    # relays and buttons of every line, from boot
+    get_manager().claim_gpio()
+    buttons = asyncio.create_task(forward_button_events())
+    if config.COUNT_HEADLESS:
+        # count from boot on every line, no client needed
+        await get_manager().start_all()
+    yield
+    buttons.cancel()
+    # release the cameras, line workers and GPIO once, when the server stops
+    await shutdown_engine()
+    close_mailer()
+    close_history()
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(export_router)
+app.include_router(calibration_router)
+app.include_router(history_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,22 +57,44 @@ app.add_middleware(
 
 # ─── HTTP functions ──────────────────────────────────────────────
 @app.post("/save_report")
-async def save_report(payload: ReportPayload, background_tasks: BackgroundTasks):
+async def save_report(payload: ReportPayload):
     """
-    Accepts JSON { buckets: [ {id, set_value, count}, … ] }
-    Appends one timestamped row to reports.csv.
+    Accepts JSON { buckets: [ {id, set_value, count}, … ], line? }
+    Stores one timestamped report in the count history and queues it for email.
     """
-    report_file = Path(__file__).parent / "reports.csv"
-    write_report(payload, report_file)
-    background_tasks.add_task(send_report_email, report_file)
+    manager = get_manager()
+    line_id = payload.line or manager.default_id
+    if line_id not in manager.lines:
+        raise HTTPException(status_code=404, detail=f"Unknown line {line_id}")
+    history = get_history()
+    history.record_report(line_id, [(b.id, b.set_value, b.count) for b in payload.buckets])
+    try:
+        # only claim it is saved once it is committed
+        await asyncio.to_thread(history.flush)
+    except Exception as e:
+        print("Error saving report:", e)
+        raise HTTPException(status_code=503, detail=f"Report not saved yet, will be retried: {e}")
+    mailer = get_mailer()
+    mailer.notify()
     return {
         "status": "ok",
-        "saved_to": str(report_file),
-        "email_queued": True
+        "saved_to": str(history.path),
+        "email_queued": mailer.enabled
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint: stage timings, queue depths, counts, conveyor stops."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/lines")
+def lines():
+    """Configured counting lines; each is served at /ws/{id} (the first also at /ws)."""
+    return {"default": get_manager().default_id, "lines": get_manager().describe()}
+
 # ─── WebSocket connection handler ────────────────────────────────
 app.websocket("/ws")(ws_endpoint)
+app.websocket("/ws/{line_id}")(ws_endpoint)
 
 # ─── FastAPI application entry point ─────────────────────────────
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+# app/metrics.py
+"""
+Minimal Prometheus metrics for the frame hot path, served at GET /metrics.
+
+Kept in-house rather than pulling in prometheus_client: observe() is a
+bisect and two additions, cheap enough to call from the capture and
+processing threads on every frame. Under CPython the individual
+increments are atomic enough for monitoring; exact totals are not needed.
+"""
+import bisect
+import math
+
+# seconds; frame stages on a Pi range from ~0.1 ms (tracking) to ~100 ms (YOLO)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _labels_text(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._children = {}
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self._children.items()):
+            lines.extend(child.render(self.name, self.label_names, key))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def render(self, name, label_names, key):
+        return [f"{name}{_labels_text(label_names, key)} {self.value}"]
+
+
+class _CounterChild(_Value):
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild(_Value):
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def render(self, name, label_names, key):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else repr(bound)
+            lines.append(f"{name}_bucket{_labels_text(label_names + ('le',), key + (le,))} {cumulative}")
+        lines.append(f"{name}_sum{_labels_text(label_names, key)} {self.sum}")
+        lines.append(f"{name}_count{_labels_text(label_names, key)} {cumulative}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ─── hot-path metrics ───────────────────────────────────────────────
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "coconut_stage_seconds", "Time spent per frame in each pipeline stage.", labels=("stage",)))
+# pre-bound children so the hot path skips the label lookup
+CAPTURE_SECONDS = STAGE_SECONDS.labels("capture")
+DETECTION_SECONDS = STAGE_SECONDS.labels("detection")
+TRACKING_SECONDS = STAGE_SECONDS.labels("tracking")
+ENCODE_SECONDS = STAGE_SECONDS.labels("encode")
+SEND_SECONDS = STAGE_SECONDS.labels("send")
+MOTION_GATE_SECONDS = STAGE_SECONDS.labels("motion_gate")
+HISTORY_WRITE_SECONDS = STAGE_SECONDS.labels("history_write")  # one batched history transaction
+USB_EXPORT_SECONDS = STAGE_SECONDS.labels("usb_export")  # one whole export, write + fsync + verify
+MAIL_SEND_SECONDS = STAGE_SECONDS.labels("mail_send")  # one report email, connect/login included when needed
+
+LIVE_TRACKS = REGISTRY.register(Gauge("coconut_live_tracks", "Tracks alive in each line's SORT tracker.", labels=("line",)))
+DROPPED_FRAMES = REGISTRY.register(Gauge(
+    "coconut_dropped_frames", "Frames dropped by each line's pipeline since counting started.", labels=("line", "queue")))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "coconut_queue_depth", "Items waiting in each pipeline queue, per line.", labels=("line", "queue")))
+FRAMES_PROCESSED = REGISTRY.register(Counter(
+    "coconut_frames_processed_total", "Frames run through detection and tracking, per line.", labels=("line",)))
+FRAMES_SKIPPED = REGISTRY.register(Counter(
+    "coconut_frames_skipped_total", "Frames the motion gate let skip detection (nothing moved), per line.", labels=("line",)))
+DETECTION_SECONDS_SAVED = REGISTRY.register(Counter(
+    "coconut_detection_seconds_saved_total",
+    "Estimated detection+tracking CPU time saved by the motion gate, per line.", labels=("line",)))
+CAMERA_FPS = REGISTRY.register(Gauge(
+    "coconut_camera_fps", "Frames per second the camera actually delivers, per line.", labels=("line",)))
+PREVIEW_BYTES_SENT = REGISTRY.register(Counter(
+    "coconut_preview_bytes_sent_total", "Preview bytes sent to clients, by preview mode.", labels=("mode",)))
+PREVIEW_BYTES_COPIED = REGISTRY.register(Counter(
+    "coconut_preview_bytes_copied_total", "JPEG bytes copied to build preview messages (header framing)."))
+CLIENTS = REGISTRY.register(Gauge("coconut_clients", "Connected WebSocket clients."))
+
+BUCKET_COUNTED = REGISTRY.register(Counter(
+    "coconut_bucket_counted_total", "Coconuts attributed to each bucket (use rate() for nuts/s).", labels=("line", "bucket")))
+BUCKET_COUNT = REGISTRY.register(Gauge("coconut_bucket_count", "Current count of each bucket.", labels=("line", "bucket")))
+REGION_CROSSINGS = REGISTRY.register(Counter(
+    "coconut_region_crossings_total", "Track crossings counted per line and count region (trigger line, extra lines, zones).",
+    labels=("line", "region")))
+COUNTER_TRACKED_IDS = REGISTRY.register(Gauge(
+    "coconut_counter_tracked_ids", "Track ids the line counter holds state for.", labels=("line",)))
+USB_EXPORTS = REGISTRY.register(Counter(
+    "coconut_usb_exports_total", "USB exports by result (ok, removed, no_space, denied, verify_failed, error).",
+    labels=("result",)))
+USB_EXPORT_BYTES = REGISTRY.register(Counter("coconut_usb_export_bytes_total", "Bytes written to USB media by exports."))
+MAIL_SENDS = REGISTRY.register(Counter(
+    "coconut_mail_sends_total", "Report email attempts by result (sent, failed).", labels=("result",)))
+MAIL_REPORTS_SENT = REGISTRY.register(Counter("coconut_mail_reports_sent_total", "Saved reports delivered by email."))
+MAIL_SMTP_CONNECTS = REGISTRY.register(Counter("coconut_mail_smtp_connects_total", "SMTP sessions opened (TLS handshake + login)."))
+MAIL_SPOOLED = REGISTRY.register(Gauge("coconut_mail_spooled_reports", "Saved reports not yet delivered by email."))
+CONVEYOR_STOPS = REGISTRY.register(Counter(
+    "coconut_conveyor_stops_total", "Conveyor stop commands issued, by line and reason.", labels=("line", "reason")))
+RELAY_LATENCY = REGISTRY.register(Histogram(
+    "coconut_relay_latency_seconds", "Relay command queued to GPIO written, per line.", labels=("line",),
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)))
+GPIO_BACKEND = REGISTRY.register(Gauge(
+    "coconut_gpio_backend", "1 for the GPIO backend driving the relays (lgpio, or sim: conveyor not controlled).",
+    labels=("backend",)))
+BUTTON_PRESSES = REGISTRY.register(Counter(
+    "coconut_button_presses_total", "Physical start/stop button presses, per line.", labels=("line", "button")))
+STOP_OVERFILL = REGISTRY.register(Histogram(
+    "coconut_stop_overfill_nuts", "Nuts over the set value once the belt stopped for a full bucket, per line and stop mode.",
+    labels=("line", "mode"), buckets=(-5, -2, -1, 0, 1, 2, 3, 5, 10, 20, 50)))
+STOP_FORECAST_ERROR = REGISTRY.register(Histogram(
+    "coconut_stop_forecast_error_nuts", "Actual minus predicted overfill per bucket stop (calibrates STOP_COAST_S).",
+    labels=("line",), buckets=(-10, -5, -2, -1, 0, 1, 2, 5, 10)))
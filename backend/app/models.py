@@ -1,6 +1,8 @@
-from typing import List
+from typing import List, Literal, Optional, Tuple, Union
 from pydantic import BaseModel
 
+from app import config
+
 #─── Pydantic model for the payload ────────────────────────────────
 class BucketReport(BaseModel):
     id: int
@@ -8,4 +10,52 @@ class BucketReport(BaseModel):
     count: int
 
 class ReportPayload(BaseModel):
-    buckets: List[BucketReport]
\ No newline at end of file
+    buckets: List[BucketReport]
+    line: Optional[str] = None  # counting line id, default line if omitted
+
+#─── USB export (POST /export_report, all optional) ────────────────
+class ExportRequest(BaseModel):
+    table: str = "reports"          # reports, fills, stops or throughput
+    start: Optional[str] = None     # unix seconds or ISO 8601, local time
+    end: Optional[str] = None
+    shift: Optional[str] = None     # "current", "previous" or a time inside the shift; overrides start/end
+    line: Optional[str] = None      # one counting line, all if omitted
+    gzip: Optional[bool] = None     # default config.EXPORT_GZIP
+    mount: Optional[str] = None     # one of GET /usb/mounts, the first if omitted
+
+#─── Colour calibration (POST /calibration/color) ─────────────────
+class ColorCalibration(BaseModel):
+    coconut: List[Tuple[int, int, int]] = []      # BGR pixels of nuts (wet, dry, shell, ...)
+    background: List[Tuple[int, int, int]] = []   # BGR pixels of belt, shadows, debris
+    spread: int = 1         # grow the sampled colours by this many table bins
+    extend: bool = False    # add to the current table instead of replacing it
+
+#─── Counting line configuration (lines.json) ──────────────────────
+class LineConfig(BaseModel):
+    id: str
+    source: Union[int, str] = 0           # webcam index or video file
+    detector: str = config.DETECTOR
+    trigger_line_y: int = 120
+    count_direction: Literal["up", "down", "both"] = config.COUNT_DIRECTION
+    # extra lines/zones counted alongside the trigger line (see app.counting.region_from_dict)
+    count_regions: List[dict] = []
+    stop_mode: Literal["threshold", "predictive"] = config.STOP_MODE
+    stop_coast_s: float = config.STOP_COAST_S  # belt run-on after the relay opens
+    bucket_count: int = 14
+    set_value: int = 800
+    relay_pin: int = config.CONVEYOR_RELAY_PIN
+    buzzer_pin: Optional[int] = None
+    start_button_pin: Optional[int] = None
+    stop_button_pin: Optional[int] = None
+
+    @classmethod
+    def default(cls) -> "LineConfig":
+        """The single line described by config.py, used when there is no lines file."""
+        return cls(
+            id="default",
+            source=config.CAMERA_SOURCE,
+            relay_pin=config.CONVEYOR_RELAY_PIN,
+            buzzer_pin=config.BUZZER_PIN,
+            start_button_pin=config.START_BUTTON_PIN,
+            stop_button_pin=config.STOP_BUTTON_PIN,
+        )
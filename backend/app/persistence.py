@@ -0,0 +1,186 @@
+# app/persistence.py
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+def atomic_write_text(path: Path, text: str):
+    """Write text to path so a power cut leaves either the old or the new file, never a torn one."""
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """atomic_write_text for binary files."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path.parent)
+
+
+def fsync_dir(path: Path):
+    """Make renames/creates in directory `path` durable."""
+    try:
+        dir_fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass  # not supported on every platform/filesystem
+
+
+class BucketStore:
+    """
+    Write-behind persistence for the bucket list.
+
+    The hot path only calls record(), which queues the changed buckets and
+    returns. A writer thread then:
+      - appends the queued changes to an append-only journal and fsyncs it,
+        every `flush_interval` seconds or at once for urgent changes
+        (a bucket filling, operator edits);
+      - every `snapshot_interval` seconds (and on urgent changes) rewrites the
+        snapshot atomically and starts a fresh journal.
+
+    Journal lines carry a sequence number and the bucket's absolute state, so
+    load() = snapshot + replay of newer journal lines gives the exact counts
+    as of the last fsync. A half-written last line is ignored.
+    """
+
+    def __init__(self, snapshot_path: Path, journal_path: Path, flush_interval: float = 1.0, snapshot_interval: float = 30.0):
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = Path(journal_path)
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self._seq = 0
+        self._pending = []      # journal records not yet written
+        self._latest = None     # deep copy of the bucket list at self._seq
+        self._urgent = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_snapshot = time.monotonic()
+
+    # ─── loading ─────────────────────────────────────────────────
+    def load(self, default, expected_len: int):
+        """Snapshot + journal replay. Falls back to default() if nothing usable is on disk."""
+        buckets, seq = None, 0
+        try:
+            if self.snapshot_path.exists():
+                data = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+                # older installs saved a bare list
+                if isinstance(data, dict):
+                    buckets, seq = data.get("buckets"), int(data.get("seq", 0))
+                else:
+                    buckets = data
+        except Exception as e:
+            print("Error loading bucket snapshot:", e)
+            buckets = None
+        if not (isinstance(buckets, list) and len(buckets) == expected_len):
+            buckets, seq = default(), 0
+
+        by_id = {b["id"]: b for b in buckets}
+        replayed, torn = 0, False
+        try:
+            if self.journal_path.exists():
+                with open(self.journal_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            rec = json.loads(line)
+                        except ValueError:
+                            torn = True  # write cut off by a power loss
+                            break
+                        if rec.get("seq", 0) <= seq or rec.get("id") not in by_id:
+                            continue
+                        b = by_id[rec["id"]]
+                        for key in ("count", "set_value", "filled"):
+                            if key in rec:
+                                b[key] = rec[key]
+                        seq = rec["seq"]
+                        replayed += 1
+        except Exception as e:
+            print("Error replaying bucket journal:", e)
+        if replayed:
+            print(f"Recovered {replayed} bucket changes from journal")
+
+        self._seq = seq
+        self._latest = [dict(b) for b in buckets]
+        if torn:
+            # new appends would land on the torn line, so start from a clean snapshot
+            self.flush(snapshot=True)
+        return buckets
+
+    # ─── hot path ────────────────────────────────────────────────
+    def record(self, buckets, ids=None, urgent: bool = False):
+        """
+        Queue the current state of buckets `ids` (all buckets if None).
+        Cheap: no disk I/O on the caller's thread.
+        """
+        with self._lock:
+            for b in buckets:
+                if ids is not None and b["id"] not in ids:
+                    continue
+                self._seq += 1
+                self._pending.append({
+                    "seq": self._seq, "id": b["id"], "count": b.get("count", 0),
+                    "set_value": b.get("set_value"), "filled": b.get("filled", False),
+                })
+            self._latest = [dict(b) for b in buckets]
+            self._urgent = self._urgent or urgent
+        self._ensure_thread()
+        if urgent:
+            self._wake.set()
+
+    # ─── writer thread ───────────────────────────────────────────
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="bucket-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("Error persisting buckets:", e)
+
+    def flush(self, snapshot: bool = False):
+        """Write pending journal records; snapshot if due, urgent or asked for."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            latest, seq = self._latest, self._seq
+            urgent, self._urgent = self._urgent, False
+        if pending:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(rec, separators=(",", ":")) + "\n" for rec in pending))
+                f.flush()
+                os.fsync(f.fileno())
+
+        due = time.monotonic() - self._last_snapshot >= self.snapshot_interval
+        if latest is not None and (snapshot or urgent or (due and pending)):
+            atomic_write_text(self.snapshot_path, json.dumps({"seq": seq, "buckets": latest}, indent=2))
+            self._last_snapshot = time.monotonic()
+            # everything journaled so far is <= seq and now in the snapshot.
+            # Records queued since are still in _pending, not in the file.
+            with open(self.journal_path, "w", encoding="utf-8"):
+                pass
+
+    def close(self):
+        """Stop the writer and leave a fresh snapshot on disk."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+        try:
+            self.flush(snapshot=True)
+        except Exception as e:
+            print("Error persisting buckets on close:", e)
@@ -0,0 +1,173 @@
+# app/pipeline.py
+import asyncio
+import threading
+import time
+import traceback
+from collections import deque
+
+from app import metrics
+
+
+class DropOldestQueue:
+    """
+    Small bounded queue shared between threads.
+    When full, put() discards the oldest item so consumers always see the most
+    recent frames (live cameras). With block=True the producer waits for space
+    instead (recorded files, where every frame must be counted).
+    """
+
+    def __init__(self, maxsize: int = 2):
+        self.maxsize = max(1, int(maxsize))
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item, block: bool = False, stop_event: threading.Event = None):
+        with self._cond:
+            if block:
+                while len(self._items) >= self.maxsize:
+                    if stop_event is not None and stop_event.is_set():
+                        return
+                    self._cond.wait(0.1)
+            elif len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout: float = None):
+        """Return the oldest item, or raise TimeoutError if none arrives in time."""
+        with self._cond:
+            if not self._items and not self._cond.wait_for(lambda: self._items, timeout):
+                raise TimeoutError
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FramePipeline:
+    """
+    Runs capture and processing off the asyncio event loop.
+
+        capture thread --(raw frame, camera jpeg)--> processing thread --(count, frame, overlay, jpeg, arrivals)--> asyncio consumer
+
+    Both hand-offs are bounded. For live sources the oldest frame is dropped when a
+    stage falls behind, so the sender always gets the freshest frame and control
+    messages (start/stop/select_bucket) are never stuck behind cap.read() or
+    the watershed.
+    """
+
+    _END = object()  # sentinel marking end of stream
+
+    def __init__(self, streamer, loop: asyncio.AbstractEventLoop, capture_depth: int = 2, output_depth: int = 2,
+                 line_id: str = None):
+        self.streamer = streamer
+        self.loop = loop
+        self.line_id = line_id if line_id is not None else streamer.line_id
+        self.raw_frames = DropOldestQueue(capture_depth)
+        self.output_depth = max(1, int(output_depth))
+        self._results = asyncio.Queue()  # bounded by hand in _publish
+        self.dropped_results = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    # ─── lifecycle ───────────────────────────────────────────────
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="frame-capture", daemon=True),
+            threading.Thread(target=self._process_loop, name="frame-process", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout: float = 2.0):
+        """Signal both threads to exit and wait for them. Blocking: call via asyncio.to_thread."""
+        self._stop.set()
+        self.raw_frames.clear()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    @property
+    def dropped_frames(self) -> int:
+        return self.raw_frames.dropped + self.dropped_results
+
+    def update_metrics(self):
+        metrics.QUEUE_DEPTH.labels(self.line_id, "capture").set(len(self.raw_frames))
+        metrics.QUEUE_DEPTH.labels(self.line_id, "output").set(self._results.qsize())
+        metrics.DROPPED_FRAMES.labels(self.line_id, "capture").set(self.raw_frames.dropped)
+        metrics.DROPPED_FRAMES.labels(self.line_id, "output").set(self.dropped_results)
+
+    # ─── consumer side (event loop) ──────────────────────────────
+    async def get(self):
+        """
+        Next (count, frame, overlay, camera jpeg or None, arrivals) result, or
+        None once the source is exhausted. arrivals: VideoStreamer.arrivals of the frame.
+        """
+        item = await self._results.get()
+        if item is self._END:
+            return None
+        return item
+
+    def _publish(self, item):
+        # runs on the event loop thread (scheduled via call_soon_threadsafe)
+        if item is not self._END:
+            while self._results.qsize() >= self.output_depth:
+                self._results.get_nowait()
+                self.dropped_results += 1
+        self._results.put_nowait(item)
+
+    def _publish_threadsafe(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self._publish, item)
+        except RuntimeError:
+            # event loop already closed (server shutting down)
+            self._stop.set()
+
+    # ─── worker threads ──────────────────────────────────────────
+    def _capture_loop(self):
+        block = not self.streamer.is_live
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                raw_frame = self.streamer.grab_frame()
+                metrics.CAPTURE_SECONDS.observe(time.perf_counter() - t0)
+                if raw_frame is None:
+                    break
+                # the camera's own JPEG of this frame (MJPG passthrough), travels with it
+                self.raw_frames.put((raw_frame, self.streamer.take_jpeg()), block=block, stop_event=self._stop)
+        except Exception as e:
+            print("Error in capture thread:", e)
+            traceback.print_exc()
+        finally:
+            self.raw_frames.put(self._END, block=True, stop_event=self._stop)
+
+    def _process_loop(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    item = self.raw_frames.get(timeout=0.1)
+                except TimeoutError:
+                    continue
+                if item is self._END:
+                    break
+                raw_frame, jpeg = item
+                # drawing and encoding are left to the consumer, only for frames it sends
+                count, frame, overlay = self.streamer.count_frame(raw_frame)
+                self._publish_threadsafe((count, frame, overlay, jpeg, self.streamer.arrivals))
+        except Exception as e:
+            print("Error in processing thread:", e)
+            traceback.print_exc()
+        finally:
+            self._publish_threadsafe(self._END)
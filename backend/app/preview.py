@@ -0,0 +1,204 @@
+# app/preview.py
+import asyncio
+import json
+import struct
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from app import metrics
+
+
+class Overlay(NamedTuple):
+    circles: list             # ((x, y), r) detector blobs
+    boxes: np.ndarray         # (N, 4) int tracked boxes
+    trigger_line_y: int
+    roi_box: tuple = None     # (x1, y1, x2, y2) area detection ran on, None = whole frame
+    roi_polygon: list = None  # [[x, y], ...] if the region is a polygon
+
+
+def draw_overlay(image: np.ndarray, overlay: Overlay) -> np.ndarray:
+    """Draw detections, tracks and the trigger line onto image, in place."""
+    for ((xa, ya), ra) in overlay.circles:
+        cv2.circle(image, (int(xa), int(ya)), int(ra), (255, 0, 0), 2)
+    for x1, y1, x2, y2 in overlay.boxes:
+        cv2.rectangle(image, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
+    cv2.line(image, (0, overlay.trigger_line_y), (image.shape[1], overlay.trigger_line_y), (0, 0, 255), 2)
+    if overlay.roi_box is not None:
+        x1, y1, x2, y2 = overlay.roi_box
+        cv2.rectangle(image, (x1, y1), (x2 - 1, y2 - 1), (0, 255, 255), 1)
+    if overlay.roi_polygon:
+        cv2.polylines(image, [np.array(overlay.roi_polygon, dtype=np.int32)], True, (0, 255, 255), 1)
+    return image
+
+
+class PreviewLevel(NamedTuple):
+    quality: int           # JPEG quality
+    scale: float           # preview size relative to the processed frame
+    fps: Optional[float]   # max preview frames per second, None = every frame
+
+
+# best first. A client moves down the ladder when its link can't keep up
+# and back up once it has been keeping up for a while.
+QUALITY_LADDER = (
+    PreviewLevel(70, 1.0, 30),
+    PreviewLevel(50, 1.0, 20),
+    PreviewLevel(40, 0.75, 10),
+    PreviewLevel(30, 0.5, 5),
+    PreviewLevel(25, 0.5, 2),
+)
+
+
+def encode_jpeg(image: np.ndarray, level: PreviewLevel) -> np.ndarray:
+    """JPEG as OpenCV's uint8 buffer; wrap in memoryview() to send without copying."""
+    if level.scale != 1.0:
+        h, w = image.shape[:2]
+        image = cv2.resize(image, (max(1, int(w * level.scale)), max(1, int(h * level.scale))), interpolation=cv2.INTER_AREA)
+    success, buffer = cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), level.quality])
+    return buffer
+
+
+def overlay_dict(overlay: Overlay, frame_size) -> dict:
+    """Overlay as plain lists for the "overlay" message (processed-frame pixels)."""
+    return {
+        "frame_size": list(frame_size),
+        "circles": [[round(float(x), 1), round(float(y), 1), round(float(r), 1)] for (x, y), r in overlay.circles],
+        "boxes": np.asarray(overlay.boxes).reshape(-1, 4).tolist(),
+        "trigger_line_y": int(overlay.trigger_line_y),
+        "roi_box": list(overlay.roi_box) if overlay.roi_box is not None else None,
+        "roi_polygon": overlay.roi_polygon,
+    }
+
+
+class PreviewFrame:
+    """
+    A counted frame plus what to draw on it. Annotation and JPEG encoding only
+    happen if a client actually asks for the frame; clients at the same level
+    share one encode. Both run in a worker thread so the event loop keeps
+    serving control messages.
+
+    Two ways out:
+      framed()  4-byte count header + JPEG with the overlay drawn in, built
+                once per level and shared by every client at that level
+      raw()     the JPEG alone: the camera's own bytes if there are any
+                (`jpeg`), else one un-annotated encode; the overlay goes
+                separately as overlay_message()
+    Both are memoryviews over the buffers they were built in, no further copies.
+
+    keep_raw: some client wants raw(), so annotation must draw on a copy.
+    """
+
+    def __init__(self, count: int, image: np.ndarray, overlay: Overlay = None,
+                 jpeg: np.ndarray = None, keep_raw: bool = False):
+        self.count = count
+        self.image = image
+        self.overlay = overlay
+        self.camera_jpeg = jpeg
+        self.keep_raw = keep_raw
+        self._annotated = image if overlay is None else None
+        self._draw_lock = threading.Lock()
+        self._encoded = {}  # (kind, PreviewLevel, offset) -> asyncio.Task
+
+    def annotated(self) -> np.ndarray:
+        with self._draw_lock:
+            if self._annotated is None:
+                image = self.image.copy() if self.keep_raw else self.image
+                self._annotated = draw_overlay(image, self.overlay)
+        return self._annotated
+
+    def _cached(self, key, fn, *args):
+        task = self._encoded.get(key)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+            self._encoded[key] = task
+        return task
+
+    def _encode(self, image: np.ndarray, level: PreviewLevel) -> np.ndarray:
+        t0 = time.perf_counter()
+        buffer = encode_jpeg(image, level)
+        metrics.ENCODE_SECONDS.observe(time.perf_counter() - t0)
+        return buffer
+
+    def _frame(self, level: PreviewLevel, count: int) -> memoryview:
+        jpeg = self._encode(self.annotated(), level)
+        message = bytearray(4 + len(jpeg))
+        struct.pack_into("!I", message, 0, count)
+        message[4:] = memoryview(jpeg)  # the one copy: header and JPEG must be one WebSocket message
+        metrics.PREVIEW_BYTES_COPIED.inc(len(jpeg))
+        return memoryview(message)
+
+    async def framed(self, level: PreviewLevel, offset: int = 0) -> memoryview:
+        """Binary preview message: 4-byte BE unsigned count (+offset) + annotated JPEG."""
+        return await self._cached(("framed", level, offset), self._frame, level, self.count + offset)
+
+    async def jpeg(self, level: PreviewLevel) -> memoryview:
+        """Annotated JPEG at this level, without header."""
+        return (await self.framed(level))[4:]
+
+    async def raw(self, level: PreviewLevel) -> memoryview:
+        """Un-annotated JPEG: the camera's bytes when available (level ignored), else one encode per level."""
+        if self.camera_jpeg is not None:
+            return memoryview(self.camera_jpeg)
+        if not self.keep_raw and self.overlay is not None:
+            # annotation draws on self.image in place: only the annotated JPEG is safe
+            return await self.jpeg(level)
+        return memoryview(await self._cached(("raw", level, 0), self._encode, self.image, level))
+
+    def overlay_message(self, offset: int = 0) -> str:
+        data = {"type": "overlay", "count": self.count + offset}
+        if self.overlay is not None:
+            data.update(overlay_dict(self.overlay, self.image.shape[1::-1]))
+        return json.dumps(data)
+
+
+class AdaptiveRate:
+    """
+    Per-client preview level from measured backpressure.
+
+    observe() is fed the time each frame took to send and how many newer
+    frames arrived meanwhile (the client's queue depth). Sends slower than
+    half the level's frame interval, or frames piling up, step the client down
+    the ladder; a long run of fast sends steps it back up.
+    """
+
+    def __init__(self, ladder=QUALITY_LADDER, start: int = 1, adaptive: bool = True,
+                 down_after: int = 3, up_after: int = 30, alpha: float = 0.3):
+        self.ladder = ladder
+        self.index = min(start, len(ladder) - 1)
+        self.adaptive = adaptive
+        self.down_after = down_after
+        self.up_after = up_after
+        self.alpha = alpha
+        self.send_time = 0.0  # EWMA, seconds
+        self._bad = 0
+        self._good = 0
+
+    @property
+    def level(self) -> PreviewLevel:
+        return self.ladder[self.index]
+
+    @property
+    def min_interval(self) -> float:
+        fps = self.level.fps
+        return 1.0 / fps if fps else 0.0
+
+    def observe(self, send_seconds: float, queued: int):
+        self.send_time += self.alpha * (send_seconds - self.send_time)
+        if not self.adaptive:
+            return
+        budget = 0.5 / (self.level.fps or 30)
+        if self.send_time > budget or queued >= 2:
+            self._bad += 1
+            self._good = 0
+        elif self.send_time < budget / 4 and queued == 0:
+            self._good += 1
+            self._bad = 0
+        if self._bad >= self.down_after and self.index < len(self.ladder) - 1:
+            self.index += 1
+            self._bad = 0
+        elif self._good >= self.up_after and self.index > 0:
+            self.index -= 1
+            self._good = 0
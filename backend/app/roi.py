@@ -0,0 +1,118 @@
+# app/roi.py
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from app.persistence import atomic_write_text
+
+ROI_FILE = Path(__file__).parent / "roi.json"
+FRAME_SIZE = (320, 240)  # processed frame (w, h), see VideoStreamer.count_frame
+
+
+def _band(band):
+    """None (no band) or a positive whole number of pixels; 0, negatives, strings and fractions are errors."""
+    if band is None:
+        return None
+    if isinstance(band, bool) or not isinstance(band, (int, float)) or band != int(band) or band <= 0:
+        raise ValueError(f"band must be a positive number of pixels or null, not {band!r}")
+    return int(band)
+
+
+class Roi:
+    """
+    Region of interest and counting band, in processed-frame pixels.
+
+    The region is a rectangle or a polygon; the band keeps only `band` pixels
+    above and below the trigger line. Detection runs on the crop that is the
+    intersection of the two (pixels outside a polygon are blacked out), so belt
+    edges and floor never reach the colour masks or the watershed.
+    """
+
+    def __init__(self, rect=None, polygon=None, trigger_line_y: int = 120, band: int = None, frame_size=FRAME_SIZE):
+        self.frame_w, self.frame_h = frame_size
+        self.rect = [int(v) for v in rect] if rect else None
+        self.polygon = [[int(x), int(y)] for x, y in polygon] if polygon else None
+        self.trigger_line_y = int(trigger_line_y)
+        self.band = _band(band)
+        if not 0 <= self.trigger_line_y < self.frame_h:
+            raise ValueError(f"trigger_line_y must be within 0..{self.frame_h - 1}")
+        if self.polygon is not None and len(self.polygon) < 3:
+            raise ValueError("polygon needs at least 3 points")
+        self._build()
+
+    def _build(self):
+        if self.polygon is not None:
+            x, y, w, h = cv2.boundingRect(np.array(self.polygon, dtype=np.int32))
+            x1, y1, x2, y2 = x, y, x + w, y + h
+        elif self.rect is not None:
+            x1, y1, x2, y2 = self.rect
+        else:
+            x1, y1, x2, y2 = 0, 0, self.frame_w, self.frame_h
+        if self.band is not None:
+            y1 = max(y1, self.trigger_line_y - self.band)
+            y2 = min(y2, self.trigger_line_y + self.band)
+        x1, x2 = max(0, x1), min(self.frame_w, x2)
+        y1, y2 = max(0, y1), min(self.frame_h, y2)
+        if x2 - x1 < 8 or y2 - y1 < 8:
+            raise ValueError("region of interest is empty or smaller than 8x8 px")
+        self.box = (x1, y1, x2, y2)
+        self.full_frame = self.box == (0, 0, self.frame_w, self.frame_h) and self.polygon is None
+
+        self._mask = None
+        if self.polygon is not None:
+            self._mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            pts = np.array(self.polygon, dtype=np.int32) - np.array([x1, y1], dtype=np.int32)
+            cv2.fillPoly(self._mask, [pts], 255)
+
+    # ─── hot path ────────────────────────────────────────────────
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """The part of the frame detection should see (a view unless a polygon mask applies)."""
+        if self.full_frame:
+            return frame
+        x1, y1, x2, y2 = self.box
+        crop = frame[y1:y2, x1:x2]
+        if self._mask is not None:
+            crop = cv2.bitwise_and(crop, crop, mask=self._mask)
+        return crop
+
+    def to_frame(self, detections: np.ndarray) -> np.ndarray:
+        """Shift crop-relative [x1,y1,x2,y2,score] rows back to frame pixels, in place."""
+        if not self.full_frame and len(detections):
+            x1, y1 = self.box[:2]
+            detections[:, [0, 2]] += x1
+            detections[:, [1, 3]] += y1
+        return detections
+
+    def circles_to_frame(self, circles):
+        if self.full_frame:
+            return list(circles)
+        x1, y1 = self.box[:2]
+        return [((x + x1, y + y1), r) for (x, y), r in circles]
+
+    # ─── persistence ─────────────────────────────────────────────
+    def to_dict(self) -> dict:
+        return {"rect": self.rect, "polygon": self.polygon, "trigger_line_y": self.trigger_line_y,
+                "band": self.band, "box": list(self.box)}
+
+    @classmethod
+    def from_dict(cls, data: dict, default_trigger_line_y: int = 120) -> "Roi":
+        return cls(rect=data.get("rect"), polygon=data.get("polygon"),
+                   trigger_line_y=data.get("trigger_line_y", default_trigger_line_y), band=data.get("band"))
+
+
+def load_roi(trigger_line_y: int = 120, path: Path = ROI_FILE) -> Roi:
+    try:
+        if path.exists():
+            return Roi.from_dict(json.loads(path.read_text(encoding="utf-8")), trigger_line_y)
+    except Exception as e:
+        print("Error loading roi.json:", e)
+    return Roi(trigger_line_y=trigger_line_y)
+
+
+def save_roi(roi: Roi, path: Path = ROI_FILE):
+    try:
+        atomic_write_text(path, json.dumps(roi.to_dict(), indent=2))
+    except Exception as e:
+        print("Could not save roi.json:", e)
@@ -0,0 +1,107 @@
+# app/state_sync.py
+import asyncio
+import json
+from collections import deque
+
+SYNC_FIELDS = ("count", "set_value", "filled")
+DELTA_PREFIX = '{"type":"buckets_delta"'  # how every published delta starts (compact separators)
+
+
+class BucketStateSync:
+    """
+    Versioned bucket state for clients.
+
+    Instead of the whole bucket list on every counted frame, clients get:
+      {"type": "buckets_update", "seq": S, "buckets": [...]}   snapshot (connect / resync)
+      {"type": "buckets_delta",  "seq": S, "changes": [{"id": 2, "count": 153}, ...]}
+
+    Changes are coalesced and published at most `max_hz` times a second (a
+    bucket filling is flushed at once). Each delta bumps `seq` by one, so a
+    client that sees a gap, or reconnects with its last seq, can ask for
+    everything since then; recent deltas are kept to answer that without a
+    full snapshot. Delta values are absolute, so replaying one twice is harmless.
+    """
+
+    def __init__(self, hub, buckets, max_hz: float = 5.0, history: int = 256):
+        self.hub = hub
+        self.buckets = buckets  # the authoritative list, mutated in place by its owners
+        self.min_interval = 1.0 / max_hz
+        self.seq = 0
+        self._sent = {b["id"]: {k: b.get(k) for k in SYNC_FIELDS} for b in buckets}
+        self._dirty = set()
+        self._history = deque(maxlen=history)  # (seq, changes)
+        self._changed = None
+        self._urgent = None
+        self._task = None
+
+    # ─── producers ───────────────────────────────────────────────
+    def mark(self, ids=None, urgent: bool = False):
+        """Note that buckets `ids` (all if None) changed. Call from the event loop."""
+        self._dirty.update(b["id"] for b in self.buckets if ids is None or b["id"] in ids)
+        self._ensure_task()
+        self._changed.set()
+        if urgent:
+            self._urgent.set()
+
+    # ─── consumers ───────────────────────────────────────────────
+    def snapshot_message(self) -> str:
+        return json.dumps({"type": "buckets_update", "seq": self.seq, "buckets": self.buckets})
+
+    def resync_message(self, since: int) -> str:
+        """Merged delta since `since` if still in history, else a snapshot."""
+        if since == self.seq:
+            return json.dumps({"type": "buckets_delta", "seq": self.seq, "changes": []})
+        if 0 <= since < self.seq and self._history and self._history[0][0] <= since + 1:
+            merged = {}
+            for seq, changes in self._history:
+                if seq > since:
+                    for c in changes:
+                        merged.setdefault(c["id"], {"id": c["id"]}).update(c)
+            return json.dumps({"type": "buckets_delta", "seq": self.seq, "changes": list(merged.values())})
+        return self.snapshot_message()
+
+    # ─── flushing ────────────────────────────────────────────────
+    def flush(self):
+        """Publish one delta with every field that changed since the last one."""
+        if not self._dirty:
+            return
+        changes = []
+        for b in self.buckets:
+            if b["id"] not in self._dirty:
+                continue
+            sent = self._sent.setdefault(b["id"], {})
+            change = {"id": b["id"]}
+            for k in SYNC_FIELDS:
+                if sent.get(k) != b.get(k):
+                    change[k] = sent[k] = b.get(k)
+            if len(change) > 1:
+                changes.append(change)
+        self._dirty.clear()
+        if not changes:
+            return
+        self.seq += 1
+        self._history.append((self.seq, changes))
+        self.hub.publish_text(json.dumps({"type": "buckets_delta", "seq": self.seq, "changes": changes}, separators=(",", ":")))
+
+    def _ensure_task(self):
+        if self._task is None or self._task.done():
+            self._changed = asyncio.Event()
+            self._urgent = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_flush = 0.0
+        while True:
+            await self._changed.wait()
+            # coalesce everything that changes until the next slot, unless urgent
+            wait = last_flush + self.min_interval - loop.time()
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._urgent.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            self._changed.clear()
+            self._urgent.clear()
+            self.flush()
+            last_flush = loop.time()
@@ -0,0 +1,29 @@
+# app/timing.py
+import time
+from collections import defaultdict
+
+
+class LapTimer:
+    """
+    Per-stage wall-clock timing for the frame hot path.
+
+    Code under test calls lap("stage") after each stage; the time since the
+    previous lap (or start()) is recorded under that name. Components hold
+    `timer = None` by default and check it before lapping, so an unprofiled
+    run pays one attribute test per stage.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)  # stage -> [seconds]
+        self._t = time.perf_counter()
+
+    def start(self):
+        self._t = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.samples[stage].append(now - self._t)
+        self._t = now
+
+    def clear(self):
+        self.samples.clear()
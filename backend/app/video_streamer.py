@@ -1,132 +1,237 @@
 import cv2
 import numpy as np
-# watershed + SORT
-from skimage.feature import peak_local_max
-from skimage.segmentation import watershed
-from scipy import ndimage
-from sort.sort import Sort  # your local sort.py
+from sort.batch_sort import BatchSort as Sort  # vectorised drop-in for sort.Sort
+from app import config, metrics
+from app.capture import Camera, CaptureSettings, settings_from_config
+from app.counting import TRIGGER, CountLine, LineCounter, counter_from_config
+from app.detection import cm_to_px, disc_area_px
+from app.detectors import Detector, create_detector
+from app.motion import MotionGate
+from app.preview import Overlay, draw_overlay
+from app.roi import Roi
+import threading
 import time
 
+def motion_gate_from_config():
+    "The motion gate configured in config.py / .env, or None if disabled"
+    if not config.MOTION_GATE:
+        return None
+    return MotionGate(threshold=config.MOTION_THRESHOLD, min_changed=config.MOTION_MIN_CHANGED,
+                      max_skip=config.MOTION_MAX_SKIP)
+
+
+def detector_sizes_px():
+    "Minimum blob area and nut separation in processed-frame pixels, from the cm settings unless overridden"
+    min_area = config.DETECTOR_MIN_AREA
+    if min_area is None:
+        min_area = disc_area_px(config.COCONUT_MIN_DIAMETER_CM, config.DETECTOR_PX_PER_CM)
+    min_distance = config.DETECTOR_MIN_DISTANCE
+    if min_distance is None:
+        min_distance = max(1, int(round(cm_to_px(config.COCONUT_MIN_SEPARATION_CM, config.DETECTOR_PX_PER_CM))))
+    return min_area, min_distance
+
+
+def detector_from_config(name: str = None) -> Detector:
+    "Build the detector selected in config.py / .env (or `name`, with the settings from config.py)"
+    name = name or config.DETECTOR
+    if name == "yolo_onnx":
+        return create_detector("yolo_onnx", model_path=config.YOLO_ONNX_PATH, conf_threshold=config.YOLO_CONF)
+    min_area, min_distance = detector_sizes_px()
+    if name == "hsv_watershed":
+        return create_detector(name, min_area=min_area, min_distance=min_distance)
+    if name == "pyramid":
+        return create_detector(name, min_area=min_area, min_distance=min_distance,
+                               coarse_scale=config.PYRAMID_COARSE_SCALE)
+    return create_detector(name, min_area=min_area)
+
+
 class VideoStreamer:
-    def __init__(self, source=0, trigger_line_y=120, quality=50):
+    def __init__(self, source=0, trigger_line_y=120, quality=50, detector: Detector = None, roi: Roi = None,
+                 line_id: str = "default", motion_gate: MotionGate = None, capture: CaptureSettings = None,
+                 counter: LineCounter = None):
         self.current_count = 0
         self.processing    = False
-        self.cap           = None
         self.source        = source  # can be webcam index or video file path
-        self.trigger_line_y = trigger_line_y
+        # format/size/fps negotiation, driver buffer, latest-frame grabbing
+        self.camera        = Camera(source, capture or settings_from_config())
+        # detection only runs inside the region of interest / counting band
+        self.roi           = roi if roi is not None else Roi(trigger_line_y=trigger_line_y)
+        self.trigger_line_y = self.roi.trigger_line_y
         self.encode_param  = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.detector      = detector if detector is not None else detector_from_config()
 
         # init SORT
         self.tracker = Sort(max_age=5, min_hits=1, iou_threshold=0.2) # was 2 and 0.3 
-        self.counted_ids = set()
+        # directional crossings of the trigger line (and any extra lines/zones)
+        self.counter = counter if counter is not None else counter_from_config(self.trigger_line_y, width=self.roi.frame_w)
+        self.crossings = {}  # new crossings per region on the last detected frame
+        # seconds until each uncounted track crosses the trigger line, at its
+        # Kalman velocity (sorted); held like the tracks on skipped frames
+        self.arrivals = np.empty(0)
+        self._update_interval = 1.0 / config.CAMERA_FPS  # EWMA seconds between tracker updates
+        self._last_update = None
+        # skips detection while nothing moves in the ROI; set to None to detect every frame
+        self.motion_gate = motion_gate if motion_gate is not None else motion_gate_from_config()
+        self._last_tracked = np.empty((0, 5))
+        self._last_circles = []
+        self._detect_cost = 0.0  # EWMA seconds of detection+tracking, for the "saved" metric
+        self.saved_seconds = None  # set to the estimate on frames the gate skipped
+        self.timer = None  # optional app.timing.LapTimer, see benchmarks/bench_replay.py
+        self.line_id = line_id
+        self._live_tracks = metrics.LIVE_TRACKS.labels(line_id)
+        self._frames_processed = metrics.FRAMES_PROCESSED.labels(line_id)
+        self._camera_fps = metrics.CAMERA_FPS.labels(line_id)
+        self._frames_skipped = metrics.FRAMES_SKIPPED.labels(line_id)
+        self._seconds_saved = metrics.DETECTION_SECONDS_SAVED.labels(line_id)
+        self._tracked_ids = metrics.COUNTER_TRACKED_IDS.labels(line_id)
+        # guards tracker/count state: processing may run on a worker thread
+        # while reset() is called from the event loop
+        self._lock = threading.Lock()
     
+    @property
+    def is_live(self) -> bool:
+        """True for camera indices/URLs (and looping files), False for recorded video files."""
+        return self.camera.is_live
+
+    @property
+    def cap(self):
+        return self.camera.cap
+
     def reset(self):
-        self.current_count = 0
-        self.counted_ids.clear()
-        self.tracker = Sort(max_age=5, min_hits=1, iou_threshold=0.2)
+        with self._lock:
+            self.current_count = 0
+            self.counter.reset()
+            self.tracker = Sort(max_age=5, min_hits=1, iou_threshold=0.2)
+            self._last_tracked = np.empty((0, 5))
+            self._last_circles = []
+            self.arrivals = np.empty(0)
+            self.detector.reset()
+            if self.motion_gate is not None:
+                self.motion_gate.reset()
+
+    def set_roi(self, roi: Roi):
+        "Switch region of interest and trigger line; safe while frames are being processed"
+        with self._lock:
+            self.roi = roi
+            self.trigger_line_y = roi.trigger_line_y
+            trigger = self.counter.regions[0]
+            self.counter.replace(CountLine.horizontal(roi.trigger_line_y, roi.frame_w, trigger.direction))
+            # e.g. a background model no longer matches the crop
+            self.detector.reset()
+            if self.motion_gate is not None:
+                self.motion_gate.reset()
+
+    def grab_frame(self):
+        "Read one raw frame from the source (cameras: the newest), returns None at end of stream"
+        if not self.camera.is_open() and not self.camera.open(1, 0):
+            raise RuntimeError("Video source not opened")
+        raw_frame = self.camera.read()
+        self._camera_fps.set(self.camera.fps)
+        return raw_frame
+
+    def take_jpeg(self):
+        "The camera's own JPEG bytes of the frame grabbed last, if it sends MJPEG and passthrough is on"
+        return self.camera.take_jpeg()
+
+    def count_frame(self, raw_frame):
+        "Count one raw frame, return count, frame, overlay. Nothing is drawn or encoded."
+        if raw_frame.shape[1] == 320 and raw_frame.shape[0] == 240:
+            resized_frame = raw_frame  # camera already delivers the processing size
+        else:
+            resized_frame = cv2.resize(raw_frame, (320, 240)) # frame.shape == (480, 640, 3) for webcam
+        with self._lock:
+            overlay = self._process_frame_logic(resized_frame)
+            count = self.current_count
+        return count, resized_frame, overlay
+
+    def process_frame(self, raw_frame):
+        "Process one raw frame, return count, jpeg_bytes"
+        count, frame, overlay = self.count_frame(raw_frame)
+        draw_overlay(frame, overlay)
+        success, buffer = cv2.imencode('.jpg', frame, self.encode_param)
+        return count, buffer.tobytes()
 
     def read_frame(self):
         "Grab one frame, process it, return count, jpeg_bytes"
-        if not self.cap: 
-            self.cap = cv2.VideoCapture(self.source)  
-        if not self.cap.isOpened():
-            raise RuntimeError("Video source not opened")
-        ret, raw_frame = self.cap.read()
-        if not ret:
+        raw_frame = self.grab_frame()
+        if raw_frame is None:
             return None, None
-        
-        resized_frame = cv2.resize(raw_frame, (320, 240)) # frame.shape == (480, 640, 3) for webcam
-        annotated_frame = self._process_frame_logic(resized_frame) # return annotated frame and count
-        success, buffer = cv2.imencode('.jpg', annotated_frame, self.encode_param)
-        return self.current_count, buffer.tobytes()
+        return self.process_frame(raw_frame)
     
-    def _process_frame_logic(self, frame: np.ndarray) -> np.ndarray:
-        annotated = frame.copy() #copy to be drawn on
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-        # Mask for brown and light colors 
-        lower_brown = np.array([8, 50, 40])
-        upper_brown = np.array([30, 255, 255])
-        outer_mask = cv2.inRange(hsv, lower_brown, upper_brown)
-
-        lower_light = np.array([0, 0, 160])
-        upper_light = np.array([40, 60, 255])
-        inner_mask = cv2.inRange(hsv, lower_light, upper_light)
-
-        #mask for dark/wet coconuts
-        lower_dark = np.array([5, 20, 60])    # H in coconut range, S moderate, V low
-        upper_dark = np.array([30, 80, 255])  # V up to 90 (tweak to include wet ones)
-        mask_dark = cv2.inRange(hsv, lower_dark, upper_dark)
-
-        final_mask = cv2.bitwise_or(outer_mask, inner_mask)
-        final_mask = cv2.bitwise_or(final_mask, mask_dark)
-        eroded_mask = cv2.erode(final_mask, None, iterations=3)
-
-        D = ndimage.distance_transform_edt(eroded_mask)
-        localMax = peak_local_max(D, min_distance=12, labels=eroded_mask) # was 20
-
-        marker_mask = np.zeros(D.shape, dtype=bool)
-        if localMax.shape[0] > 0:
-            marker_mask[tuple(localMax.T)] = True
-
-        markers, _ = ndimage.label(marker_mask)
-        labels = watershed(-D, markers, mask=eroded_mask) 
-
-        detections = []
-
-        for label in np.unique(labels):
-            if label == 0:
-                continue
-
-            mask = np.zeros(eroded_mask.shape, dtype="uint8")
-            mask[labels == label] = 255
-
-            cnts = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            cnts = cnts[0] if len(cnts) == 2 else cnts[1]
-            if len(cnts) == 0:
-                continue
-
-            c = max(cnts, key=cv2.contourArea)
-
-            if cv2.contourArea(c) < 700:
-                continue
-
-            #(optional) draw contours and labels
-            ((xa, ya), ra) = cv2.minEnclosingCircle(c)
-            cv2.circle(annotated, (int(xa), int(ya)), int(ra), (255, 0, 0), 2)
-
-            (x, y, w, h) = cv2.boundingRect(c)
-            detections.append([x, y, x + w, y + h, 1.0])  # last value is a confidence score
-        
-        #if no detections, create an empty array of shape (0, 5)
-        if len(detections) > 0:
-            detections_np = np.array(detections, dtype=np.float32)
-        else:
-            detections_np = np.empty((0, 5), dtype=np.float32)
-                    
+    def _process_frame_logic(self, frame: np.ndarray) -> Overlay:
+        timer = self.timer
+        roi = self.roi
+        crop = roi.crop(frame)
+        gate = self.motion_gate
+        if gate is not None:
+            tg = time.perf_counter()
+            moved = gate.should_detect(crop)
+            if timer: timer.lap("motion_gate")
+            gate_s = time.perf_counter() - tg
+            metrics.MOTION_GATE_SECONDS.observe(gate_s)
+            if not moved:
+                # nothing moved: the tracks are exactly where they were, so hold
+                # them (no update, no ageing) instead of running the detector
+                self.saved_seconds = max(0.0, self._detect_cost - gate_s)
+                self._frames_skipped.inc()
+                self._seconds_saved.inc(self.saved_seconds)
+                return self._overlay(self._last_tracked, self._last_circles)
+        self.saved_seconds = None
+        self.crossings = {}
+        t0 = time.perf_counter()
+        detections_np = roi.to_frame(self.detector.detect(crop))
+        if timer: timer.lap("detection")  # whatever the detector didn't lap itself
+        t1 = time.perf_counter()
         tracked_objects = self.tracker.update(detections_np)
-
-        # 4) draw tracked objects
-        for d in tracked_objects:
-            x1, y1, x2, y2, obj_id = d.astype(int)
-            cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            # cv2.putText(annotated, f"ID {int(obj_id)}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-            #computer the center of the bounding box
-            center_x, center_y = (x1 + x2) // 2, (y1 + y2) // 2
-            #if it has not been counted yet and is above the trigger line
-            if(obj_id not in self.counted_ids and center_y < self.trigger_line_y):
-                self.current_count += 1
-                self.counted_ids.add(obj_id)
-            # cv2.putText(annotated, f"Count: {self.current_count}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2)
-        # 5) draw trigger line & total
-        cv2.line(annotated, (0, self.trigger_line_y), (annotated.shape[1], self.trigger_line_y), (0,0,255), 2)
-        # cv2.putText(annotated, f"Count: {self.current_count}", (10,30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,255), 2)
-        return annotated
+        if timer: timer.lap("tracking")
+        t2 = time.perf_counter()
+        metrics.DETECTION_SECONDS.observe(t1 - t0)
+        metrics.TRACKING_SECONDS.observe(t2 - t1)
+        self._live_tracks.set(self.tracker.live_tracks)
+        self._frames_processed.inc()
+        self._detect_cost += 0.1 * ((t2 - t0) - self._detect_cost)
+        self._last_tracked = tracked_objects
+
+        self.crossings = self.counter.update(tracked_objects)
+        self.current_count += self.crossings[TRIGGER]
+        self._forecast_arrivals(tracked_objects, t1)
+        self._tracked_ids.set(self.counter.tracked_ids)
+        for region_id, n in self.crossings.items():
+            if n:
+                metrics.REGION_CROSSINGS.labels(self.line_id, region_id).inc(n)
+
+        self._last_circles = roi.circles_to_frame(getattr(self.detector, "last_circles", ()))
+        return self._overlay(tracked_objects, self._last_circles)
+
+    def _forecast_arrivals(self, tracked_objects, now: float):
+        "ETAs at the trigger line of the tracks still to count, in seconds (for the predictive stop)"
+        if self._last_update is not None:
+            dt = now - self._last_update
+            if dt < 1.0:  # not across a pause of the motion gate
+                self._update_interval += 0.1 * (dt - self._update_interval)
+        self._last_update = now
+        if not len(tracked_objects):
+            self.arrivals = np.empty(0)
+            return
+        ids = self.tracker.track_ids
+        order = np.argsort(ids)
+        rows = order[np.searchsorted(ids, tracked_objects[:, 4], sorter=order)]
+        velocities = self.tracker.velocities[rows]
+        self.arrivals = self.counter.arrivals(tracked_objects, velocities) * self._update_interval
+
+    def _overlay(self, tracked_objects, circles) -> Overlay:
+        "What to draw, if this frame is ever previewed"
+        roi = self.roi
+        return Overlay(
+            circles=circles,
+            boxes=tracked_objects[:, :4].astype(int),
+            trigger_line_y=self.trigger_line_y,
+            roi_box=None if roi.full_frame else roi.box,
+            roi_polygon=roi.polygon,
+        )
 
     def release(self):
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        self.camera.release()
         print("Released video capture resource.")
 
     def open(self, retries: int = 3, delay: float = 0.2):
@@ -136,42 +241,14 @@ class VideoStreamer:
         retries: number of attempts
         delay: seconds between attempts (useful for USB/camera warm-up)
         """
-        #ensure previous capture is closed
-        if self.cap:
-            try:
-                self.cap.release()
-            except Exception:
-                pass
-            self.cap = None
-        
-        for attempt in range(1, retries + 1):
-            self.cap = cv2.VideoCapture(self.source)
-            if not self.cap or not self.cap.isOpened():
-                #wait and try again
-                time.sleep(delay)
-                continue
-            # try to read a single frame to confirm camera readiness
-            ret, _ = self.cap.read()
-            if ret:
-                # success — keep cap open for subsequent reads
-                return True
-            # couldn't read, release and retry
-            try:
-                self.cap.release()
-            except Exception:
-                pass
-            self.cap = None
-            time.sleep(delay)
-        
-        # after retries, camera not available
-        return False
-    
+        ok = self.camera.open(retries, delay)
+        if ok:
+            # what the driver agreed to, not what we asked for
+            print(f"Opened {self.source}: {self.camera.negotiated}")
+        return ok
+
     def is_open(self) -> bool:
-        return bool(self.cap and self.cap.isOpened())
-    
+        return self.camera.is_open()
+
     def close(self):
-        if self.cap:
-            try:
-                self.cap.release()
-            finally:
-                self.cap = None
+        self.camera.release()
@@ -0,0 +1,64 @@
+# benchmarks/bench_color.py
+"""
+Colour classification per frame: HSV conversion + three cv2.inRange + ORs
+(hsv_range_mask) against one lookup-table gather (ColorLut.mask), at a few
+table sizes.
+
+Reports mean ms per frame and the fraction of pixels where the table
+disagrees with the ranges (colours cut into bins near a range boundary).
+
+Run from backend/:
+    python -m benchmarks.bench_color ../videos/250_coconuts.mp4
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from app.color_lut import ColorLut
+from app.detection import COCONUT_HSV_RANGES, hsv_range_mask
+
+
+def load(clip: str, max_frames: int):
+    cap = cv2.VideoCapture(clip)
+    frames = []
+    while len(frames) < max_frames:
+        ok, raw = cap.read()
+        if not ok:
+            break
+        frames.append(cv2.resize(raw, (320, 240), interpolation=cv2.INTER_AREA))
+    cap.release()
+    return frames
+
+
+def time_ms(fn, frames, repeat: int) -> float:
+    fn(frames[0])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            fn(frame)
+    return 1000 * (time.perf_counter() - start) / (repeat * len(frames))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Colour mask benchmark")
+    parser.add_argument("clip")
+    parser.add_argument("--max-frames", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = load(args.clip, args.max_frames)
+    reference = [hsv_range_mask(f) for f in frames]
+    print(f"{len(frames)} frames, 320x240")
+    print(f"  {'classifier':<14} {'ms/frame':>9} {'differs':>9}")
+    print(f"  {'hsv ranges':<14} {time_ms(hsv_range_mask, frames, args.repeat):>9.3f} {0:>8.2%}")
+    for bits in (5, 6, 7):
+        lut = ColorLut.from_hsv_ranges(COCONUT_HSV_RANGES, bits)
+        differs = float(np.mean([np.mean(lut.mask(f) != ref) for f, ref in zip(frames, reference)]))
+        name = f"lut {lut.levels}³"
+        print(f"  {name:<14} {time_ms(lut.mask, frames, args.repeat):>9.3f} {differs:>8.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# benchmarks/bench_counting.py
+"""
+Counting rule on synthetic tracker output: the old "id not counted and
+centre above the trigger line" rule against app.counting.LineCounter.
+
+Each scenario is a stream of SORT-style rows [x1, y1, x2, y2, id] per frame
+for nuts moving up the frame across the trigger line:
+
+  clean      every nut crosses once, one id each
+  jostle     nuts stop on the line and wobble a few pixels across it
+  reid       the tracker loses each nut just past the line and gives it a new id
+  split      the watershed briefly splits some nuts above the line, the
+             extra piece gets its own short-lived id
+  reverse    nuts cross, get pushed back below the line and cross again
+
+Reports the count of each rule against the true number of nuts that
+crossed, the ids each rule still holds at the end, and µs per update.
+Also a long shift (--shift-nuts) to show the state staying bounded.
+
+Run from backend/:
+    python -m benchmarks.bench_counting
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.counting import CountLine, LineCounter
+
+LINE_Y = 120
+BOX = 24  # nut box side in pixels
+
+
+class LegacyCounter:
+    """The rule VideoStreamer used before LineCounter."""
+
+    def __init__(self, trigger_line_y: int):
+        self.trigger_line_y = trigger_line_y
+        self.counted_ids = set()
+        self.count = 0
+
+    def update(self, tracked):
+        for d in tracked:
+            x1, y1, x2, y2, obj_id = d.astype(int)
+            center_y = (y1 + y2) // 2
+            if obj_id not in self.counted_ids and center_y < self.trigger_line_y:
+                self.count += 1
+                self.counted_ids.add(obj_id)
+
+
+def _path(y_from: float, y_to: float, speed: float):
+    n = max(2, int(abs(y_to - y_from) / speed) + 1)
+    return list(np.linspace(y_from, y_to, n))
+
+
+def _frames(tracks, gap: int = 12):
+    """
+    tracks: (nut index, first frame of the nut, [(track id, centre y), ...]).
+    Nuts start `gap` frames apart, side by side.
+    """
+    length = max(i * gap + start + len(track) for i, start, track in tracks)
+    frames = [[] for _ in range(length)]
+    for i, start, track in tracks:
+        x = 40 + (i % 8) * 30
+        for t, (track_id, y) in enumerate(track, start=i * gap + start):
+            frames[t].append([x - BOX / 2, y - BOX / 2, x + BOX / 2, y + BOX / 2, track_id])
+    return [np.array(rows, dtype=np.float64).reshape(-1, 5) for rows in frames]
+
+
+def scenario(name: str, nuts: int, rng):
+    tracks, crossed, next_id = [], 0, 1
+    for i in range(nuts):
+        ys = _path(200, 40, 3 + rng.random() * 2)
+        ids = [next_id] * len(ys)
+        next_id += 1
+        if name == "jostle":
+            stop = next(k for k, y in enumerate(ys) if y < LINE_Y + 2)
+            wobble = [LINE_Y + 3 * (-1) ** k for k in range(10)]
+            ys = ys[:stop] + wobble + ys[stop:]
+            ids = [ids[0]] * len(ys)
+        elif name == "reid":
+            past = next(k for k, y in enumerate(ys) if y < LINE_Y - 10)
+            ids = ids[:past] + [next_id] * (len(ys) - past)
+            next_id += 1
+        elif name == "split" and i % 3 == 0:
+            past = next(k for k, y in enumerate(ys) if y < LINE_Y - 10)
+            tracks.append((i, past, [(next_id, y - BOX / 2) for y in ys[past:past + 4]]))
+            next_id += 1
+        elif name == "reverse":
+            past = next(k for k, y in enumerate(ys) if y < LINE_Y - 15)
+            back = _path(ys[past], LINE_Y + 15, 3)
+            ys = ys[:past] + back + _path(LINE_Y + 15, 40, 3)
+            ids = [ids[0]] * len(ys)
+        crossed += 1
+        tracks.append((i, 0, list(zip(ids, ys))))
+    return _frames(tracks), crossed
+
+
+def run(frames, hysteresis: float):
+    legacy = LegacyCounter(LINE_Y)
+    counter = LineCounter([CountLine.horizontal(LINE_Y, direction="up")], hysteresis=hysteresis)
+    t_legacy = t_counter = 0.0
+    for tracked in frames:
+        t0 = time.perf_counter()
+        legacy.update(tracked)
+        t1 = time.perf_counter()
+        counter.update(tracked)
+        t2 = time.perf_counter()
+        t_legacy += t1 - t0
+        t_counter += t2 - t1
+    n = max(1, len(frames))
+    return (legacy.count, len(legacy.counted_ids), 1e6 * t_legacy / n,
+            counter.counts["trigger"], counter.tracked_ids, 1e6 * t_counter / n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Line-crossing counter on synthetic trajectories")
+    parser.add_argument("--nuts", type=int, default=40)
+    parser.add_argument("--hysteresis", type=float, default=4.0)
+    parser.add_argument("--shift-nuts", type=int, default=20000, help="nuts in the long-shift run (0 = skip)")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"trigger line y={LINE_Y}, hysteresis {args.hysteresis} px, {args.nuts} nuts per scenario")
+    print(f"  {'scenario':<10} {'crossed':>8} {'legacy':>7} {'counter':>8} {'legacy ids':>11} {'counter ids':>12} "
+          f"{'legacy µs':>10} {'counter µs':>11}")
+    for name in ("clean", "jostle", "reid", "split", "reverse"):
+        frames, crossed = scenario(name, args.nuts, rng)
+        lc, lids, lus, cc, cids, cus = run(frames, args.hysteresis)
+        print(f"  {name:<10} {crossed:>8} {lc:>7} {cc:>8} {lids:>11} {cids:>12} {lus:>10.1f} {cus:>11.1f}")
+
+    if args.shift_nuts:
+        frames, crossed = scenario("clean", args.shift_nuts, rng)
+        lc, lids, lus, cc, cids, cus = run(frames, args.hysteresis)
+        print(f"long shift: {crossed} nuts, legacy {lc} (holds {lids} ids), counter {cc} (holds {cids} ids)")
+
+
+if __name__ == "__main__":
+    main()
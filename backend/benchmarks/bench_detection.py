@@ -0,0 +1,86 @@
+# benchmarks/bench_detection.py
+"""
+How does per-frame blob extraction scale with the number of coconuts?
+
+Builds synthetic 320x240 watershed label images with N touching discs and
+times the old per-label full-frame mask loop against extract_label_blobs.
+
+Run from backend/:
+    python -m benchmarks.bench_detection
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from app.detection import extract_label_blobs
+
+FRAME_W, FRAME_H = 320, 240
+
+
+def synthetic_labels(n: int, radius: int = 18, seed: int = 0) -> np.ndarray:
+    """Label image with n discs laid out on a jittered grid (neighbours may touch)."""
+    rng = np.random.default_rng(seed)
+    labels = np.zeros((FRAME_H, FRAME_W), dtype=np.int32)
+    cols = max(1, int(np.ceil(np.sqrt(n * FRAME_W / FRAME_H))))
+    rows = int(np.ceil(n / cols))
+    step_x, step_y = FRAME_W / cols, FRAME_H / rows
+    r = int(max(4, min(radius, step_x / 2, step_y / 2)))
+    for i in range(n):
+        cx = int((i % cols + 0.5) * step_x + rng.integers(-2, 3))
+        cy = int((i // cols + 0.5) * step_y + rng.integers(-2, 3))
+        cv2.circle(labels, (cx, cy), r, i + 1, -1)
+    return labels
+
+
+def legacy_extract(labels: np.ndarray, min_area: float = 700):
+    """The original loop from VideoStreamer._process_frame_logic, for comparison."""
+    detections = []
+    for label in np.unique(labels):
+        if label == 0:
+            continue
+        mask = np.zeros(labels.shape, dtype="uint8")
+        mask[labels == label] = 255
+        cnts = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cnts = cnts[0] if len(cnts) == 2 else cnts[1]
+        if len(cnts) == 0:
+            continue
+        c = max(cnts, key=cv2.contourArea)
+        if cv2.contourArea(c) < min_area:
+            continue
+        cv2.minEnclosingCircle(c)
+        (x, y, w, h) = cv2.boundingRect(c)
+        detections.append([x, y, x + w, y + h, 1.0])
+    return np.array(detections, dtype=np.float32).reshape(-1, 5)
+
+
+def _time_ms(fn, labels, repeat: int) -> float:
+    fn(labels)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(labels)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blob extraction scaling benchmark")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 5, 10, 20, 40, 80])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--min-area", type=float, default=100)
+    args = parser.parse_args()
+
+    print(f"{'coconuts':>8} {'legacy ms':>10} {'vectorized ms':>14} {'speedup':>8}")
+    for n in args.counts:
+        labels = synthetic_labels(n)
+        new_dets, _ = extract_label_blobs(labels, min_area=args.min_area)
+        old_dets = legacy_extract(labels, min_area=args.min_area)
+        if not np.array_equal(new_dets, old_dets):
+            print(f"  warning: outputs differ for n={n}")
+        old_ms = _time_ms(lambda l: legacy_extract(l, args.min_area), labels, args.repeat)
+        new_ms = _time_ms(lambda l: extract_label_blobs(l, args.min_area), labels, args.repeat)
+        print(f"{n:>8} {old_ms:>10.3f} {new_ms:>14.3f} {old_ms / new_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_export.py
+"""
+USB export: the old path (whole history rendered to a CSV on the SD card,
+then shutil.copy2 to the stick) against app.export_utils.export_history
+streaming straight to the target, plain and gzip, with fsync and read-back
+verification. Also mount discovery: /proc/mounts parsed per call against the
+cached UsbMounts.
+
+The "stick" is a directory (--dest, default a temp dir), so the numbers are
+for the local disk; on real USB media the byte count is what matters.
+
+Run from backend/:
+    python -m benchmarks.bench_export
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from app import export_utils
+from app.history import HistoryStore
+
+
+def fill(store: HistoryStore, reports: int, buckets: int, days: int):
+    now = time.time()
+    step = days * 86400 / max(1, reports)
+    for i in range(reports):
+        store.record_report("line1", [(b, 800, (i * 7 + b) % 900) for b in range(1, buckets + 1)],
+                            ts=now - days * 86400 + i * step)
+    for m in range(days * 1440):
+        store.record_count("line1", 1 + m % buckets, 40, ts=now - m * 60)
+    store.flush()
+
+
+def legacy(store: HistoryStore, stage: Path, dest: Path) -> int:
+    src = store.write_csv(stage / "reports.csv", "reports")
+    shutil.copy2(src, dest / "reports_legacy.csv")
+    return os.path.getsize(dest / "reports_legacy.csv")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming USB export against render-then-copy")
+    parser.add_argument("--reports", type=int, default=100000)
+    parser.add_argument("--buckets", type=int, default=14)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--dest", default=None, help="directory standing in for the stick")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        dest = Path(args.dest) if args.dest else tmp / "usb"
+        dest.mkdir(exist_ok=True)
+        store = HistoryStore(tmp / "history.db")
+        export_utils.get_history = lambda: store
+        t0 = time.perf_counter()
+        fill(store, args.reports, args.buckets, args.days)
+        print(f"{args.reports} reports x {args.buckets} buckets, {args.days} days of minute rollups "
+              f"(built in {time.perf_counter() - t0:.1f} s)")
+
+        t0 = time.perf_counter()
+        size = legacy(store, tmp, dest)
+        print(f"  {'render + copy2':<28} {time.perf_counter() - t0:7.2f} s {size / 1e6:8.2f} MB "
+              f"(+{size / 1e6:.2f} MB staged on the SD card)")
+        for label, kwargs in (("stream csv, fsync+verify", {}),
+                              ("stream gzip, fsync+verify", {"compress": True}),
+                              ("stream gzip, last 24 h", {"compress": True, "start": time.time() - 86400})):
+            t0 = time.perf_counter()
+            result = export_utils.export_history(dest, **kwargs)
+            print(f"  {label:<28} {time.perf_counter() - t0:7.2f} s {result['bytes'] / 1e6:8.2f} MB "
+                  f"{result['rows']:>8} rows")
+            os.unlink(result["dest"])  # same-second names would collide
+        store.close()
+
+    n = 2000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        export_utils._parse_mounts()
+    parse_us = 1e6 * (time.perf_counter() - t0) / n
+    mounts = export_utils.UsbMounts()
+    mounts.start()
+    time.sleep(0.1)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        mounts.writable()
+    cached_us = 1e6 * (time.perf_counter() - t0) / n
+    print(f"mount discovery: parse /proc/mounts {parse_us:.1f} µs/call, cached {cached_us:.1f} µs/call "
+          f"(watching: {mounts._watching})")
+
+
+if __name__ == "__main__":
+    main()
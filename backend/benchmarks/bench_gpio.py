@@ -0,0 +1,101 @@
+# benchmarks/bench_gpio.py
+"""
+GPIO service latencies on the simulated chip (runs anywhere):
+
+  relay    command queued (e.g. stop_conveyor() from the event loop when a
+           bucket fills) to the chip write on the relay thread
+  button   edge (alert thread) to the asyncio event reaching a coroutine
+
+each with the process idle and with --busy Python threads burning CPU (the
+in-process detection/tracking threads compete for the GIL the same way).
+
+Run from backend/:
+    python -m benchmarks.bench_gpio
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+
+from app.gpio_controller import GpioService, SimulatedGpio
+from app.models import LineConfig
+
+
+def burn(stop: threading.Event):
+    x = 0
+    while not stop.is_set():
+        for i in range(10000):
+            x += i * i
+
+
+def summary(values_us) -> str:
+    values_us = sorted(values_us)
+    p99 = values_us[int(0.99 * (len(values_us) - 1))]
+    return f"p50 {statistics.median(values_us):8.1f} µs  p99 {p99:8.1f} µs  max {values_us[-1]:8.1f} µs"
+
+
+async def measure(service: GpioService, line: LineConfig, n: int):
+    ctrl = service.line(line)
+    writes = service.backend.writes
+    relay = []
+    for i in range(n):
+        writes.clear()
+        t0 = time.perf_counter_ns()
+        if i % 2:
+            ctrl.stop_conveyor()
+        else:
+            ctrl.start_conveyor()
+        while not writes:
+            await asyncio.sleep(0)
+        relay.append((writes[0][2] - t0) / 1e3)
+        await asyncio.sleep(0.002)
+
+    # presses come from a thread of their own, like lgpio's alert thread
+    events = service.subscribe()
+    go, done = threading.Event(), threading.Event()
+
+    def presser():
+        while go.wait() and not done.is_set():
+            go.clear()
+            service.backend.press(line.stop_button_pin)
+
+    threading.Thread(target=presser, daemon=True).start()
+    button = []
+    for _ in range(n // 5):
+        go.set()
+        event = await events.get()
+        button.append((time.time_ns() - event["ts"] * 1e9) / 1e3)
+        await asyncio.sleep(0.002)
+    done.set()
+    go.set()
+    service.unsubscribe(events)
+    return relay, button
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPIO relay command and button event latency (simulated chip)")
+    parser.add_argument("--commands", type=int, default=1000)
+    parser.add_argument("--busy", type=int, default=2, help="CPU-bound threads in the busy run")
+    args = parser.parse_args()
+    line = LineConfig(id="bench", relay_pin=23, buzzer_pin=24, start_button_pin=22, stop_button_pin=16)
+    print(f"GIL switch interval {sys.getswitchinterval() * 1e3:g} ms")
+    for busy in (0, args.busy):
+        service = GpioService(SimulatedGpio())
+        stop = threading.Event()
+        burners = [threading.Thread(target=burn, args=(stop,), daemon=True) for _ in range(busy)]
+        for t in burners:
+            t.start()
+        relay, button = asyncio.run(measure(service, line, args.commands))
+        stop.set()
+        for t in burners:
+            t.join()
+        service.close()
+        print(f"{busy} busy threads")
+        print(f"  relay  command -> write   {summary(relay)}")
+        print(f"  button edge -> coroutine  {summary(button)}")
+
+
+if __name__ == "__main__":
+    main()
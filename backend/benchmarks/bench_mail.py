@@ -0,0 +1,222 @@
+# benchmarks/bench_mail.py
+"""
+Report email against a local stand-in SMTP server (SmtpSink below: plain
+SMTP, no auth, counts sessions and keeps the messages).
+
+  burst    --saves reports saved --gap seconds apart (shift change) on top of
+           a --history long history. Old behaviour: per save, the whole
+           history as attachment over a fresh session. ReportMailer: one
+           session, one email per batching window with only the new rows.
+  outage   the server is down while reports are saved; the mailer retries
+           with backoff and delivers them all once it is back. Then the
+           mailer is stopped with reports unsent and a new one (a restart)
+           sends them.
+
+Run from backend/:
+    python -m benchmarks.bench_mail
+"""
+import argparse
+import email
+import email.policy
+import gzip
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from app import email_utils
+from app.email_utils import SmtpSession, build_report_email
+from app.history import HistoryStore
+from app.mailer import ReportMailer
+
+
+class SmtpSink:
+    """Stand-in SMTP server on localhost. stop()/start() simulate an outage (same port)."""
+
+    def __init__(self, port: int = 0):
+        self.sessions = 0
+        self.messages = []
+        self.bytes = 0
+        self.port = port
+        self._server = None
+        self._open = set()  # client sockets, dropped on stop()
+        self._lock = threading.Lock()
+
+    def _handler(self):
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, text):
+                self.wfile.write(text.encode("ascii") + b"\r\n")
+
+            def handle(self):
+                with sink._lock:
+                    sink.sessions += 1
+                    sink._open.add(self.connection)
+                try:
+                    self.serve()
+                except OSError:
+                    pass  # dropped by stop()
+                finally:
+                    with sink._lock:
+                        sink._open.discard(self.connection)
+
+            def serve(self):
+                self.reply("220 sink ESMTP")
+                data, body = False, []
+                for raw in self.rfile:
+                    line = raw.decode("utf-8", "replace").rstrip("\r\n")
+                    if data:
+                        if line == ".":
+                            data = False
+                            text = "\n".join(body)
+                            with sink._lock:
+                                sink.messages.append(text)
+                                sink.bytes += len(text)
+                            body = []
+                            self.reply("250 OK queued")
+                        else:
+                            body.append(line[1:] if line.startswith("..") else line)
+                        continue
+                    verb = line[:4].upper()
+                    if verb == "EHLO":
+                        self.reply("250-sink")
+                        self.reply("250 8BITMIME")
+                    elif verb == "DATA":
+                        data = True
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:  # HELO, MAIL, RCPT, RSET, NOOP
+                        self.reply("250 OK")
+
+        return Handler
+
+    def start(self):
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            for conn in self._open:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def reset(self):
+        self.sessions, self.messages, self.bytes = 0, [], 0
+
+
+def rows_delivered(sink: SmtpSink) -> int:
+    """Report rows in all attachments received (header line excluded)."""
+    rows = 0
+    for text in sink.messages:
+        for part in email.message_from_string(text, policy=email.policy.default).iter_attachments():
+            data = part.get_payload(decode=True)
+            if part.get_filename().endswith(".gz"):
+                data = gzip.decompress(data)
+            rows += data.decode("utf-8").count("\n") - 1
+    return rows
+
+
+def save(history: HistoryStore, i: int):
+    history.record_report("line1", [(b, 800, 100 + i + b) for b in range(1, 15)])
+
+
+def wait_sent(mailer: ReportMailer, timeout: float) -> float:
+    t0 = time.perf_counter()
+    while mailer.pending() and time.perf_counter() - t0 < timeout:
+        time.sleep(0.01)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report email queue against a stand-in SMTP server")
+    parser.add_argument("--history", type=int, default=20000, help="reports already in the history")
+    parser.add_argument("--saves", type=int, default=20)
+    parser.add_argument("--gap", type=float, default=0.05, help="seconds between saves in the burst")
+    parser.add_argument("--window", type=float, default=1.0, help="batching window, seconds")
+    args = parser.parse_args()
+    email_utils.EMAIL_FROM = "counter@localhost"
+    email_utils.EMAIL_TO = "office@localhost"
+
+    sink = SmtpSink().start()
+    with tempfile.TemporaryDirectory() as tmp:
+        history = HistoryStore(Path(tmp) / "history.db")
+        for i in range(args.history):
+            save(history, i)
+        history.flush()
+
+        # old behaviour: fresh session + whole history per save
+        t0 = time.perf_counter()
+        for i in range(args.saves):
+            save(history, i)
+            history.flush()
+            data = "".join(history.iter_csv("reports")).encode("utf-8")
+            session = SmtpSession("127.0.0.1", sink.port, user=None, security="none")
+            session.send(build_report_email("Please find attached the latest coconut count report.", data, "reports.csv"))
+            session.close()
+            time.sleep(args.gap)
+        legacy = (time.perf_counter() - t0, sink.sessions, len(sink.messages), sink.bytes)
+        sink.reset()
+
+        mailer = ReportMailer(history, SmtpSession("127.0.0.1", sink.port, user=None, security="none"),
+                              window=args.window, retry_min=0.2, retry_max=2.0, session_idle=5.0)
+        t0 = time.perf_counter()
+        for i in range(args.saves):
+            save(history, i)
+            mailer.notify()
+            time.sleep(args.gap)
+        wait_sent(mailer, 30)
+        queued = (time.perf_counter() - t0, sink.sessions, len(sink.messages), sink.bytes, rows_delivered(sink))
+        print(f"burst: {args.saves} saves {args.gap:g} s apart, {args.history} reports in the history")
+        print(f"  {'':<14} {'seconds':>8} {'sessions':>9} {'emails':>7} {'kB sent':>9}")
+        print(f"  {'fresh + whole':<14} {legacy[0]:>8.2f} {legacy[1]:>9} {legacy[2]:>7} {legacy[3] / 1e3:>9.1f}")
+        print(f"  {'ReportMailer':<14} {queued[0]:>8.2f} {queued[1]:>9} {queued[2]:>7} {queued[3] / 1e3:>9.1f}"
+              f"   ({queued[4]} rows delivered, window {args.window:g} s)")
+
+        # outage: server down while saving, back after 1.5 s
+        sink.reset()
+        sink.stop()
+        t0 = time.perf_counter()
+        for i in range(10):
+            save(history, i)
+            mailer.notify()
+        time.sleep(1.5)
+        failures = mailer.failures
+        sink.start()
+        waited = wait_sent(mailer, 30)
+        print(f"outage: 10 saves while down, {failures} failed attempts, delivered "
+              f"{time.perf_counter() - t0:.2f} s after the first save ({waited:.2f} s after the server came back), "
+              f"{rows_delivered(sink)} rows in {len(sink.messages)} email(s)")
+
+        # restart with reports unsent
+        sink.reset()
+        for i in range(5):
+            save(history, i)
+            mailer.notify()
+        mailer.close()
+        restarted = ReportMailer(history, SmtpSession("127.0.0.1", sink.port, user=None, security="none"),
+                                 window=0.1, retry_min=0.2)
+        left = restarted.pending()
+        restarted.start()
+        wait_sent(restarted, 30)
+        print(f"restart: {left} reports left unsent by the stopped mailer, {rows_delivered(sink)} delivered "
+              f"by the new one in {len(sink.messages)} email(s)")
+        restarted.close()
+        history.close()
+    sink.stop()
+
+
+if __name__ == "__main__":
+    main()
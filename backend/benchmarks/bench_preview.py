@@ -0,0 +1,100 @@
+# benchmarks/bench_preview.py
+"""
+Per-frame cost of getting a preview to one client, three ways:
+
+  legacy     draw, encode, tobytes(), header + jpeg concatenation (the old send path)
+  annotated  draw, encode, header written into one buffer (PreviewFrame.framed)
+  vector     camera MJPEG sent as is + JSON overlay (PreviewFrame.raw / overlay_message)
+
+Reports mean ms per frame and JPEG bytes copied per frame. The camera's own
+JPEG is simulated by encoding each decoded frame once up front, as an MJPG
+camera would deliver it.
+
+Run from backend/:
+    python -m benchmarks.bench_preview ../videos/250_coconuts.mp4
+"""
+import argparse
+import asyncio
+import struct
+import time
+
+import cv2
+import numpy as np
+
+from app.preview import QUALITY_LADDER, PreviewFrame, draw_overlay
+from app.video_streamer import VideoStreamer
+
+
+def load(clip: str, max_frames: int):
+    streamer = VideoStreamer(source=clip)
+    streamer.motion_gate = None
+    cap = cv2.VideoCapture(clip)
+    items = []
+    while len(items) < max_frames:
+        ok, raw = cap.read()
+        if not ok:
+            break
+        count, frame, overlay = streamer.count_frame(raw)
+        camera_jpeg = cv2.imencode(".jpg", raw, [int(cv2.IMWRITE_JPEG_QUALITY), 80])[1]
+        items.append((count, frame, overlay, camera_jpeg))
+    cap.release()
+    return items
+
+
+def legacy(count, frame, overlay, level):
+    image = frame.copy()
+    draw_overlay(image, overlay)
+    jpeg_bytes = cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), level.quality])[1].tobytes()
+    message = struct.pack("!I", count) + jpeg_bytes
+    return message, 2 * len(jpeg_bytes)  # tobytes() + concatenation
+
+
+async def annotated(count, frame, overlay, level):
+    pf = PreviewFrame(count, frame.copy(), overlay)
+    message = await pf.framed(level)
+    return message, len(message) - 4
+
+
+async def vector(count, frame, overlay, camera_jpeg, level):
+    pf = PreviewFrame(count, frame, overlay, jpeg=camera_jpeg, keep_raw=True)
+    text = pf.overlay_message()
+    data = await pf.raw(level)
+    return (text, data), 0
+
+
+async def run(items, level):
+    results = {}
+    for name in ("legacy", "annotated", "vector"):
+        times, copied = [], []
+        for count, frame, overlay, camera_jpeg in items:
+            t0 = time.perf_counter()
+            if name == "legacy":
+                _, c = legacy(count, frame, overlay, level)
+            elif name == "annotated":
+                _, c = await annotated(count, frame, overlay, level)
+            else:
+                _, c = await vector(count, frame, overlay, camera_jpeg, level)
+            times.append(time.perf_counter() - t0)
+            copied.append(c)
+        results[name] = (1000 * float(np.mean(times)), float(np.mean(copied)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preview send-path benchmark")
+    parser.add_argument("clip")
+    parser.add_argument("--max-frames", type=int, default=150)
+    parser.add_argument("--level", type=int, default=1, help="index into QUALITY_LADDER")
+    args = parser.parse_args()
+
+    items = load(args.clip, args.max_frames)
+    level = QUALITY_LADDER[args.level]
+    results = asyncio.run(run(items, level))
+    print(f"{len(items)} frames, level {level}")
+    print(f"  {'path':<10} {'ms/frame':>9} {'bytes copied/frame':>19}")
+    for name, (ms, copied) in results.items():
+        print(f"  {name:<10} {ms:>9.2f} {copied:>19.0f}")
+
+
+if __name__ == "__main__":
+    main()
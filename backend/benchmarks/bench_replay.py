@@ -0,0 +1,145 @@
+# benchmarks/bench_replay.py
+"""
+Replay recorded clips through the counter headless and report throughput
+and accuracy.
+
+For each clip: per-stage timings (decode, resize, HSV masks, distance
+transform, watershed, contours, tracking, annotate+encode), p50/p99 frame
+latency, FPS, and the count error against ground truth.
+
+Ground truth, first match wins:
+  --expected N                  (single clip)
+  <clip>.gt.json                {"count": 250}
+  a leading number in the name  250_coconuts.mp4 -> 250
+
+Run from backend/:
+    python -m benchmarks.bench_replay ../videos/250_coconuts.mp4
+    python -m benchmarks.bench_replay ../videos/*.mp4 --detector mog2 --no-encode --json results.json
+    python -m benchmarks.bench_replay ../videos/250_coconuts.mp4 --detector pyramid
+    python -m benchmarks.bench_replay ../videos/idle_belt.mp4 --no-motion-gate   # gate off, for comparison
+"""
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from app.preview import draw_overlay
+from app.roi import Roi
+from app.timing import LapTimer
+from app.video_streamer import VideoStreamer, detector_from_config
+
+STAGE_ORDER = ("decode", "resize", "motion_gate", "hsv_masks", "distance_transform", "watershed",
+               "contours", "detection", "tracking", "encode")
+
+
+def ground_truth(clip: Path, expected: int = None):
+    if expected is not None:
+        return expected
+    sidecar = clip.with_suffix(clip.suffix + ".gt.json")
+    if not sidecar.exists():
+        sidecar = clip.with_suffix(".gt.json")
+    if sidecar.exists():
+        return int(json.loads(sidecar.read_text())["count"])
+    m = re.match(r"(\d+)", clip.name)
+    return int(m.group(1)) if m else None
+
+
+def replay(clip: Path, detector: str, trigger_line_y: int, encode: bool, max_frames: int = None, band: int = None,
+           motion_gate: bool = True) -> dict:
+    roi = Roi(trigger_line_y=trigger_line_y, band=band)
+    streamer = VideoStreamer(source=str(clip), detector=detector_from_config(detector), roi=roi)
+    if not motion_gate:
+        streamer.motion_gate = None
+    timer = LapTimer()
+    streamer.timer = timer
+    streamer.detector.timer = timer
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 50]
+
+    cap = cv2.VideoCapture(str(clip))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {clip}")
+    frame_times = []
+    skipped = 0
+    wall_start = time.perf_counter()
+    while max_frames is None or len(frame_times) < max_frames:
+        t0 = time.perf_counter()
+        timer.start()
+        ret, raw = cap.read()
+        if not ret:
+            break
+        timer.lap("decode")
+        frame = cv2.resize(raw, (320, 240))
+        timer.lap("resize")
+        overlay = streamer._process_frame_logic(frame)
+        skipped += streamer.saved_seconds is not None
+        if encode:
+            draw_overlay(frame, overlay)
+            cv2.imencode(".jpg", frame, encode_param)
+            timer.lap("encode")
+        frame_times.append(time.perf_counter() - t0)
+    wall = time.perf_counter() - wall_start
+    cap.release()
+
+    frame_ms = np.array(frame_times) * 1000
+    stages = {}
+    for stage in sorted(timer.samples, key=lambda s: STAGE_ORDER.index(s) if s in STAGE_ORDER else len(STAGE_ORDER)):
+        ms = np.array(timer.samples[stage]) * 1000
+        stages[stage] = {"mean_ms": float(ms.mean()), "p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+    return {
+        "clip": str(clip),
+        "detector": detector,
+        "frames": len(frame_times),
+        "fps": len(frame_times) / wall if wall else 0.0,
+        "p50_ms": float(np.percentile(frame_ms, 50)) if len(frame_ms) else 0.0,
+        "p99_ms": float(np.percentile(frame_ms, 99)) if len(frame_ms) else 0.0,
+        "count": streamer.current_count,
+        "skipped": skipped,
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline replay benchmark")
+    parser.add_argument("clips", nargs="+", type=Path)
+    parser.add_argument("--detector", default="hsv_watershed")
+    parser.add_argument("--trigger-line-y", type=int, default=120)
+    parser.add_argument("--band", type=int, default=None, help="only detect within this many px of the trigger line")
+    parser.add_argument("--expected", type=int, default=None, help="ground-truth count (single clip)")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--no-encode", action="store_true", help="skip annotate+JPEG (headless line)")
+    parser.add_argument("--no-motion-gate", action="store_true", help="detect every frame, even with no motion")
+    parser.add_argument("--json", type=Path, default=None, help="also write results here")
+    args = parser.parse_args()
+
+    results = []
+    for clip in args.clips:
+        r = replay(clip, args.detector, args.trigger_line_y, not args.no_encode, args.max_frames, args.band,
+                   not args.no_motion_gate)
+        truth = ground_truth(clip, args.expected if len(args.clips) == 1 else None)
+        r["expected"] = truth
+        r["count_error"] = None if truth is None else r["count"] - truth
+        results.append(r)
+
+        print(f"\n{clip.name}  [{args.detector}]  {r['frames']} frames")
+        print(f"  {'stage':<20} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for stage, s in r["stages"].items():
+            print(f"  {stage:<20} {s['mean_ms']:>8.2f} {s['p50_ms']:>8.2f} {s['p99_ms']:>8.2f}")
+        print(f"  frame latency p50 {r['p50_ms']:.2f} ms, p99 {r['p99_ms']:.2f} ms, {r['fps']:.1f} FPS")
+        if r["frames"]:
+            print(f"  motion gate skipped {r['skipped']} frames ({100.0 * r['skipped'] / r['frames']:.0f}%)")
+        if truth is None:
+            print(f"  count {r['count']} (no ground truth)")
+        else:
+            pct = 100.0 * r["count_error"] / truth if truth else 0.0
+            print(f"  count {r['count']} / expected {truth}  error {r['count_error']:+d} ({pct:+.1f}%)")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/bench_startup.py
+"""
+How long does the backend take to import, and what pulls in the time?
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter,
+prints the total and the slowest modules, and flags heavy packages that must
+not load at startup (plotting, scipy, skimage, filterpy). Exits non-zero when a
+banned module is imported or --budget-ms is exceeded, so it can gate CI.
+
+Run from backend/:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --module sort.batch_sort --budget-ms 300
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# none of these are needed until a frame is processed (or ever, on the server)
+BANNED = ("matplotlib", "tkinter", "scipy", "skimage", "filterpy", "onnxruntime")
+
+
+def import_times(module: str):
+    """Return [(name, self_us, cumulative_us)] for a cold import of module."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cum_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend import-time benchmark")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    total_ms = next(cum for name, _, cum in rows if name == args.module) / 1000
+    print(f"import {args.module}: {total_ms:.1f} ms, {len(rows)} modules")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for name, self_us, cum_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cum_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+
+    failed = False
+    loaded = {name.split(".")[0] for name, _, _ in rows}
+    for pkg in BANNED:
+        if pkg in loaded:
+            print(f"FAIL: {pkg} is imported at startup")
+            failed = True
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"FAIL: {total_ms:.1f} ms exceeds budget of {args.budget_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# benchmarks/bench_stop.py
+"""
+Bucket stop overfill on a simulated belt: nuts at random spacing move up the
+frame at --speed px/s past the trigger line; detections (with jitter and
+missed frames) go through the real tracker (BatchSort) and LineCounter.
+
+  threshold   the belt is told to stop when the bucket's count reaches the
+              set value
+  predictive  ... when the count plus the nuts LineCounter.arrivals() (Kalman
+              velocities) puts within the stopping time reaches it
+
+After the stop decision the belt runs on for --latency seconds (relay +
+motor run-on, what STOP_COAST_S models), then stands still; whatever crossed
+the line by then is in the bucket. Reports overfill per bucket (actual and
+as predicted at the stop) for both modes, and with the model's latency off
+by --model-error to show the calibration bias /history/stops reports.
+
+Run from backend/:
+    python -m benchmarks.bench_stop
+"""
+import argparse
+import statistics
+
+import numpy as np
+
+from app.counting import CountLine, LineCounter
+from sort.batch_sort import BatchSort
+
+FPS = 30.0
+LINE_Y = 120
+BOX = 24
+
+
+class Belt:
+    """Nut centres (y, x) on a belt moving up; new nuts enter below the frame."""
+
+    def __init__(self, rng, speed: float, gap: float):
+        self.rng = rng
+        self.speed = speed  # px/s
+        self.gap = gap      # mean px between nuts
+        self.nuts = []      # [y, x]
+        self.next_y = 260.0
+
+    def advance(self, dt: float):
+        dy = self.speed * dt
+        for nut in self.nuts:
+            nut[0] -= dy
+        self.next_y -= dy
+        while self.next_y < 280:
+            self.nuts.append([self.next_y, float(self.rng.uniform(60, 260))])
+            self.next_y += max(BOX * 1.2, self.rng.exponential(self.gap))
+        self.nuts = [n for n in self.nuts if n[0] > -BOX]
+
+    def detections(self, miss: float) -> np.ndarray:
+        rows = []
+        for y, x in self.nuts:
+            if 0 <= y <= 240 and self.rng.random() >= miss:
+                y, x = y + self.rng.normal(0, 1), x + self.rng.normal(0, 1)
+                rows.append([x - BOX / 2, y - BOX / 2, x + BOX / 2, y + BOX / 2, 1.0])
+        return np.array(rows) if rows else np.empty((0, 5))
+
+
+def run(mode: str, args, model_latency: float, seed: int):
+    rng = np.random.default_rng(seed)
+    belt = Belt(rng, args.speed, args.gap)
+    tracker = BatchSort(max_age=5, min_hits=1, iou_threshold=0.2)
+    counter = LineCounter([CountLine.horizontal(LINE_Y, 320, -1)])
+    dt = 1.0 / FPS
+    results = []  # (actual overfill, predicted overfill)
+    count, stop_at, stopped_at, forecast = 0, None, None, None
+    t = 0.0
+    for _ in range(60):  # get the tracker going
+        belt.advance(dt)
+    while len(results) < args.buckets:
+        t += dt
+        if stop_at is None or t < stop_at:
+            belt.advance(dt)
+        elif stopped_at is None:
+            stopped_at = t
+        tracked = tracker.update(belt.detections(args.miss))
+        count += counter.update(tracked)["trigger"]
+        if len(tracked):
+            ids = tracker.track_ids
+            order = np.argsort(ids)
+            velocities = tracker.velocities[order[np.searchsorted(ids, tracked[:, 4], sorter=order)]]
+            arrivals = counter.arrivals(tracked, velocities) * dt
+        else:
+            arrivals = np.empty(0)
+        if stop_at is None:
+            in_flight = int(np.searchsorted(arrivals, model_latency, side="right"))
+            due = count >= args.set_value or (mode == "predictive" and count + in_flight >= args.set_value)
+            if due:
+                stop_at = t + args.latency
+                forecast = count + in_flight - args.set_value
+        elif stopped_at is not None and t - stopped_at >= 0.5:
+            # settled: next bucket, belt restarts
+            results.append((count - args.set_value, forecast))
+            count, stop_at, stopped_at = 0, None, None
+    return results
+
+
+def summary(name: str, results):
+    actual = [a for a, _ in results]
+    error = [a - p for a, p in results]
+    under = sum(a < 0 for a in actual)
+    return (f"  {name:<26} overfill mean {statistics.mean(actual):5.2f}  max {max(actual):3d}  "
+            f"under {under:3d}/{len(actual)}   forecast bias {statistics.mean(error):+5.2f}  "
+            f"|err| {statistics.mean(abs(e) for e in error):4.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Threshold vs predictive bucket stop on a simulated belt")
+    parser.add_argument("--buckets", type=int, default=60)
+    parser.add_argument("--set-value", type=int, default=40)
+    parser.add_argument("--speed", type=float, default=240.0, help="belt px/s")
+    parser.add_argument("--gap", type=float, default=40.0, help="mean px between nuts")
+    parser.add_argument("--latency", type=float, default=0.3, help="true stopping latency, s")
+    parser.add_argument("--miss", type=float, default=0.03, help="missed detection probability")
+    parser.add_argument("--model-error", type=float, default=0.1, help="s the model's latency is off by")
+    args = parser.parse_args()
+    print(f"belt {args.speed:g} px/s, a nut every {args.gap:g} px on average "
+          f"({args.speed / args.gap:.1f} nuts/s), stopping latency {args.latency:g} s, "
+          f"{args.buckets} buckets of {args.set_value}")
+    print(summary("threshold", run("threshold", args, args.latency, 1)))
+    print(summary("predictive", run("predictive", args, args.latency, 1)))
+    low = max(0.0, args.latency - args.model_error)
+    print(summary(f"predictive, model {low:g} s", run("predictive", args, low, 1)))
+    high = args.latency + args.model_error
+    print(summary(f"predictive, model {high:g} s", run("predictive", args, high, 1)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# sort/batch_sort.py
+"""
+SORT with every track's Kalman state kept in preallocated NumPy arrays.
+
+Same model and same output as sort.Sort (constant-velocity box model,
+IOU association, identical track ids and row order), but predict and update
+run once per frame over all tracks instead of once per KalmanBoxTracker.
+"""
+import numpy as np
+
+from sort.sort import iou_batch, linear_assignment
+
+DIM_X, DIM_Z = 7, 4
+
+# constant velocity model, same matrices KalmanBoxTracker builds
+F = np.eye(DIM_X)
+F[0, 4] = F[1, 5] = F[2, 6] = 1.0
+R = np.diag([1.0, 1.0, 10.0, 10.0])
+Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+P0 = np.diag([10.0, 10.0, 10.0, 10.0, 10000.0, 10000.0, 10000.0])
+I7 = np.eye(DIM_X)
+
+
+def bboxes_to_z(bboxes: np.ndarray) -> np.ndarray:
+    """[x1,y1,x2,y2] rows -> [x,y,s,r] rows (centre, area, aspect ratio)."""
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    z = np.empty((len(bboxes), DIM_Z))
+    z[:, 0] = bboxes[:, 0] + w / 2.
+    z[:, 1] = bboxes[:, 1] + h / 2.
+    z[:, 2] = w * h
+    z[:, 3] = w / h
+    return z
+
+
+def x_to_bboxes(x: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """[x,y,s,r,...] state rows -> [x1,y1,x2,y2] rows (nan for a collapsed box)."""
+    if out is None:
+        out = np.empty((len(x), 4))
+    with np.errstate(invalid="ignore"):
+        w = np.sqrt(x[:, 2] * x[:, 3])
+        h = x[:, 2] / w
+    out[:, 0] = x[:, 0] - w / 2.
+    out[:, 1] = x[:, 1] - h / 2.
+    out[:, 2] = x[:, 0] + w / 2.
+    out[:, 3] = x[:, 1] + h / 2.
+    return out
+
+
+def associate(detections: np.ndarray, trackers: np.ndarray, iou_threshold: float = 0.3):
+    """
+    Vectorised associate_detections_to_trackers.
+    Returns (matches (K, 2), unmatched_detections) with unmatched detections in
+    the same order as the original, since that order decides new track ids.
+    """
+    n_det = len(detections)
+    if len(trackers) == 0 or n_det == 0:
+        return np.empty((0, 2), dtype=int), np.arange(n_det)
+
+    iou_matrix = iou_batch(detections, trackers)
+    a = (iou_matrix > iou_threshold).astype(np.int32)
+    if a.sum(1).max() == 1 and a.sum(0).max() == 1:
+        matched = np.stack(np.where(a), axis=1)
+    else:
+        matched = linear_assignment(-iou_matrix).reshape(-1, 2).astype(int)
+
+    det_matched = np.zeros(n_det, dtype=bool)
+    det_matched[matched[:, 0]] = True
+    good = iou_matrix[matched[:, 0], matched[:, 1]] >= iou_threshold
+    unmatched = np.concatenate((np.flatnonzero(~det_matched), matched[~good, 0]))
+    return matched[good], unmatched
+
+
+class BatchSort:
+    """
+    Drop-in replacement for sort.Sort.
+    Track i lives in row i of the state arrays; rows stay in creation order so
+    association and output order match the list-of-trackers version.
+    """
+
+    # shared with every instance, like KalmanBoxTracker.count
+    count = 0
+
+    def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, capacity: int = 64):
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.iou_threshold = iou_threshold
+        self.frame_count = 0
+        self._n = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self._cap = capacity
+        self._x = np.zeros((capacity, DIM_X))
+        self._P = np.zeros((capacity, DIM_X, DIM_X))
+        self._tmp = np.empty((capacity, DIM_X, DIM_X))
+        self._boxes = np.empty((capacity, 4))
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._hits = np.zeros(capacity, dtype=np.int64)
+        self._hit_streak = np.zeros(capacity, dtype=np.int64)
+        self._age = np.zeros(capacity, dtype=np.int64)
+        self._tsu = np.zeros(capacity, dtype=np.int64)  # time since update
+
+    def _grow(self, needed: int):
+        old = (self._x, self._P, self._ids, self._hits, self._hit_streak, self._age, self._tsu)
+        n = self._n
+        cap = self._cap
+        while cap < needed:
+            cap *= 2
+        self._allocate(cap)
+        for dst, src in zip((self._x, self._P, self._ids, self._hits, self._hit_streak, self._age, self._tsu), old):
+            dst[:n] = src[:n]
+
+    def _compact(self, keep: np.ndarray):
+        """Drop rows where keep is False, preserving order."""
+        n = self._n
+        k = int(keep.sum())
+        if k == n:
+            return
+        for arr in (self._x, self._P, self._ids, self._hits, self._hit_streak, self._age, self._tsu):
+            arr[:k] = arr[:n][keep]
+        self._n = k
+
+    @property
+    def live_tracks(self) -> int:
+        return self._n
+
+    @property
+    def velocities(self) -> np.ndarray:
+        """(N, 2) per-track [vx, vy] in pixels/frame, rows aligned with track_ids."""
+        return self._x[:self._n, 4:6].copy()
+
+    @property
+    def track_ids(self) -> np.ndarray:
+        """Output ids (id + 1, as returned by update) of the live tracks."""
+        return self._ids[:self._n] + 1
+
+    def _predict(self) -> np.ndarray:
+        n = self._n
+        x = self._x[:n]
+        P = self._P[:n]
+        # area must not go negative
+        x[x[:, 6] + x[:, 2] <= 0, 6] = 0.0
+        x[:, :3] += x[:, 4:7]
+        np.matmul(F, P, out=self._tmp[:n])
+        np.matmul(self._tmp[:n], F.T, out=P)
+        P += Q
+        self._age[:n] += 1
+        self._hit_streak[:n][self._tsu[:n] > 0] = 0
+        self._tsu[:n] += 1
+        return x_to_bboxes(x, out=self._boxes[:n])
+
+    def _update(self, rows: np.ndarray, z: np.ndarray):
+        """Kalman update (Joseph form, as filterpy) for the given track rows."""
+        x = self._x[rows]
+        P = self._P[rows]
+        y = z - x[:, :DIM_Z]
+        PHT = P[:, :, :DIM_Z]
+        S = PHT[:, :DIM_Z, :] + R
+        K = PHT @ np.linalg.inv(S)
+        x += (K @ y[:, :, None])[:, :, 0]
+        I_KH = I7 - np.pad(K, ((0, 0), (0, 0), (0, DIM_X - DIM_Z)))
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ R @ K.transpose(0, 2, 1)
+        self._x[rows] = x
+        self._P[rows] = P
+        self._tsu[rows] = 0
+        self._hits[rows] += 1
+        self._hit_streak[rows] += 1
+
+    def _spawn(self, z: np.ndarray):
+        m = len(z)
+        if m == 0:
+            return
+        if self._n + m > self._cap:
+            self._grow(self._n + m)
+        sl = slice(self._n, self._n + m)
+        self._x[sl] = 0.0
+        self._x[sl, :DIM_Z] = z
+        self._P[sl] = P0
+        self._ids[sl] = np.arange(BatchSort.count, BatchSort.count + m)
+        BatchSort.count += m
+        self._hits[sl] = 0
+        self._hit_streak[sl] = 0
+        self._age[sl] = 0
+        self._tsu[sl] = 0
+        self._n += m
+
+    def update(self, dets=np.empty((0, 5))):
+        """
+        dets: (N, 5) [x1,y1,x2,y2,score], call once per frame even when empty.
+        Returns (M, 5) [x1,y1,x2,y2,id], same as sort.Sort.update.
+        """
+        self.frame_count += 1
+
+        trks = self._predict()
+        valid = ~np.isnan(trks).any(axis=1)
+        if not valid.all():
+            self._compact(valid)
+            trks = self._boxes[:self._n]
+
+        matched, unmatched_dets = associate(dets, trks, self.iou_threshold)
+        if len(matched):
+            self._update(matched[:, 1], bboxes_to_z(dets[matched[:, 0], :4]))
+        if len(unmatched_dets):
+            self._spawn(bboxes_to_z(dets[unmatched_dets.astype(int), :4]))
+
+        n = self._n
+        tsu = self._tsu[:n]
+        show = (tsu < 1) & ((self._hit_streak[:n] >= self.min_hits) | (self.frame_count <= self.min_hits))
+        rows = np.flatnonzero(show)[::-1]  # newest first, like the original
+        ret = np.empty((len(rows), 5))
+        if len(rows):
+            ret[:, :4] = x_to_bboxes(self._x[rows])
+            ret[:, 4] = self._ids[rows] + 1
+
+        # remove dead tracklets
+        self._compact(tsu <= self.max_age)
+        return ret
@@ -0,0 +1,108 @@
+# tests/test_broadcast.py
+"""Subscriber text backlog: control messages are never dropped for a slow client."""
+import asyncio
+import json
+
+from app.broadcast import Subscriber
+from app.state_sync import BucketStateSync
+
+
+class SlowSocket:
+    """WebSocket stand-in whose sends wait until `open` is set."""
+
+    def __init__(self):
+        self.texts = []
+        self.closed = None
+        self.open = asyncio.Event()
+
+    async def send_text(self, text):
+        await self.open.wait()
+        self.texts.append(text)
+
+    async def send_bytes(self, data):
+        await self.open.wait()
+
+    async def close(self, code=1000, reason=""):
+        self.closed = code
+
+
+class Hub:
+    def __init__(self):
+        self.subscribers = []
+
+    def publish_text(self, text):
+        for sub in self.subscribers:
+            sub.send_text(text)
+
+
+def run(scenario):
+    return asyncio.run(scenario())
+
+
+def test_delta_backlog_becomes_one_snapshot_and_control_messages_survive():
+    async def scenario():
+        buckets = [{"id": i, "count": 0, "set_value": 800, "filled": False} for i in range(1, 4)]
+        hub = Hub()
+        state = BucketStateSync(hub, buckets)
+        ws = SlowSocket()
+        sub = Subscriber(ws, max_texts=8, resync=state.snapshot_message)
+        hub.subscribers.append(sub)
+        task = asyncio.create_task(sub.run())
+        await asyncio.sleep(0)
+        sub.send_text("first")  # picked up by the sender, stuck in send_text
+        await asyncio.sleep(0)
+        sub.send_text("started")
+        for n in range(1, 21):
+            buckets[0]["count"] = n
+            state.mark([1])
+            state.flush()
+            if n == 10:
+                sub.send_text("stopped")
+        ws.open.set()
+        await asyncio.sleep(0.05)
+        sub.close()
+        await task
+        return ws, sub, state
+
+    ws, sub, state = run(scenario)
+    assert not sub.overflowed and ws.closed is None
+    assert [t for t in ws.texts if not t.startswith("{")] == ["first", "started", "stopped"]
+    snapshots = [json.loads(t) for t in ws.texts if t.startswith('{"type": "buckets_update"')]
+    assert len(snapshots) == 1
+    # built when sent: the final counts, not the ones when the backlog collapsed
+    assert snapshots[0]["seq"] == state.seq == 20
+    assert snapshots[0]["buckets"][0]["count"] == 20
+    assert len(ws.texts) <= 8 + 1
+
+
+def test_client_too_far_behind_on_control_messages_is_disconnected():
+    async def scenario():
+        ws = SlowSocket()
+        sub = Subscriber(ws, max_texts=4, resync=lambda: "{}")
+        task = asyncio.create_task(sub.run())
+        await asyncio.sleep(0)
+        for i in range(6):
+            sub.send_text(f"msg {i}")
+        ws.open.set()
+        await asyncio.wait_for(task, 1.0)
+        return ws, sub
+
+    ws, sub = run(scenario)
+    assert sub.overflowed
+    assert ws.closed == 1013
+
+
+def test_texts_are_kept_in_order_under_the_limit():
+    async def scenario():
+        ws = SlowSocket()
+        ws.open.set()
+        sub = Subscriber(ws, max_texts=64)
+        task = asyncio.create_task(sub.run())
+        for i in range(50):
+            sub.send_text(str(i))
+        await asyncio.sleep(0.05)
+        sub.close()
+        await task
+        return ws
+
+    assert run(scenario).texts == [str(i) for i in range(50)]
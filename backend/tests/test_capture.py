@@ -0,0 +1,135 @@
+# tests/test_capture.py
+"""Camera against a generated video file (plain and looping, as a camera stand-in) and a scripted capture."""
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from app.capture import Camera, CaptureSettings
+
+FRAMES = 30
+FPS = 30.0
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    """A 1 s, 30 fps MJPG clip whose frame i has brightness 8 * i."""
+    path = tmp_path_factory.mktemp("video") / "belt.avi"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), FPS, (320, 240))
+    for i in range(FRAMES):
+        writer.write(np.full((240, 320, 3), 8 * i, np.uint8))
+    writer.release()
+    return str(path)
+
+
+class ScriptedCapture:
+    """Stands in for cv2.VideoCapture: grab() succeeds `frames` times, then fails (camera unplugged)."""
+
+    def __init__(self, frames: int, interval: float = 0.005):
+        self.frames = frames
+        self.interval = interval
+        self.grabs = 0
+
+    def isOpened(self):
+        return True
+
+    def grab(self):
+        time.sleep(self.interval)
+        if self.grabs >= self.frames:
+            return False
+        self.grabs += 1
+        return True
+
+    def retrieve(self):
+        return True, np.full((240, 320, 3), self.grabs % 256, np.uint8)
+
+    def release(self):
+        pass
+
+
+def live_camera(capture) -> Camera:
+    camera = Camera(0, CaptureSettings(latest_only=True))
+    camera.cap = capture
+    camera._start()
+    return camera
+
+
+def test_file_plays_once_in_order(clip):
+    camera = Camera(clip, CaptureSettings(latest_only=True))
+    assert camera.open(1, 0)
+    assert not camera.is_live
+    assert camera.negotiated["width"] == 320 and camera.negotiated["height"] == 240
+    levels = []
+    while (frame := camera.read()) is not None:
+        levels.append(int(frame.mean()))
+    camera.release()
+    # open() consumed the first frame; a recorded file never drops one
+    assert len(levels) == FRAMES - 1
+    assert levels == sorted(levels)
+
+
+def test_looping_file_is_a_paced_live_source(clip):
+    camera = Camera(clip, CaptureSettings(latest_only=True, loop=True))
+    assert camera.open(1, 0)
+    assert camera.is_live
+    t0 = time.monotonic()
+    frames = [camera.read() for _ in range(45)]
+    elapsed = time.monotonic() - t0
+    camera.release()
+    assert all(f is not None for f in frames)  # restarts instead of ending
+    assert elapsed >= 40 / FPS  # paced at the file's rate, not as fast as it decodes
+    assert camera.fps == pytest.approx(FPS, rel=0.3)
+
+
+def test_latest_only_skips_stale_frames(clip):
+    camera = Camera(clip, CaptureSettings(latest_only=True, loop=True))
+    assert camera.open(1, 0)
+    camera.read()
+    grabbed, retrieved = camera.grabbed, camera.retrieved
+    time.sleep(0.3)  # the reader falls behind
+    camera.read()
+    camera.release()
+    assert camera.grabbed - grabbed >= 5
+    assert camera.retrieved - retrieved == 1  # only the newest frame is decoded
+
+
+def test_read_returns_none_once_the_camera_is_gone():
+    camera = live_camera(ScriptedCapture(frames=3))
+    frames = []
+    t0 = time.monotonic()
+    while (frame := camera.read()) is not None:
+        frames.append(frame)
+    elapsed = time.monotonic() - t0
+    camera.release()
+    assert 1 <= len(frames) <= 3
+    # ten failed grabs end the stream at once, the reader does not sit out its timeout
+    assert elapsed < 1.0
+
+
+def test_read_times_out_without_frames():
+    camera = live_camera(ScriptedCapture(frames=0, interval=0.0))
+    camera._stop.set()  # grabber stops: no new frames, but no end of stream either
+    camera._grabber.join(1.0)
+    camera._ended = False
+    t0 = time.monotonic()
+    assert camera._read_latest(timeout=0.2) is None
+    assert 0.15 <= time.monotonic() - t0 < 1.0
+    camera.release()
+
+
+def test_open_fails_cleanly_and_reopens(clip, tmp_path):
+    missing = Camera(str(tmp_path / "missing.avi"), CaptureSettings())
+    t0 = time.monotonic()
+    assert not missing.open(retries=2, delay=0.05)
+    assert time.monotonic() - t0 >= 0.1
+    assert missing.read() is None
+
+    camera = Camera(clip, CaptureSettings(latest_only=True, loop=True))
+    assert camera.open(1, 0)
+    camera.read()
+    camera.release()
+    assert not camera.is_open() and camera.read() is None
+    assert camera.open(1, 0)  # reconnect after a release
+    assert camera.read() is not None
+    camera.release()
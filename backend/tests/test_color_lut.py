@@ -0,0 +1,88 @@
+# tests/test_color_lut.py
+"""ColorLut against hsv_range_mask, calibration from samples, and the table file."""
+import cv2
+import numpy as np
+import pytest
+
+from app import config, detection
+from app.color_lut import ColorLut, load_color_lut, save_color_lut
+from app.detection import COCONUT_HSV_RANGES, coconut_mask, hsv_range_mask
+
+BROWN, BELT, SHELL = (40, 90, 140), (70, 70, 70), (200, 215, 225)  # BGR
+
+
+@pytest.fixture
+def noise():
+    return np.random.default_rng(0).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+
+
+def belt_scene() -> np.ndarray:
+    frame = np.full((240, 320, 3), BELT, np.uint8)
+    cv2.circle(frame, (80, 120), 30, BROWN, -1)
+    cv2.circle(frame, (220, 120), 30, SHELL, -1)
+    return frame
+
+
+@pytest.mark.parametrize("bits", [5, 6, 7])
+def test_table_matches_the_ranges_at_every_bin_centre(bits):
+    lut = ColorLut.from_hsv_ranges(COCONUT_HSV_RANGES, bits)
+    centres = ColorLut.bin_centres(bits)
+    assert np.array_equal(lut.mask(centres), hsv_range_mask(centres))
+
+
+@pytest.mark.parametrize("bits, tolerance", [(5, 0.02), (6, 0.01), (7, 0.005)])
+def test_table_differs_from_the_ranges_only_near_their_edges(noise, bits, tolerance):
+    lut = ColorLut.from_hsv_ranges(COCONUT_HSV_RANGES, bits)
+    assert np.mean(lut.mask(noise) != hsv_range_mask(noise)) < tolerance
+    scene = belt_scene()
+    assert np.array_equal(lut.mask(scene), hsv_range_mask(scene))
+
+
+def test_each_pixel_is_looked_up_in_its_own_bin(noise):
+    lut = ColorLut(np.random.default_rng(1).integers(0, 2, 64 ** 3), bits=6)
+    noise[0, :8] = [[0, 0, 0], [255, 255, 255], [255, 0, 0], [0, 255, 0], [0, 0, 255], [3, 4, 252], [4, 3, 251], [128, 64, 32]]
+    mask = lut.mask(noise)
+    assert mask.shape == (240, 320) and mask.dtype == np.uint8
+    assert np.array_equal(mask.reshape(-1), lut.table[lut.bins_of(noise.reshape(-1, 3))])
+
+
+def test_calibration_learns_nuts_and_keeps_the_belt_out():
+    lut = ColorLut(np.zeros(64 ** 3), bits=6)
+    nut, near_nut, belt = (60, 110, 150), (64, 110, 150), (60, 110, 154)  # neighbouring bins
+    learnt = lut.calibrate([nut] * 5, [belt] * 5, spread=1)
+    mask = learnt.mask(np.array([[nut, near_nut, belt]], np.uint8))
+    assert mask.tolist() == [[255, 255, 0]]  # grown one bin, but not onto a belt bin
+    assert learnt.source == "samples"
+
+    more = learnt.calibrate([SHELL], extend=True, spread=0)
+    assert more.mask(np.array([[nut, SHELL]], np.uint8)).tolist() == [[255, 255]]
+    cleared = more.calibrate([], [nut], extend=True)
+    assert cleared.mask(np.array([[nut, SHELL]], np.uint8)).tolist() == [[0, 255]]
+
+
+def test_saved_table_loads_back(tmp_path):
+    path = tmp_path / "color_lut.npz"
+    lut = ColorLut.from_hsv_ranges(COCONUT_HSV_RANGES, 5)
+    save_color_lut(lut, path)
+    loaded = load_color_lut(path)
+    assert np.array_equal(loaded.table, lut.table)
+    assert (loaded.bits, loaded.source, loaded.updated_at) == (5, "ranges", lut.updated_at)
+    path.write_bytes(b"not an npz")
+    assert load_color_lut(path) is None
+    assert load_color_lut(tmp_path / "missing.npz") is None
+
+
+@pytest.mark.parametrize("table, bits", [(np.zeros(64 ** 3), 8), (np.zeros(100), 6)])
+def test_bad_tables_are_refused(table, bits):
+    with pytest.raises(ValueError):
+        ColorLut(table, bits)
+
+
+def test_coconut_mask_uses_the_table_in_use(monkeypatch):
+    everything = ColorLut(np.ones(32 ** 3), bits=5)
+    monkeypatch.setattr(detection, "_color_lut", everything)
+    monkeypatch.setattr(config, "COLOR_LUT", True)
+    scene = belt_scene()
+    assert (coconut_mask(scene) == 255).all()
+    monkeypatch.setattr(config, "COLOR_LUT", False)
+    assert np.array_equal(coconut_mask(scene), hsv_range_mask(scene))
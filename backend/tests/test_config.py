@@ -0,0 +1,48 @@
+# tests/test_config.py
+"""Line settings are checked when they are loaded, not when a bucket fills."""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from pydantic import ValidationError
+
+from app.lines import load_lines
+from app.models import LineConfig
+
+BACKEND = Path(__file__).resolve().parents[1]
+
+
+def import_config(**env) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "-c", "import app.config"], cwd=BACKEND, capture_output=True,
+                          text=True, env={**os.environ, **env})
+
+
+@pytest.mark.parametrize("field, value", [("count_direction", "upwards"), ("stop_mode", "predicitve")])
+def test_bad_line_setting_is_rejected(field, value):
+    with pytest.raises(ValidationError):
+        LineConfig(id="a", **{field: value})
+
+
+@pytest.mark.parametrize("field, value", [("count_direction", "upwards"), ("stop_mode", "predicitve")])
+def test_bad_lines_file_fails_at_load(tmp_path, field, value):
+    path = tmp_path / "lines.json"
+    path.write_text(json.dumps([{"id": "a"}, {"id": "b", "relay_pin": 25, field: value}]))
+    with pytest.raises(ValidationError):
+        load_lines(path)
+
+
+def test_line_settings_default_from_config():
+    line = LineConfig(id="a", count_direction="both", stop_mode="predictive")
+    assert (line.count_direction, line.stop_mode) == ("both", "predictive")
+    default = LineConfig(id="b")
+    assert (default.count_direction, default.stop_mode) == ("up", "threshold")
+
+
+@pytest.mark.parametrize("name, value", [("COUNT_DIRECTION", "sideways"), ("STOP_MODE", "Predictive")])
+def test_bad_env_default_fails_at_import(name, value):
+    result = import_config(**{name: value})
+    assert result.returncode != 0
+    assert name in result.stderr
@@ -0,0 +1,199 @@
+# tests/test_counting.py
+"""LineCounter on synthetic SORT output: nuts moving up across a trigger line at y=120."""
+import numpy as np
+import pytest
+
+from app.counting import TRIGGER, CountLine, CountZone, LineCounter, counter_from_config, region_from_dict
+
+LINE_Y = 120
+BOX = 24
+
+
+def rows(*tracks):
+    """SORT output for one update: tracks are (id, centre y) or (id, centre y, centre x)."""
+    out = []
+    for track in tracks:
+        track_id, y, x = (track + (100,))[:3]
+        out.append([x - BOX / 2, y - BOX / 2, x + BOX / 2, y + BOX / 2, track_id])
+    return np.array(out, dtype=np.float64).reshape(-1, 5)
+
+
+def path(y_from, y_to, step=3.0):
+    n = max(2, int(abs(y_to - y_from) / step) + 1)
+    return list(np.linspace(y_from, y_to, n))
+
+
+def feed(counter, updates):
+    """Run every update through the counter, return the trigger crossings per update."""
+    return [counter.update(tracked)[TRIGGER] for tracked in updates]
+
+
+def up_counter(direction="up", **kwargs):
+    return LineCounter([CountLine.horizontal(LINE_Y, direction=direction)], **kwargs)
+
+
+def test_clean_pass_counts_once():
+    counter = up_counter()
+    crossings = feed(counter, [rows((1, y)) for y in path(200, 40)])
+    assert sum(crossings) == 1
+    assert counter.counts[TRIGGER] == 1
+
+
+def test_jostle_inside_hysteresis_band_counts_once():
+    counter = up_counter(hysteresis=4.0)
+    ys = path(200, LINE_Y + 2) + [LINE_Y + 3 * (-1) ** k for k in range(20)] + path(LINE_Y, 40)
+    assert sum(feed(counter, [rows((1, y)) for y in ys])) == 1
+
+
+@pytest.mark.parametrize("hysteresis, counted", [(4.0, 0), (0.0, 1)])
+def test_wobble_on_the_line_without_crossing(hysteresis, counted):
+    # the nut reaches the line, wobbles 3 px either side and falls back
+    counter = up_counter(hysteresis=hysteresis)
+    ys = path(200, LINE_Y + 3) + [LINE_Y + 3 * (-1) ** k for k in range(1, 10)] + path(LINE_Y + 3, 200)
+    assert sum(feed(counter, [rows((1, y)) for y in ys])) == counted
+
+
+def test_jostle_across_the_band_still_counts_once():
+    counter = up_counter(hysteresis=4.0)
+    ys = path(200, LINE_Y) + [LINE_Y + 8 * (-1) ** k for k in range(10)] + path(LINE_Y, 40)
+    assert sum(feed(counter, [rows((1, y)) for y in ys])) == 1
+
+
+def test_reid_past_the_line_is_not_counted_again():
+    counter = up_counter()
+    ys = path(200, 40)
+    past = next(k for k, y in enumerate(ys) if y < LINE_Y - 10)
+    updates = [rows((1, y)) for y in ys[:past]] + [rows((2, y)) for y in ys[past:]]
+    assert sum(feed(counter, updates)) == 1
+
+
+def test_split_piece_above_the_line_is_not_counted():
+    counter = up_counter()
+    ys = path(200, 40)
+    past = next(k for k, y in enumerate(ys) if y < LINE_Y - 10)
+    updates = [rows((1, y), *([(2, y - BOX / 2, 130)] if past <= k < past + 4 else []))
+               for k, y in enumerate(ys)]
+    assert sum(feed(counter, updates)) == 1
+
+
+def test_reverse_and_recross_counts_once():
+    counter = up_counter()
+    ys = path(200, LINE_Y - 15) + path(LINE_Y - 15, LINE_Y + 15) + path(LINE_Y + 15, 40)
+    assert sum(feed(counter, [rows((1, y)) for y in ys])) == 1
+
+
+def test_first_seen_past_the_line_never_counts():
+    counter = up_counter()
+    assert sum(feed(counter, [rows((1, y)) for y in path(100, 40)])) == 0
+
+
+@pytest.mark.parametrize("direction, up, down", [("up", 1, 0), ("down", 0, 1), ("both", 1, 1)])
+def test_direction(direction, up, down):
+    counter = up_counter(direction)
+    assert sum(feed(counter, [rows((1, y)) for y in path(200, 40)])) == up
+    assert sum(feed(counter, [rows((2, y)) for y in path(40, 200)])) == down
+
+
+def test_invalid_direction_is_rejected():
+    with pytest.raises(ValueError):
+        CountLine.horizontal(LINE_Y, direction="sideways")
+
+
+def test_zone_counts_entries_and_occupancy():
+    zone = CountZone([(50, 40), (150, 40), (150, 80), (50, 80)], "chute")
+    counter = LineCounter([CountLine.horizontal(LINE_Y), zone])
+    for y in path(200, 60):
+        new = counter.update(rows((1, y)))
+    assert counter.counts == {TRIGGER: 1, "chute": 1}
+    assert counter.occupancy["chute"] == 1
+    assert new == {TRIGGER: 0, "chute": 0}
+    counter.update(rows((1, 10)))
+    assert counter.occupancy["chute"] == 0
+    assert counter.counts["chute"] == 1
+
+
+def test_region_from_dict():
+    line = region_from_dict({"id": "exit", "line": [[0, 50], [320, 50]], "direction": "down"})
+    assert (line.kind, line.direction) == ("line", 1)
+    assert region_from_dict({"id": "z", "zone": [[0, 0], [10, 0], [10, 10]]}).kind == "zone"
+    with pytest.raises(ValueError):
+        region_from_dict({"id": TRIGGER, "line": [[0, 0], [1, 0]]})
+    with pytest.raises(ValueError):
+        region_from_dict({"id": "nothing"})
+
+
+def test_forget_after_evicts_lost_tracks():
+    counter = up_counter(forget_after=3)
+    counter.update(rows((1, 200), (2, 180)))
+    for _ in range(3):
+        counter.update(rows((2, 180)))
+    assert counter.tracked_ids == 2
+    counter.update(rows((2, 180)))
+    assert counter.tracked_ids == 1
+
+
+def test_state_stays_bounded_over_a_long_shift():
+    counter = up_counter(forget_after=5)
+    ys = path(200, 40, step=8.0)
+    for nut in range(200):
+        feed(counter, [rows((nut + 1, y)) for y in ys])
+    assert counter.counts[TRIGGER] == 200
+    assert counter.tracked_ids <= 1
+
+
+def test_replace_keeps_the_count():
+    counter = up_counter()
+    feed(counter, [rows((1, y)) for y in path(200, 40)])
+    counter.replace(CountLine.horizontal(100))
+    assert counter.counts[TRIGGER] == 1
+    # sides are relearnt: the old track is not counted again on the new line
+    assert sum(feed(counter, [rows((1, y)) for y in path(40, 20)])) == 0
+
+
+def test_counter_from_config_adds_regions():
+    class Line:
+        count_direction = "down"
+        count_regions = [{"id": "exit", "line": [[0, 50], [320, 50]]}]
+
+    counter = counter_from_config(LINE_Y, Line())
+    assert [r.id for r in counter.regions] == [TRIGGER, "exit"]
+    assert counter.regions[0].direction == 1
+
+
+# ─── arrivals ───────────────────────────────────────────────────────
+def test_arrivals_eta_at_own_velocity():
+    counter = up_counter(hysteresis=4.0)
+    counter.update(rows((1, 200)))
+    counter.update(rows((1, 180)))
+    eta = counter.arrivals(rows((1, 180)), np.array([[0.0, -8.0]]))
+    # 60 px to the line plus the 4 px band at 8 px per update
+    assert eta == pytest.approx([8.0])
+
+
+def test_arrivals_skip_counted_and_receding_tracks():
+    counter = up_counter()
+    feed(counter, [rows((1, y), (2, 150)) for y in path(200, 100)])
+    tracked = rows((1, 100), (2, 150))
+    assert counter.counts[TRIGGER] == 1
+    assert len(counter.arrivals(tracked, np.array([[0.0, -5.0], [0.0, 5.0]]))) == 0
+
+
+def test_arrivals_new_track_moves_at_belt_speed():
+    counter = up_counter(hysteresis=4.0)
+    tracked = rows((1, 160), (2, 170), (3, 200))
+    counter.update(tracked)
+    # 3 was just spawned: the filter has no speed for it yet
+    eta = counter.arrivals(tracked, np.array([[0.0, -10.0], [0.0, -10.0], [0.0, 0.0]]))
+    assert eta == pytest.approx([4.4, 5.4, 8.4])
+
+
+def test_arrivals_sorted_and_empty_cases():
+    counter = up_counter()
+    assert len(counter.arrivals(rows(), np.empty((0, 2)))) == 0
+    tracked = rows((1, 200), (2, 140))
+    counter.update(tracked)
+    eta = counter.arrivals(tracked, np.array([[0.0, -4.0], [0.0, -4.0]]))
+    assert list(eta) == sorted(eta) and len(eta) == 2
+    # only lines have a crossing to forecast
+    zone = LineCounter([CountZone([(0, 0), (10, 0), (10, 10)], "z")])
+    assert len(zone.arrivals(tracked, np.zeros((2, 2)), region_id="z")) == 0
@@ -0,0 +1,44 @@
+# tests/test_detection.py
+"""extract_label_blobs against the original per-label full-frame mask loop (benchmarks.bench_detection)."""
+import cv2
+import numpy as np
+import pytest
+
+from app.detection import extract_label_blobs
+from benchmarks.bench_detection import legacy_extract, synthetic_labels
+
+
+@pytest.mark.parametrize("n", [1, 5, 20, 80])
+@pytest.mark.parametrize("min_area", [50, 700])
+def test_same_detections_as_the_full_frame_loop(n, min_area):
+    labels = synthetic_labels(n, seed=n)
+    detections, circles = extract_label_blobs(labels, min_area=min_area)
+    np.testing.assert_array_equal(detections, legacy_extract(labels, min_area=min_area))
+    assert detections.dtype == np.float32 and detections.shape[1] == 5
+    assert len(circles) == len(detections)
+
+
+def test_blobs_on_the_frame_edge_and_label_gaps():
+    labels = np.zeros((240, 320), np.int32)
+    cv2.circle(labels, (0, 0), 30, 3, -1)        # cut by two edges; labels 1 and 2 absent
+    cv2.circle(labels, (319, 120), 30, 5, -1)
+    cv2.rectangle(labels, (100, 200), (160, 239), 7, -1)
+    detections, circles = extract_label_blobs(labels, min_area=100)
+    np.testing.assert_array_equal(detections, legacy_extract(labels, min_area=100))
+    assert detections.tolist() == [[0, 0, 31, 31, 1], [289, 90, 320, 151, 1], [100, 200, 161, 240, 1]]
+    (x, y), r = circles[2]
+    assert (x, y) == pytest.approx((130, 219.5), abs=0.5) and r == pytest.approx(35.5, abs=1)
+
+
+def test_split_label_keeps_its_largest_piece():
+    labels = np.zeros((240, 320), np.int32)
+    cv2.circle(labels, (80, 120), 30, 1, -1)
+    cv2.circle(labels, (250, 120), 8, 1, -1)  # a stray fragment of the same label
+    detections, _ = extract_label_blobs(labels, min_area=100)
+    np.testing.assert_array_equal(detections, legacy_extract(labels, min_area=100))
+    assert detections.tolist() == [[50, 90, 111, 151, 1]]
+
+
+def test_nothing_to_extract():
+    detections, circles = extract_label_blobs(np.zeros((240, 320), np.int32))
+    assert detections.shape == (0, 5) and circles == []
@@ -0,0 +1,104 @@
+# tests/test_detectors.py
+"""create_detector / detector_from_config: backend selection and the Detector contract."""
+import importlib.util
+
+import cv2
+import numpy as np
+import pytest
+
+from app import config, video_streamer
+from app.detectors import DETECTORS, Detector, create_detector
+
+LOCAL = [name for name in DETECTORS if name != "yolo_onnx"]  # no model file or onnxruntime needed
+
+
+def belt(*centres, radius=30):
+    frame = np.full((240, 320, 3), 70, np.uint8)  # grey belt
+    for x, y in centres:
+        cv2.circle(frame, (x, y), radius, (40, 90, 140), -1)  # BGR coconut brown
+    return frame
+
+
+@pytest.mark.parametrize("name", LOCAL)
+def test_factory_builds_the_named_backend(name):
+    detector = create_detector(name, min_area=500)
+    assert detector.name == name
+    assert isinstance(detector, Detector)
+    detections = detector.detect(belt())
+    assert detections.dtype == np.float32 and detections.shape == (0, 5)
+    detector.reset()
+
+
+def test_unknown_detector_is_rejected():
+    with pytest.raises(ValueError, match="expected one of"):
+        create_detector("haar")
+
+
+@pytest.mark.skipif(importlib.util.find_spec("onnxruntime") is not None, reason="onnxruntime is installed")
+def test_yolo_without_onnxruntime_says_what_is_missing():
+    with pytest.raises(RuntimeError, match="onnxruntime"):
+        create_detector("yolo_onnx", model_path="missing.onnx")
+
+
+@pytest.mark.parametrize("name", ["hsv_watershed", "pyramid"])
+def test_watershed_backends_find_each_nut(name):
+    detections = create_detector(name, min_area=500).detect(belt((80, 120), (160, 120), (250, 60)))
+    assert len(detections) == 3
+    centres = np.array(sorted(((d[0] + d[2]) / 2, (d[1] + d[3]) / 2) for d in detections))
+    np.testing.assert_allclose(centres, [(80, 120), (160, 120), (250, 60)], atol=3)
+
+
+def test_mog2_finds_what_moves_over_the_learnt_belt():
+    detector = create_detector("mog2", min_area=500)
+    for _ in range(30):
+        detector.detect(belt())
+    detections = detector.detect(belt((160, 120)))
+    assert len(detections) == 1
+    detector.reset()  # forgets the belt: everything is foreground again
+    assert len(detector.detect(belt((160, 120)))) <= 1
+
+
+def test_detector_from_config_uses_the_cm_sizes(monkeypatch):
+    monkeypatch.setattr(config, "DETECTOR_MIN_AREA", None)
+    monkeypatch.setattr(config, "DETECTOR_MIN_DISTANCE", None)
+    monkeypatch.setattr(config, "DETECTOR_PX_PER_CM", 2.0)
+    monkeypatch.setattr(config, "COCONUT_MIN_DIAMETER_CM", 10.0)
+    monkeypatch.setattr(config, "COCONUT_MIN_SEPARATION_CM", 5.0)
+    detector = video_streamer.detector_from_config("pyramid")
+    assert detector.name == "pyramid"
+    assert detector.min_area == pytest.approx(np.pi * 10 ** 2)  # a 20 px disc
+    assert detector.min_distance == 10
+    monkeypatch.setattr(config, "DETECTOR_MIN_AREA", 900.0)
+    monkeypatch.setattr(config, "DETECTOR", "mog2")
+    detector = video_streamer.detector_from_config()
+    assert (detector.name, detector.min_area) == ("mog2", 900.0)
+
+
+def by_x(detections):
+    return detections[np.argsort(detections[:, 0])]
+
+
+@pytest.mark.parametrize("centres", [
+    [(100, 120), (150, 120)],              # touching: one coarse candidate, split by the refine
+    [(20, 30), (160, 120), (300, 220)],    # cut off by the frame edges
+    [(60, 60), (125, 60), (200, 180)],     # a neighbour reaching into the candidate's box
+])
+def test_pyramid_finds_the_same_boxes_as_the_full_frame_watershed(centres):
+    frame = belt(*centres)
+    full = create_detector("hsv_watershed", min_area=500).detect(frame)
+    pyramid = create_detector("pyramid", min_area=500)
+    coarse_to_fine = pyramid.detect(frame)
+    assert len(coarse_to_fine) == len(full) == len(centres)
+    np.testing.assert_allclose(by_x(coarse_to_fine), by_x(full), atol=2)
+    circles = sorted(centre for centre, _ in pyramid.last_circles)  # frame pixels, not crop pixels
+    np.testing.assert_allclose(circles, sorted(centres), atol=2)
+
+
+def test_pyramid_skips_the_watershed_on_an_empty_belt(monkeypatch):
+    pyramid = create_detector("pyramid", min_area=500)
+
+    def refine(crop, region):
+        raise AssertionError("refined a crop on an empty belt")
+
+    monkeypatch.setattr(pyramid, "_refine", refine)
+    assert len(pyramid.detect(belt())) == 0 and pyramid.last_circles == []
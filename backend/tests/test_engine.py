@@ -0,0 +1,138 @@
+# tests/test_engine.py
+"""CountingEngine without a camera: buckets on temp files, GPIO on the simulated chip, history in a temp database."""
+import asyncio
+
+import pytest
+
+from app import engine as engine_module, metrics
+from app.buckets import LineBuckets
+from app.engine import CountingEngine
+from app.gpio_controller import GpioService, SimulatedGpio
+from app.history import HistoryStore
+from app.models import LineConfig
+
+RELAY = 23
+
+
+@pytest.fixture
+def sim():
+    return SimulatedGpio()
+
+
+@pytest.fixture
+def engine(tmp_path, sim, monkeypatch):
+    history = HistoryStore(tmp_path / "history.db", flush_interval=60)
+    monkeypatch.setattr(engine_module, "get_history", lambda: history)
+    line = LineConfig(id="test", relay_pin=RELAY, bucket_count=3, set_value=10, stop_coast_s=0.2)
+    buckets = LineBuckets(tmp_path / "buckets.json", tmp_path / "buckets.journal", bucket_count=3, set_value=10)
+    gpio = GpioService(sim)
+    eng = CountingEngine(line, buckets)
+    eng._gpio = gpio.line(line)
+    eng._gpio.relay_latency = 0.1  # stop_latency() = 0.1 + 0.2 s
+    eng.published = []
+    monkeypatch.setattr(eng.hub, "publish_json", eng.published.append)
+    yield eng
+    gpio.close()
+    buckets.close()
+    history.close()
+
+
+def stops(reason: str) -> float:
+    return metrics.CONVEYOR_STOPS.labels("test", reason).value
+
+
+def test_start_holds_the_belt_without_counting_a_stop(engine, sim):
+    before = stops("start")
+    engine.stop_conveyor("start", count=False)
+    assert engine.gpio.service.flush()
+    assert sim.levels[RELAY] == 0
+    assert stops("start") == before
+
+
+def test_real_stops_are_counted(engine, sim):
+    before = stops("operator")
+    engine.stop_conveyor()
+    assert engine.gpio.service.flush()
+    assert [(p, v) for p, v, _ in sim.writes] == [(RELAY, 0)]
+    assert stops("operator") == before + 1
+
+
+def fill(engine, bucket: int, count: int):
+    engine.selected_bucket = bucket
+    engine.buckets.buckets[bucket - 1]["count"] = count
+
+
+def land(engine, *deltas, arrivals=()):
+    """Counted nuts reaching the selected bucket, one frame per delta."""
+    async def frames():
+        for delta in deltas:
+            await engine._add_to_selected_bucket(delta, arrivals)
+        engine.state._task.cancel()
+
+    asyncio.run(frames())
+
+
+def settled_stops(engine):
+    engine.history.flush()
+    return engine.history.stops()[0]
+
+
+def test_predictive_stop_waits_until_the_nuts_in_flight_reach_the_set_value(engine, sim):
+    fill(engine, 2, 6)
+    engine._predict_stop([0.1, 0.2, 0.29, 0.5])  # 3 arrive within 0.3 s: 9 < 10
+    assert engine._settling is None and not sim.writes
+    engine.buckets.buckets[1]["count"] = 7
+    before = stops("bucket_predicted")
+    engine._predict_stop([0.1, 0.2, 0.29, 0.5])
+    assert engine.gpio.service.flush() and sim.levels[RELAY] == 0
+    assert stops("bucket_predicted") == before + 1
+    assert engine.published == [{"type": "bucket_stopped", "bucket": 2, "in_flight": 3}]
+    assert engine._settling["latency"] == pytest.approx(0.3)
+
+    engine._predict_stop([0.1, 0.2, 0.29, 0.5])  # next frame: already stopping
+    assert stops("bucket_predicted") == before + 1 and len(engine.published) == 1
+
+
+def test_settled_stop_records_predicted_against_actual_overfill(engine):
+    fill(engine, 2, 7)
+    engine._predict_stop([0.1, 0.2, 0.29])
+    land(engine, 2, 1, 1)  # the three forecast, and one more nobody saw coming
+    bucket = engine.buckets.buckets[1]
+    assert bucket["count"] == 11 and bucket["filled"]
+    assert [m["type"] for m in engine.published] == ["bucket_stopped"]  # filling doesn't stop twice
+    engine.settle_stop()
+    assert engine.published[-1] == {"type": "stop_settled", "bucket": 2, "mode": "predictive",
+                                    "predicted": 0, "actual": 1}
+    [row] = settled_stops(engine)
+    assert (row["line"], row["bucket"], row["mode"]) == ("test", 2, "predictive")
+    assert (row["set_value"], row["count"], row["in_flight"], row["predicted"], row["actual"]) == (10, 7, 3, 0, 1)
+    engine.settle_stop()  # nothing left to settle
+    assert len(settled_stops(engine)) == 1
+
+
+def test_threshold_stop_is_settled_too(engine, sim):
+    fill(engine, 1, 8)
+    land(engine, 1, 1, arrivals=[0.05, 0.4])
+    assert engine.gpio.service.flush() and sim.levels[RELAY] == 0
+    assert engine.published == [{"type": "bucket_stopped", "bucket": 1}]
+    land(engine, 1)
+    engine.settle_stop()
+    [row] = settled_stops(engine)
+    assert (row["mode"], row["count"], row["in_flight"], row["predicted"], row["actual"]) == ("threshold", 10, 1, 1, 1)
+
+
+@pytest.mark.parametrize("bucket", [{"filled": True}, {"count": 0}])
+def test_no_predictive_stop_for_a_full_bucket_or_a_distant_set_value(engine, sim, bucket):
+    fill(engine, 3, 9)
+    engine.buckets.buckets[2].update(bucket)
+    engine._predict_stop([0.1, 0.2])
+    assert engine._settling is None and engine.published == [] and not sim.writes
+
+
+def test_a_new_stop_settles_the_one_before(engine):
+    fill(engine, 1, 9)
+    engine._predict_stop([0.1])
+    fill(engine, 2, 9)  # operator moved on before it was due
+    engine._predict_stop([0.1])
+    assert [r["bucket"] for r in settled_stops(engine)] == [1]
+    assert engine._settling["bucket"] == 2
@@ -0,0 +1,43 @@
+# tests/test_export.py
+"""export_history into a temp directory standing in for the USB stick."""
+import gzip
+from datetime import datetime
+
+import pytest
+
+from app import export_utils
+from app.export_utils import export_history
+from app.history import HistoryStore
+
+
+class FrozenClock(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 5, 1, 8, 0, 0)
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    store = HistoryStore(tmp_path / "history.db", flush_interval=60)
+    monkeypatch.setattr(export_utils, "get_history", lambda: store)
+    for k in range(3):
+        store.record_report("a", [(1, 800, 800 + k), (2, 800, 790)], ts=1_700_000_000 + k)
+    store.flush()
+    yield store
+    store.close()
+
+
+def test_exports_in_the_same_second_do_not_overwrite_each_other(history, tmp_path, monkeypatch):
+    stick = tmp_path / "stick"
+    stick.mkdir()
+    monkeypatch.setattr(export_utils, "datetime", FrozenClock)
+    first = export_history(stick, "reports")
+    second = export_history(stick, "reports", compress=True)
+    third = export_history(stick, "reports")
+    names = sorted(p.name for p in stick.iterdir())
+    assert names == ["reports_20240501-080000-2.csv", "reports_20240501-080000.csv",
+                     "reports_20240501-080000.csv.gz"]
+    assert first["dest"] != third["dest"]
+    assert first["rows"] == third["rows"] == 3 and first["verified"]
+    with gzip.open(second["dest"], "rt") as f:
+        assert len(f.read().splitlines()) == 4
@@ -0,0 +1,121 @@
+# tests/test_gpio.py
+"""GpioService on SimulatedGpio: relay command order, button presses, pin ownership."""
+import asyncio
+
+import pytest
+
+from app import metrics
+from app.gpio_controller import GpioService, SimulatedGpio, gpio_backend
+from app.models import LineConfig
+
+RELAY, BUZZER, START, STOP = 23, 24, 22, 16
+
+
+@pytest.fixture
+def sim():
+    return SimulatedGpio()
+
+
+@pytest.fixture
+def service(sim):
+    gpio = GpioService(sim)
+    yield gpio
+    gpio.close()
+
+
+def bench_line(line_id="bench", **pins) -> LineConfig:
+    return LineConfig(id=line_id, **{"relay_pin": RELAY, "buzzer_pin": BUZZER,
+                                     "start_button_pin": START, "stop_button_pin": STOP, **pins})
+
+
+def written(sim, *pins):
+    return [(pin, level) for pin, level, _ in sim.writes if not pins or pin in pins]
+
+
+def test_commands_are_written_in_order(sim, service):
+    ctrl = service.line(bench_line())
+    assert sim.levels[RELAY] == 0 and sim.levels[BUZZER] == 0  # claimed low
+    for _ in range(50):
+        ctrl.start_conveyor()
+        ctrl.activate_buzzer()
+        ctrl.stop_conveyor()
+        ctrl.deactivate_buzzer()
+    assert service.flush()
+    assert written(sim) == [(RELAY, 1), (BUZZER, 1), (RELAY, 0), (BUZZER, 0)] * 50
+    times = [ns for _, _, ns in sim.writes]
+    assert times == sorted(times)
+    assert ctrl.relay_latency is not None and ctrl.relay_latency < 0.5
+
+
+def test_buttons_drive_the_relay(sim, service):
+    ctrl = service.line(bench_line())
+    ctrl.activate_buzzer()
+    sim.press(START)
+    assert service.flush()
+    assert written(sim) == [(BUZZER, 1), (RELAY, 1), (BUZZER, 0)]
+    stops = metrics.CONVEYOR_STOPS.labels("bench", "button").value
+    sim.press(STOP)
+    assert service.flush()
+    assert sim.levels[RELAY] == 0
+    assert metrics.CONVEYOR_STOPS.labels("bench", "button").value == stops + 1
+
+
+def test_button_presses_reach_subscribers(sim, service):
+    service.line(bench_line())
+
+    async def presses():
+        events = service.subscribe()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, sim.press, START)
+        await loop.run_in_executor(None, sim.press, STOP)
+        got = [await asyncio.wait_for(events.get(), 1.0) for _ in range(2)]
+        service.unsubscribe(events)
+        await loop.run_in_executor(None, sim.press, START)
+        await asyncio.sleep(0.05)
+        return got, events.qsize()
+
+    got, left = asyncio.run(presses())
+    assert [(e["line"], e["button"], e["pin"]) for e in got] == [("bench", "start", START), ("bench", "stop", STOP)]
+    assert got[0]["ts"] <= got[1]["ts"]
+    assert left == 0  # nothing after unsubscribe
+
+
+def test_lines_cannot_share_pins(service):
+    service.line(bench_line())
+    with pytest.raises(ValueError, match="already used by line bench"):
+        service.line(bench_line("other", relay_pin=5, buzzer_pin=None, start_button_pin=None, stop_button_pin=STOP))
+    assert service.line(bench_line()) is service.line(bench_line())  # claimed once
+
+
+def test_release_writes_the_last_stop_and_frees_the_pins(sim, service):
+    ctrl = service.line(bench_line())
+    ctrl.start_conveyor()
+    ctrl.stop_conveyor()
+    ctrl.cleanup()
+    assert written(sim, RELAY) == [(RELAY, 1), (RELAY, 0)]
+    assert not set(sim.levels) & {RELAY, BUZZER, START, STOP}
+    sim.press(START)  # no longer wired to anything
+    assert service.flush()
+    assert written(sim, RELAY) == [(RELAY, 1), (RELAY, 0)]
+    service.line(bench_line("other"))  # the pins are free again
+
+
+def test_backend_is_chosen_explicitly(service):
+    assert metrics.GPIO_BACKEND.labels("sim").value == 1
+    with pytest.raises(ValueError):
+        gpio_backend("auto")
+    assert isinstance(gpio_backend("sim"), SimulatedGpio)
+
+
+def test_failed_claim_gives_back_the_pins_already_claimed(sim, service, monkeypatch):
+    def busy(pin, on_press, debounce_us):
+        raise OSError(f"GPIO {pin} busy")
+
+    monkeypatch.setattr(sim, "claim_button", busy)
+    with pytest.raises(OSError, match="busy"):
+        service.line(bench_line())
+    assert not set(sim.levels) & {RELAY, BUZZER, START, STOP}
+    monkeypatch.undo()
+    ctrl = service.line(bench_line())  # the retry gets every pin
+    ctrl.start_conveyor()
+    assert service.flush() and sim.levels[RELAY] == 1
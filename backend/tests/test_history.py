@@ -0,0 +1,188 @@
+# tests/test_history.py
+"""HistoryStore writes: a failed transaction keeps the queued batch for the next flush."""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app import history as history_module
+from app.history import HistoryStore
+
+T0 = 1_700_000_000.0
+
+
+@pytest.fixture
+def history(tmp_path):
+    store = HistoryStore(tmp_path / "history.db", flush_interval=60)
+    yield store
+    store.close()
+
+
+def record(history, k):
+    history.record_count("a", 1, 5, ts=T0 + k)
+    history.record_fill("a", 1, 800 + k, 800, ts=T0 + k)
+    history.record_stop("a", 1, "threshold", 800, 800, 0, 0.25, k, ts=T0 + k)
+    history.record_report("a", [(1, 800, 800 + k)], ts=T0 + k)
+
+
+def fail_inserts(history, table):
+    with history._conn:
+        history._conn.execute(f"CREATE TRIGGER fail BEFORE INSERT ON {table} "
+                              "BEGIN SELECT RAISE(ABORT, 'database or disk is full'); END")
+
+
+def test_failed_flush_keeps_the_batch(history):
+    # before recording: record_report wakes the writer, which must not commit the batch first
+    fail_inserts(history, "reports")  # the last statement: everything before it rolls back
+    record(history, 0)
+    with pytest.raises(sqlite3.IntegrityError):
+        history.flush()
+    record(history, 1)  # recorded while the disk was full
+    with history._conn:
+        history._conn.execute("DROP TRIGGER fail")
+    history.flush()
+
+    nuts = history._conn.execute("SELECT SUM(nuts) FROM throughput").fetchone()[0]
+    assert nuts == 10  # summed once, not lost and not doubled
+    fills, _ = history.fills()
+    assert [f["count"] for f in fills] == [800, 801]  # still in order
+    stops, _ = history.stops()
+    assert [s["actual"] for s in stops] == [0, 1]
+    reports, _ = history.reports()
+    assert len(reports) == 2 and history.last_report_id() == 2
+
+
+def test_failed_flush_is_retried_by_the_writer(history):
+    fail_inserts(history, "fills")
+    record(history, 0)
+    with pytest.raises(sqlite3.IntegrityError):
+        history.flush()
+    with pytest.raises(sqlite3.IntegrityError):
+        history.flush()  # still failing: still queued
+    with history._conn:
+        history._conn.execute("DROP TRIGGER fail")
+    history.close()  # the last flush on close writes it
+    assert len(history.fills()[0]) == 1
+    assert history._conn.execute("SELECT SUM(nuts) FROM throughput").fetchone()[0] == 5
+
+
+def test_flush_waits_for_a_write_already_under_way(history, monkeypatch):
+    write, started = history._write, threading.Event()
+
+    def slow_write(*batch):
+        started.set()
+        time.sleep(0.2)
+        write(*batch)
+
+    monkeypatch.setattr(history, "_write", slow_write)
+    record(history, 0)
+    writer = threading.Thread(target=history.flush)  # the writer thread took the batch
+    writer.start()
+    assert started.wait(1.0)
+    history.flush()  # nothing left to take, but it must not return before that batch is in
+    assert len(history.reports()[0]) == 1
+    writer.join()
+
+
+# ─── reports.csv import ─────────────────────────────────────────────
+def test_legacy_csv_skips_a_malformed_row_and_keeps_the_rest(tmp_path, monkeypatch):
+    legacy = tmp_path / "reports.csv"
+    legacy.write_text("timestamp,bucket1_count,bucket2_count\n"
+                      "2024-05-01T08:00:00,800,790\n"
+                      "yesterday,800,800\n"        # bad timestamp
+                      "2024-05-01T09:00:00,80o,800\n"  # bad count
+                      "\n"
+                      "2024-05-01T10:00:00,801,,805\n")
+    monkeypatch.setattr(history_module, "LEGACY_REPORTS_CSV", legacy)
+    store = HistoryStore(tmp_path / "history.db")
+    reports, _ = store.reports()
+    assert [[(b["id"], b["count"]) for b in r["buckets"]] for r in reports] == [[(1, 800), (2, 790)], [(1, 801), (3, 805)]]
+    assert store.meta("legacy_csv_imported") == "2"
+    store.close()
+    # imported once: a restart does not add the rows again
+    store = HistoryStore(tmp_path / "history.db")
+    assert len(store.reports()[0]) == 2
+    store.close()
+
+
+def test_unreadable_legacy_csv_is_retried_next_start(tmp_path, monkeypatch):
+    legacy = tmp_path / "reports.csv"
+    legacy.write_bytes(b"timestamp,bucket1_count\n\xff\xfe,1\n")
+    monkeypatch.setattr(history_module, "LEGACY_REPORTS_CSV", legacy)
+    store = HistoryStore(tmp_path / "history.db")
+    assert store.meta("legacy_csv_imported") is None
+    store.close()
+    legacy.write_text("timestamp,bucket1_count\n2024-05-01T08:00:00,800\n")
+    store = HistoryStore(tmp_path / "history.db")
+    assert len(store.reports()[0]) == 1
+    store.close()
+
+
+# ─── /history API ───────────────────────────────────────────────────
+@pytest.fixture
+def api(history, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app import history_api
+
+    monkeypatch.setattr(history_api, "get_history", lambda: history)
+    app = FastAPI()
+    app.include_router(history_api.router)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("after", ["garbage", "12", "x:a", ":a"])
+def test_malformed_throughput_cursor_is_a_bad_request(api, after):
+    assert api.get("/history/throughput", params={"after": after}).status_code == 400
+
+
+def test_throughput_cursor_pages_through(api, history):
+    for line in ("a", "b", "c"):
+        history.record_count(line, 1, 3, ts=T0)
+    history.flush()
+    first = api.get("/history/throughput", params={"limit": 2}).json()
+    assert [r["line"] for r in first["items"]] == ["a", "b"]
+    rest = api.get("/history/throughput", params={"limit": 2, "after": first["next"]}).json()
+    assert [r["line"] for r in rest["items"]] == ["c"] and rest["next"] is None
+
+
+def test_shifts_honour_a_start_of_zero(api):
+    # start=0 is a real bound (1970), not "the last 7 days": the range is then too long
+    assert api.get("/history/shifts", params={"start": 0, "end": T0}).status_code == 400
+    assert api.get("/history/shifts", params={"start": T0 - 86400, "end": T0}).status_code == 200
+
+
+# ─── /save_report ───────────────────────────────────────────────────
+@pytest.fixture
+def server(history, monkeypatch):
+    from types import SimpleNamespace
+
+    from fastapi.testclient import TestClient
+
+    from app import main
+
+    monkeypatch.setattr(main, "get_history", lambda: history)
+    monkeypatch.setattr(main, "get_mailer", lambda: SimpleNamespace(notify=lambda: None, enabled=False))
+    return TestClient(main.app)  # no lifespan: no cameras, GPIO or USB watcher
+
+
+REPORT = {"buckets": [{"id": 1, "set_value": 800, "count": 801}]}
+
+
+def test_save_report_answers_once_the_report_is_committed(server, history):
+    history.flush_interval = 3600  # the writer thread would not get to it
+    response = server.post("/save_report", json=REPORT)
+    assert response.status_code == 200 and response.json()["status"] == "ok"
+    assert len(history.reports()[0]) == 1
+
+
+def test_save_report_failure_is_not_reported_as_saved(server, history):
+    fail_inserts(history, "reports")
+    response = server.post("/save_report", json=REPORT)
+    assert response.status_code == 503
+    with history._conn:
+        history._conn.execute("DROP TRIGGER fail")
+    history.flush()  # still queued: the retry saves it
+    assert len(history.reports()[0]) == 1
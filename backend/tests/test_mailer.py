@@ -0,0 +1,202 @@
+# tests/test_mailer.py
+"""ReportMailer against a stand-in SMTP server (benchmarks.bench_mail.SmtpSink) and scripted sessions."""
+import email
+import email.policy
+import threading
+import time
+
+import pytest
+
+from app import email_utils, metrics
+from app.email_utils import SmtpSession
+from app.history import HistoryStore
+from app.mailer import SENT_MARK, ReportMailer
+from benchmarks.bench_mail import SmtpSink, rows_delivered
+
+
+@pytest.fixture(autouse=True)
+def addresses(monkeypatch):
+    monkeypatch.setattr(email_utils, "EMAIL_FROM", "counter@localhost")
+    monkeypatch.setattr(email_utils, "EMAIL_TO", "office@localhost")
+
+
+@pytest.fixture
+def history(tmp_path):
+    store = HistoryStore(tmp_path / "history.db", flush_interval=0.05)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def sink():
+    server = SmtpSink().start()
+    yield server
+    server.stop()
+
+
+def save(history: HistoryStore, n: int = 1):
+    for i in range(n):
+        history.record_report("line1", [(b, 800, 100 + i + b) for b in range(1, 4)])
+    history.flush()
+
+
+def session_for(sink: SmtpSink) -> SmtpSession:
+    return SmtpSession("127.0.0.1", sink.port, user=None, security="none", timeout=2.0)
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class ScriptedSession:
+    """Session double: send() raises while `fail` is set, or blocks until `release` is set."""
+
+    host = "smtp.test"
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.sent = []
+        self.connected = False
+        self.last_used = 0.0
+        self.release = threading.Event()
+        self.release.set()
+        self.sending = threading.Event()
+
+    def send(self, msg):
+        self.sending.set()
+        self.release.wait(5.0)
+        if self.fail:
+            raise OSError("network is unreachable")
+        self.sent.append(msg)
+
+    def close(self):
+        pass
+
+
+def test_first_start_does_not_mail_the_old_history(history):
+    save(history, 3)
+    mailer = ReportMailer(history, ScriptedSession())
+    assert int(history.meta(SENT_MARK)) == history.last_report_id() == 3
+    assert mailer.pending() == 0
+
+
+def test_saves_within_the_window_go_out_as_one_email_over_one_session(history, sink):
+    mailer = ReportMailer(history, session_for(sink), window=0.2, session_idle=5.0)
+    for _ in range(5):
+        save(history)
+        mailer.notify()
+    assert wait_for(lambda: mailer.pending() == 0)
+    assert len(sink.messages) == 1
+    assert rows_delivered(sink) == 5  # only the new reports
+    save(history)
+    mailer.notify()
+    assert wait_for(lambda: len(sink.messages) == 2)
+    assert sink.sessions == 1  # the session was reused
+    assert int(history.meta(SENT_MARK)) == history.last_report_id()
+    mailer.close()
+
+
+def test_large_attachments_are_gzipped(history, sink):
+    mailer = ReportMailer(history, session_for(sink), window=0.05, compress_over=10)
+    save(history, 3)
+    mailer.notify()
+    assert wait_for(lambda: mailer.pending() == 0)
+    msg = email.message_from_string(sink.messages[0], policy=email.policy.default)
+    assert [p.get_filename() for p in msg.iter_attachments()] == ["reports.csv.gz"]
+    assert rows_delivered(sink) == 3
+    mailer.close()
+
+
+def test_failed_send_keeps_the_mark_and_backs_off(history):
+    session = ScriptedSession(fail=True)
+    mailer = ReportMailer(history, session, window=0.0, retry_min=10.0, retry_max=25.0)
+    save(history, 2)
+    delays = []
+    for _ in range(4):
+        mailer._send_pending()
+        delays.append(mailer._due - time.monotonic())
+    assert delays == pytest.approx([10.0, 20.0, 25.0, 25.0], abs=0.5)
+    assert mailer.failures == 4 and "unreachable" in mailer.last_error
+    assert int(history.meta(SENT_MARK)) == 0
+    assert mailer.pending() == 2
+    assert metrics.MAIL_SPOOLED._default().value == 2
+
+    session.fail = False
+    mailer._send_pending()
+    assert len(session.sent) == 1
+    assert int(history.meta(SENT_MARK)) == 2
+    assert mailer.failures == 0 and mailer.last_error is None
+    assert mailer._due is None
+
+
+def test_outage_retries_until_the_server_is_back(history, sink):
+    mailer = ReportMailer(history, session_for(sink), window=0.05, retry_min=0.1, retry_max=0.4)
+    sink.stop()
+    for _ in range(3):
+        save(history)
+        mailer.notify()
+    assert wait_for(lambda: mailer.failures >= 2)
+    assert mailer.pending() == 3
+    sink.start()
+    assert wait_for(lambda: mailer.pending() == 0)
+    assert rows_delivered(sink) == 3
+    assert mailer.failures == 0
+    mailer.close()
+
+
+def test_a_restart_sends_what_was_left_unsent(history, sink):
+    mailer = ReportMailer(history, ScriptedSession(fail=True), window=10.0)
+    save(history, 4)
+    mailer.notify()
+    mailer.close()  # stopped with the reports still spooled
+    restarted = ReportMailer(history, session_for(sink), window=0.05)
+    assert restarted.pending() == 4
+    restarted.start()
+    assert wait_for(lambda: restarted.pending() == 0)
+    assert rows_delivered(sink) == 4
+    restarted.close()
+
+
+def test_save_during_a_send_gets_its_own_email(history):
+    session = ScriptedSession()
+    session.release.clear()
+    mailer = ReportMailer(history, session, window=0.05)
+    save(history)
+    mailer.notify()
+    assert session.sending.wait(5.0)
+    save(history)  # while the first email is going out
+    mailer.notify()
+    session.release.set()
+    # the mark is written after send() returns
+    assert wait_for(lambda: mailer.pending() == 0)
+    assert len(session.sent) == 2
+    mailer.close()
+
+
+def test_spooled_gauge_counts_reports_saved_during_a_send(history):
+    session = ScriptedSession()
+    session.release.clear()
+    mailer = ReportMailer(history, session, window=0.0)
+    save(history)
+    worker = threading.Thread(target=mailer._send_pending)
+    worker.start()
+    assert session.sending.wait(5.0)
+    save(history)
+    session.release.set()
+    worker.join(5.0)
+    assert metrics.MAIL_SPOOLED._default().value == 1
+
+
+def test_disabled_without_smtp_host(history):
+    session = ScriptedSession()
+    session.host = ""
+    mailer = ReportMailer(history, session, window=0.0)
+    save(history)
+    mailer.notify()
+    assert mailer._thread is None and mailer._due is None
+    assert mailer.pending() == 1
@@ -0,0 +1,60 @@
+# tests/test_motion.py
+"""MotionGate: which frames skip detection."""
+import cv2
+import numpy as np
+import pytest
+
+from app.motion import MotionGate
+
+
+def band(x: int = None, belt: int = 40) -> np.ndarray:
+    """60 px counting band of dark belt, with a coconut centred at x if given."""
+    frame = np.full((60, 320, 3), belt, np.uint8)
+    if x is not None:
+        cv2.circle(frame, (x, 30), 14, (60, 140, 200), -1)
+    return frame
+
+
+@pytest.fixture
+def gate():
+    return MotionGate(max_skip=30)
+
+
+def test_a_still_belt_skips_detection(gate):
+    assert gate.should_detect(band(100))  # nothing to compare with yet
+    assert not any(gate.should_detect(band(100)) for _ in range(10))
+
+
+def test_sensor_noise_is_not_motion(gate):
+    rng = np.random.default_rng(0)
+    gate.should_detect(band(100))
+    for _ in range(10):
+        noisy = band(100).astype(np.int16) + rng.integers(-8, 9, (60, 320, 3))
+        assert not gate.should_detect(np.clip(noisy, 0, 255).astype(np.uint8))
+
+
+def test_a_coconut_entering_or_moving_is_detected(gate):
+    gate.should_detect(band())
+    assert gate.should_detect(band(100))
+    assert gate.should_detect(band(101))  # even one pixel
+    assert not gate.should_detect(band(101))
+
+
+def test_slow_changes_add_up_against_the_last_detected_frame(gate):
+    # +4 grey levels a frame is under the threshold frame to frame,
+    # but not against the reference, which only moves on detection
+    frames = [band(belt=40 + 4 * i) for i in range(8)]
+    assert [gate.should_detect(f) for f in frames] == [True, False, False, False, True, False, False, False]
+
+
+def test_detects_every_max_skip_frames_regardless(gate):
+    gate.max_skip = 4
+    assert [gate.should_detect(band(100)) for _ in range(11)] == [True] + ([False] * 4 + [True]) * 2
+
+
+def test_a_new_crop_size_or_reset_forces_detection(gate):
+    gate.should_detect(band(100))
+    assert gate.should_detect(band(100)[:40])  # ROI changed
+    assert not gate.should_detect(band(100)[:40])
+    gate.reset()
+    assert gate.should_detect(band(100)[:40])
@@ -0,0 +1,136 @@
+# tests/test_persistence.py
+"""BucketStore: journal replay on top of the snapshot, torn-line recovery, snapshot fallbacks."""
+import json
+
+import pytest
+
+from app.persistence import BucketStore
+
+
+def default():
+    return [{"id": i, "count": 0, "set_value": 10, "filled": False} for i in range(1, 4)]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return tmp_path / "buckets.json", tmp_path / "buckets.journal"
+
+
+@pytest.fixture
+def open_store(paths):
+    stores = []
+
+    def make():
+        # intervals long enough that only the test's own flush() calls write
+        store = BucketStore(*paths, flush_interval=60.0, snapshot_interval=60.0)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def counts(buckets):
+    return [b["count"] for b in buckets]
+
+
+def journal_lines(paths):
+    return paths[1].read_text(encoding="utf-8").splitlines()
+
+
+def test_counts_come_back_from_the_journal(paths, open_store):
+    store = open_store()
+    buckets = store.load(default, 3)
+    for n in range(1, 6):
+        buckets[0]["count"] = n
+        store.record(buckets, ids={1})
+    buckets[2]["count"] = 7
+    store.record(buckets, ids={3})
+    store.flush()
+    assert not paths[0].exists()  # no snapshot yet, only the journal
+    assert len(journal_lines(paths)) == 6
+
+    assert counts(open_store().load(default, 3)) == [5, 0, 7]
+
+
+def test_journal_replays_on_top_of_the_snapshot(paths, open_store):
+    store = open_store()
+    buckets = store.load(default, 3)
+    buckets[1]["count"] = 4
+    store.record(buckets, urgent=True)
+    store.flush()  # urgent: snapshot, fresh journal
+    assert json.loads(paths[0].read_text())["seq"] == 3
+    assert journal_lines(paths) == []
+
+    buckets[1].update(count=10, filled=True)
+    store.record(buckets, ids={2})
+    store.flush()
+    loaded = open_store().load(default, 3)
+    assert counts(loaded) == [0, 10, 0]
+    assert loaded[1]["filled"] is True
+
+
+def test_journal_lines_already_in_the_snapshot_are_skipped(paths, open_store):
+    # power cut between the snapshot rename and the journal truncate
+    snap = default()
+    snap[0]["count"] = 9
+    paths[0].write_text(json.dumps({"seq": 5, "buckets": snap}))
+    paths[1].write_text("".join(json.dumps(rec) + "\n" for rec in [
+        {"seq": 4, "id": 1, "count": 3, "set_value": 10, "filled": False},
+        {"seq": 6, "id": 2, "count": 2, "set_value": 10, "filled": False},
+    ]))
+    store = open_store()
+    assert counts(store.load(default, 3)) == [9, 2, 0]
+    assert store._seq == 6
+
+
+def test_a_torn_last_line_is_dropped_and_the_journal_restarted(paths, open_store):
+    store = open_store()
+    buckets = store.load(default, 3)
+    for n in (1, 2, 3):
+        buckets[0]["count"] = n
+        store.record(buckets, ids={1})
+    store.flush()
+    with open(paths[1], "a", encoding="utf-8") as f:
+        f.write('{"seq":4,"id":1,"cou')  # cut off mid-write
+
+    reopened = open_store()
+    buckets = reopened.load(default, 3)
+    assert counts(buckets) == [3, 0, 0]
+    assert json.loads(paths[0].read_text())["seq"] == 3
+    assert journal_lines(paths) == []  # new appends don't land on the torn line
+
+    buckets[0]["count"] = 4
+    reopened.record(buckets, ids={1})
+    reopened.flush()
+    assert counts(open_store().load(default, 3)) == [4, 0, 0]
+
+
+@pytest.mark.parametrize("snapshot", [
+    "{not json",
+    json.dumps({"seq": 2, "buckets": default()[:2]}),  # bucket_count changed since
+])
+def test_unusable_snapshot_falls_back_to_default(paths, open_store, snapshot):
+    paths[0].write_text(snapshot)
+    store = open_store()
+    assert store.load(default, 3) == default()
+    assert store._seq == 0
+
+
+def test_bare_list_snapshot_from_older_installs(paths, open_store):
+    old = default()
+    old[2]["count"] = 6
+    paths[0].write_text(json.dumps(old))
+    assert counts(open_store().load(default, 3)) == [0, 0, 6]
+
+
+def test_close_leaves_a_snapshot_and_an_empty_journal(paths, open_store):
+    store = open_store()
+    buckets = store.load(default, 3)
+    buckets[2]["count"] = 8
+    store.record(buckets, ids={3})
+    store.close()
+    assert counts(json.loads(paths[0].read_text())["buckets"]) == [0, 0, 8]
+    assert journal_lines(paths) == []
+    assert counts(open_store().load(default, 3)) == [0, 0, 8]
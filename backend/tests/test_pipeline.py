@@ -0,0 +1,140 @@
+# tests/test_pipeline.py
+"""FramePipeline with a scripted streamer, DropOldestQueue and the per-line pipeline metrics."""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import metrics
+from app.pipeline import DropOldestQueue, FramePipeline
+
+
+def test_drop_oldest_queue_keeps_the_newest():
+    frames = DropOldestQueue(2)
+    for i in range(5):
+        frames.put(i)
+    assert frames.dropped == 3
+    assert [frames.get(0.1), frames.get(0.1)] == [3, 4]
+    with pytest.raises(TimeoutError):
+        frames.get(0.05)
+
+
+def test_queue_metrics_are_labelled_by_line():
+    loop = asyncio.new_event_loop()
+    try:
+        north = FramePipeline(SimpleNamespace(line_id="north"), loop)
+        south = FramePipeline(SimpleNamespace(), loop, line_id="south")
+        for i in range(4):
+            north.raw_frames.put(i)
+        north.update_metrics()
+        south.update_metrics()
+    finally:
+        loop.close()
+    assert metrics.DROPPED_FRAMES.labels("north", "capture").value == 2
+    assert metrics.QUEUE_DEPTH.labels("north", "capture").value == 2
+    assert metrics.DROPPED_FRAMES.labels("south", "capture").value == 0
+    assert metrics.QUEUE_DEPTH.labels("south", "capture").value == 0
+
+
+class ScriptedStreamer:
+    """grab_frame() hands out 0..frames-1, then None; count_frame() takes `work` seconds per frame."""
+
+    line_id = "test"
+
+    def __init__(self, frames: int, is_live: bool, work: float = 0.0):
+        self.frames = frames
+        self.is_live = is_live
+        self.work = work
+        self.grabbed = 0
+        self.counted = []
+        self.arrivals = ()
+
+    def grab_frame(self):
+        if self.grabbed >= self.frames:
+            return None
+        self.grabbed += 1
+        if self.is_live:
+            time.sleep(0.001)
+        return self.grabbed - 1
+
+    def take_jpeg(self):
+        return None
+
+    def count_frame(self, frame):
+        time.sleep(self.work)
+        self.counted.append(frame)
+        return len(self.counted), frame, None
+
+
+async def drain(pipeline, consume: float = 0.0):
+    results = []
+    while (result := await pipeline.get()) is not None:
+        results.append(result)
+        await asyncio.sleep(consume)
+    return results
+
+
+def test_recorded_file_counts_every_frame_in_order():
+    async def scenario():
+        streamer = ScriptedStreamer(200, is_live=False)
+        pipeline = FramePipeline(streamer, asyncio.get_running_loop())
+        pipeline.start()
+        results = await drain(pipeline, consume=0.0005)
+        await asyncio.to_thread(pipeline.stop)
+        return streamer, pipeline, results
+
+    streamer, pipeline, results = asyncio.run(scenario())
+    assert streamer.counted == list(range(200))  # the capture side waited, nothing dropped
+    assert pipeline.raw_frames.dropped == 0
+    # the consumer only ever sees the freshest results, the count is still the last one
+    assert results[-1][0] == 200
+
+
+def test_live_source_drops_stale_frames_instead_of_falling_behind():
+    async def scenario():
+        streamer = ScriptedStreamer(300, is_live=True, work=0.005)
+        pipeline = FramePipeline(streamer, asyncio.get_running_loop(), capture_depth=2)
+        pipeline.start()
+        results = await drain(pipeline)
+        await asyncio.to_thread(pipeline.stop)
+        return streamer, pipeline, results
+
+    streamer, pipeline, results = asyncio.run(scenario())
+    assert pipeline.raw_frames.dropped > 0
+    assert len(streamer.counted) + pipeline.raw_frames.dropped == 300
+    assert streamer.counted == sorted(streamer.counted)
+    assert results[-1][1] == streamer.counted[-1]
+
+
+def test_event_loop_stays_responsive_while_detection_runs():
+    async def scenario():
+        streamer = ScriptedStreamer(20, is_live=True, work=0.05)  # slow "watershed"
+        pipeline = FramePipeline(streamer, asyncio.get_running_loop())
+        pipeline.start()
+        consumer = asyncio.create_task(drain(pipeline))
+        lags = []
+        while not consumer.done():
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - t0)
+        await asyncio.to_thread(pipeline.stop)
+        return lags
+
+    lags = asyncio.run(scenario())
+    assert max(lags) < 0.04  # never blocked for a whole frame of work
+
+
+def test_stop_ends_both_threads():
+    async def scenario():
+        streamer = ScriptedStreamer(10 ** 6, is_live=True)
+        pipeline = FramePipeline(streamer, asyncio.get_running_loop())
+        pipeline.start()
+        await asyncio.sleep(0.05)
+        threads = list(pipeline._threads)
+        await asyncio.to_thread(pipeline.stop)
+        return threads
+
+    assert not any(t.is_alive() for t in asyncio.run(scenario()))
+    assert not [t for t in threading.enumerate() if t.name.startswith("frame-")]
@@ -0,0 +1,233 @@
+# tests/test_preview.py
+"""AdaptiveRate stepping a client down and up the preview ladder; PreviewFrame encoding on demand and MJPEG passthrough."""
+import asyncio
+import json
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+from app import preview
+from app.broadcast import Subscriber
+from app.capture import Camera
+from app.preview import QUALITY_LADDER, AdaptiveRate, Overlay, PreviewFrame, PreviewLevel
+
+SLOW, FAST = 0.2, 0.001
+
+
+def feed(rate: AdaptiveRate, n: int, send_seconds: float, queued: int = 0):
+    for _ in range(n):
+        rate.observe(send_seconds, queued)
+
+
+@pytest.fixture
+def rate():
+    # alpha=1: no smoothing, so each observation counts on its own
+    return AdaptiveRate(alpha=1.0)
+
+
+def test_slow_sends_step_down_one_level_at_a_time(rate):
+    assert rate.level == QUALITY_LADDER[1]
+    feed(rate, 2, SLOW)
+    assert rate.index == 1
+    feed(rate, 1, SLOW)
+    assert rate.index == 2
+    feed(rate, 3, SLOW)
+    assert rate.index == 3
+    feed(rate, 30, SLOW)
+    assert rate.level == QUALITY_LADDER[-1]  # and no further
+
+
+def test_frames_piling_up_step_down_even_when_sends_are_fast(rate):
+    feed(rate, 3, FAST, queued=2)
+    assert rate.index == 2
+    feed(rate, 3, FAST, queued=1)  # one frame behind is fine
+    assert rate.index == 2
+
+
+def test_a_long_run_of_fast_sends_steps_back_up(rate):
+    feed(rate, 3, SLOW)
+    assert rate.index == 2
+    feed(rate, 29, FAST)
+    assert rate.index == 2
+    feed(rate, 1, FAST)
+    assert rate.index == 1
+    feed(rate, 60, FAST)
+    assert rate.index == 0
+    assert rate.min_interval == pytest.approx(1 / QUALITY_LADDER[0].fps)
+
+
+def test_a_slow_send_restarts_the_run(rate):
+    feed(rate, 29, FAST)
+    feed(rate, 1, SLOW)
+    feed(rate, 29, FAST)
+    assert rate.index == 1
+
+
+def test_send_time_is_smoothed():
+    rate = AdaptiveRate(alpha=0.5)
+    rate.observe(0.1, 0)
+    rate.observe(0.1, 0)
+    assert rate.send_time == pytest.approx(0.075)
+    assert rate.index == 1  # two bad sends are not enough
+
+
+def test_fixed_rate_never_moves():
+    level = PreviewLevel(60, 1.0, None)
+    rate = AdaptiveRate(ladder=(level,), start=0, adaptive=False, alpha=1.0)
+    feed(rate, 10, SLOW, queued=5)
+    assert rate.level == level and rate.min_interval == 0.0
+    assert rate.send_time == pytest.approx(SLOW)
+
+
+# ─── PreviewFrame ────────────────────────────────────────────────
+TOP, LOW = QUALITY_LADDER[0], QUALITY_LADDER[3]
+
+
+@pytest.fixture
+def encodes(monkeypatch):
+    """Levels encode_jpeg was called with."""
+    calls = []
+    real = preview.encode_jpeg
+
+    def counting(image, level):
+        calls.append(level)
+        return real(image, level)
+
+    monkeypatch.setattr(preview, "encode_jpeg", counting)
+    return calls
+
+
+def grey_frame(count: int = 7, **kwargs) -> PreviewFrame:
+    image = np.full((120, 160, 3), 128, np.uint8)
+    overlay = Overlay(circles=[((80, 60), 20)], boxes=np.array([[60, 40, 100, 80]]), trigger_line_y=90)
+    return PreviewFrame(count, image, overlay, **kwargs)
+
+
+def decode(data) -> np.ndarray:
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.binary = []
+        self.texts = []
+
+    async def send_bytes(self, data):
+        self.binary.append(bytes(data))
+
+    async def send_text(self, text):
+        self.texts.append(json.loads(text))
+
+
+def serve(frame: PreviewFrame, mode: str) -> RecordingSocket:
+    """Send one frame to one client at TOP, return what went over the socket."""
+    socket = RecordingSocket()
+    fixed = AdaptiveRate(ladder=(TOP._replace(fps=None),), start=0, adaptive=False)
+
+    async def scenario():
+        sub = Subscriber(socket, rate=fixed, mode=mode)
+        sub.push_frame(frame)
+        task = asyncio.create_task(sub.run())
+        await asyncio.sleep(0.2)
+        sub.close()
+        await task
+
+    asyncio.run(scenario())
+    return socket
+
+
+def test_nothing_is_drawn_or_encoded_until_asked(encodes):
+    frame = grey_frame()
+    assert encodes == []
+    assert (frame.image == 128).all()
+
+
+def test_clients_at_one_level_share_one_encode(encodes):
+    frame = grey_frame(count=41)
+
+    async def clients():
+        return await asyncio.gather(frame.framed(TOP), frame.framed(TOP), frame.framed(LOW), frame.framed(TOP, offset=2))
+
+    top, again, low, offset = asyncio.run(clients())
+    assert top is again
+    assert encodes.count(TOP) == 2 and encodes.count(LOW) == 1  # TOP once per offset
+    assert struct.unpack_from("!I", top)[0] == 41
+    assert struct.unpack_from("!I", offset)[0] == 43
+    assert decode(top[4:]).shape == (120, 160, 3)
+    assert decode(low[4:]).shape == (60, 80, 3)  # LOW is half size
+
+
+def test_a_backed_up_client_only_encodes_the_newest_frame(encodes):
+    socket = RecordingSocket()
+    fixed = AdaptiveRate(ladder=(TOP._replace(fps=None),), start=0, adaptive=False)
+
+    async def scenario():
+        sub = Subscriber(socket, rate=fixed, mode="annotated")
+        for count in range(5):
+            sub.push_frame(grey_frame(count))  # counted faster than the client is served
+        task = asyncio.create_task(sub.run())
+        await asyncio.sleep(0.2)
+        sub.close()
+        await task
+        return sub.skipped_frames
+
+    skipped = asyncio.run(scenario())
+    assert skipped == 4
+    assert len(encodes) == 1
+    assert [struct.unpack_from("!I", m)[0] for m in socket.binary] == [4]
+
+
+def camera_jpeg(frame: PreviewFrame) -> np.ndarray:
+    """What an MJPEG camera would have sent for this frame, before any drawing."""
+    return cv2.imencode(".jpg", frame.image, [int(cv2.IMWRITE_JPEG_QUALITY), 90])[1].reshape(-1)
+
+
+def test_vector_clients_get_the_cameras_own_bytes(encodes):
+    frame = grey_frame(count=12, keep_raw=True)
+    frame.camera_jpeg = jpeg = camera_jpeg(frame)
+    data = asyncio.run(frame.raw(LOW))  # level is ignored
+    assert np.shares_memory(np.frombuffer(data, np.uint8), jpeg)
+
+    socket = serve(frame, "vector")
+    assert encodes == []
+    assert socket.binary == [jpeg.tobytes()]
+    [overlay] = socket.texts
+    assert overlay["type"] == "overlay" and overlay["count"] == 12
+    assert overlay["frame_size"] == [160, 120] and overlay["boxes"] == [[60, 40, 100, 80]]
+
+
+def test_without_camera_bytes_raw_is_one_clean_encode(encodes):
+    frame = grey_frame(keep_raw=True)
+
+    async def both():
+        return await frame.raw(TOP), await frame.raw(TOP), await frame.framed(TOP)
+
+    raw, again, framed = asyncio.run(both())
+    assert raw.obj is again.obj and len(encodes) == 2  # one raw, one annotated
+    assert np.abs(decode(raw).astype(int) - 128).max() < 8   # nothing drawn on it
+    assert (decode(framed[4:]) != decode(raw)).any()
+    assert (frame.image == 128).all()  # annotation drew on a copy
+
+
+def test_raw_without_keep_raw_falls_back_to_the_annotated_jpeg(encodes):
+    frame = grey_frame()  # no vector client when it was published
+
+    async def both():
+        return await frame.raw(TOP), await frame.jpeg(TOP)
+
+    raw, annotated = asyncio.run(both())
+    assert bytes(raw) == bytes(annotated) and len(encodes) == 1
+
+
+def test_camera_keeps_the_mjpeg_bytes_of_the_last_frame():
+    camera = Camera(source="unused")
+    image = np.full((120, 160, 3), 90, np.uint8)
+    jpeg = cv2.imencode(".jpg", image)[1].reshape(1, -1)  # undecoded buffer, as CAP_PROP_CONVERT_RGB=0 gives
+    decoded = camera._decoded(jpeg)
+    assert decoded.shape == (120, 160, 3)
+    assert camera.take_jpeg().tobytes() == jpeg.tobytes()
+    assert camera.take_jpeg() is None  # handed out once
+    camera._decoded(jpeg)
+    assert camera._decoded(image) is image and camera.take_jpeg() is None  # BGR frames carry no JPEG
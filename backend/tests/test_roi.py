@@ -0,0 +1,93 @@
+# tests/test_roi.py
+"""Roi: region of interest and counting band in processed-frame pixels."""
+import numpy as np
+import pytest
+
+from app.roi import Roi, load_roi, save_roi
+
+
+@pytest.fixture
+def frame():
+    """320x240 frame whose pixel values encode their own position."""
+    ys, xs = np.mgrid[0:240, 0:320]
+    return np.dstack((xs % 256, ys, np.full_like(xs, 200))).astype(np.uint8)
+
+
+@pytest.mark.parametrize("band", [0, -10, "20", 12.5, True, [20]])
+def test_band_must_be_a_positive_number_or_null(band):
+    with pytest.raises(ValueError, match="band"):
+        Roi(trigger_line_y=120, band=band)
+
+
+def test_band_null_is_the_whole_region():
+    roi = Roi(trigger_line_y=120, band=None)
+    assert roi.band is None and roi.full_frame
+
+
+def test_band_keeps_pixels_around_the_trigger_line():
+    roi = Roi(trigger_line_y=120, band=30.0)
+    assert roi.band == 30
+    assert roi.box == (0, 90, 320, 150)
+
+
+def test_full_frame_crop_is_the_frame_itself(frame):
+    roi = Roi()
+    assert roi.crop(frame) is frame
+    dets = np.array([[10.0, 20.0, 30.0, 40.0, 1.0]])
+    assert roi.to_frame(dets.copy()).tolist() == dets.tolist()
+
+
+def test_rect_and_band_crop_a_view_of_their_overlap(frame):
+    roi = Roi(rect=[40, 100, 280, 240], trigger_line_y=120, band=40)
+    assert roi.box == (40, 100, 280, 160)
+    crop = roi.crop(frame)
+    assert crop.shape == (60, 240, 3) and np.shares_memory(crop, frame)
+    assert crop[0, 0].tolist() == [40, 100, 200]
+
+
+def test_band_is_clipped_to_the_frame():
+    assert Roi(trigger_line_y=10, band=50).box == (0, 0, 320, 60)
+    assert Roi(trigger_line_y=230, band=50).box == (0, 180, 320, 240)
+
+
+def test_polygon_blacks_out_what_is_outside_it(frame):
+    roi = Roi(polygon=[[100, 50], [200, 50], [100, 150]], trigger_line_y=120)
+    assert roi.box == (100, 50, 201, 151) and not roi.full_frame
+    crop = roi.crop(frame)
+    assert crop[5, 5].tolist() == [105, 55, 200]  # inside the triangle
+    assert crop[95, 95].tolist() == [0, 0, 0]     # outside it
+    assert frame[145, 195].tolist() == [195, 145, 200]  # the frame is left alone
+
+
+def test_crop_results_are_shifted_back_to_frame_pixels():
+    roi = Roi(rect=[40, 100, 280, 240], trigger_line_y=120, band=40)
+    dets = np.array([[10.0, 20.0, 30.0, 40.0, 0.9]])
+    assert roi.to_frame(dets).tolist() == [[50.0, 120.0, 70.0, 140.0, 0.9]]
+    assert roi.to_frame(np.empty((0, 5))).shape == (0, 5)
+    assert roi.circles_to_frame([((5, 6), 7)]) == [((45, 106), 7)]
+
+
+@pytest.mark.parametrize("kwargs", [
+    dict(rect=[0, 0, 5, 240]),                      # too narrow
+    dict(polygon=[[0, 0], [50, 50]]),               # not a polygon
+    dict(trigger_line_y=240),                       # below the frame
+    dict(rect=[0, 0, 320, 100], trigger_line_y=200, band=20),  # band misses the rect
+])
+def test_unusable_regions_are_refused(kwargs):
+    with pytest.raises(ValueError):
+        Roi(**kwargs)
+
+
+def test_saved_roi_loads_back(tmp_path):
+    path = tmp_path / "roi.json"
+    save_roi(Roi(polygon=[[100, 50], [200, 50], [100, 150]], trigger_line_y=100, band=30), path)
+    roi = load_roi(120, path)
+    assert roi.polygon == [[100, 50], [200, 50], [100, 150]]
+    assert (roi.trigger_line_y, roi.band, roi.box) == (100, 30, (100, 70, 201, 130))
+
+
+def test_unreadable_roi_file_falls_back_to_the_whole_frame(tmp_path):
+    path = tmp_path / "roi.json"
+    path.write_text('{"band": 0}')
+    roi = load_roi(110, path)
+    assert roi.full_frame and roi.trigger_line_y == 110
@@ -0,0 +1,68 @@
+# tests/test_sort.py
+"""BatchSort against sort.Sort on the benchmark's synthetic belt, plus its per-track views."""
+import numpy as np
+import pytest
+
+from benchmarks.bench_tracker import synthetic_detections
+from sort.batch_sort import BatchSort
+from sort.sort import KalmanBoxTracker, Sort
+
+pytest.importorskip("filterpy")
+
+
+def run(tracker, frames):
+    return [tracker.update(dets) for dets in frames]
+
+
+def box(cx, cy, r=14.0):
+    return [cx - r, cy - r, cx + r, cy + r, 1.0]
+
+
+@pytest.fixture(autouse=True)
+def fresh_ids():
+    KalmanBoxTracker.count = 0
+    BatchSort.count = 0
+
+
+@pytest.mark.parametrize("n, params", [
+    (5, dict(max_age=5, min_hits=1, iou_threshold=0.2)),
+    (20, dict(max_age=1, min_hits=3, iou_threshold=0.3)),
+])
+def test_same_output_as_sort(n, params):
+    frames = synthetic_detections(n, 150, seed=n)
+    old = run(Sort(**params), frames)
+    new = run(BatchSort(**params), frames)
+    assert len(old) == len(new)
+    for i, (a, b) in enumerate(zip(old, new)):
+        assert a.shape == b.shape, f"frame {i}"
+        np.testing.assert_allclose(b, a, rtol=1e-6, atol=1e-6, err_msg=f"frame {i}")
+
+
+def test_grows_past_its_capacity():
+    frames = synthetic_detections(40, 30, seed=3)
+    old = run(Sort(max_age=5, min_hits=1, iou_threshold=0.2), frames)
+    tracker = BatchSort(max_age=5, min_hits=1, iou_threshold=0.2, capacity=4)
+    new = run(tracker, frames)
+    assert tracker._cap >= tracker.live_tracks > 4
+    for a, b in zip(old, new):
+        np.testing.assert_allclose(b, a, rtol=1e-6, atol=1e-6)
+
+
+def test_velocities_line_up_with_track_ids():
+    tracker = BatchSort(max_age=2, min_hits=1)
+    for step in range(10):
+        # one nut moving down 3 px/frame, one moving right 2 px/frame
+        tracker.update(np.array([box(100, 50 + 3 * step), box(50 + 2 * step, 200)]))
+    assert tracker.live_tracks == 2
+    assert list(tracker.track_ids) == [1, 2]
+    np.testing.assert_allclose(tracker.velocities, [[0, 3], [2, 0]], atol=0.2)
+
+
+def test_lost_tracks_are_dropped_after_max_age():
+    tracker = BatchSort(max_age=2, min_hits=1)
+    tracker.update(np.array([box(100, 100)]))
+    empty = np.empty((0, 5))
+    for _ in range(3):
+        assert len(tracker.update(empty)) == 0
+    assert tracker.live_tracks == 0
+    assert tracker.track_ids.size == 0 and tracker.velocities.shape == (0, 2)
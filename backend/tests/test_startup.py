@@ -0,0 +1,23 @@
+# tests/test_startup.py
+"""Importing the server must not pull in packages only frame processing (or nothing) needs."""
+import pytest
+
+from benchmarks.bench_startup import BANNED, import_times
+
+
+@pytest.mark.parametrize("module", ["app.main", "app.engine", "app.detection", "app.detectors", "sort.batch_sort"])
+def test_no_heavy_imports_at_startup(module):
+    loaded = {name.split(".")[0] for name, _, _ in import_times(module)}
+    assert not loaded & set(BANNED), f"import {module} loads {sorted(loaded & set(BANNED))}"
+
+
+def test_detectors_still_work_with_lazy_imports():
+    import cv2
+    import numpy as np
+    from app.detectors import create_detector
+
+    frame = np.zeros((240, 320, 3), np.uint8)
+    for x in (100, 220):
+        cv2.circle(frame, (x, 120), 30, (40, 90, 140), -1)  # BGR coconut brown
+    for name in ("hsv_watershed", "pyramid"):
+        assert len(create_detector(name, min_area=500).detect(frame)) == 2, name
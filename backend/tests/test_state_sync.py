@@ -0,0 +1,142 @@
+# tests/test_state_sync.py
+"""BucketStateSync deltas, seq numbering and resync, and the subscriber queue collapsing deltas."""
+import asyncio
+import json
+
+import pytest
+
+from app.broadcast import Subscriber
+from app.state_sync import BucketStateSync
+
+
+class RecordingHub:
+    def __init__(self):
+        self.sent = []
+
+    def publish_text(self, text: str):
+        self.sent.append(json.loads(text))
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.texts = []
+
+    async def send_text(self, text: str):
+        self.texts.append(json.loads(text))
+
+
+@pytest.fixture
+def buckets():
+    return [{"id": i, "count": 0, "set_value": 10, "filled": False} for i in range(1, 4)]
+
+
+@pytest.fixture
+def hub():
+    return RecordingHub()
+
+
+@pytest.fixture
+def state(hub, buckets):
+    return BucketStateSync(hub, buckets, max_hz=5.0, history=4)
+
+
+def bump(state, bucket_id, **fields):
+    """Change a bucket and flush it as its own delta."""
+    state.buckets[bucket_id - 1].update(fields)
+    state._dirty.add(bucket_id)
+    state.flush()
+
+
+def test_deltas_carry_only_the_changed_fields(state, hub):
+    bump(state, 2, count=5)
+    bump(state, 3, count=10, filled=True)
+    assert hub.sent == [
+        {"type": "buckets_delta", "seq": 1, "changes": [{"id": 2, "count": 5}]},
+        {"type": "buckets_delta", "seq": 2, "changes": [{"id": 3, "count": 10, "filled": True}]},
+    ]
+
+
+def test_nothing_changed_publishes_nothing(state, hub):
+    state.flush()
+    bump(state, 1, count=0)  # marked, but the value is what clients already have
+    assert hub.sent == [] and state.seq == 0
+
+
+def test_marks_are_coalesced_until_the_next_slot(state, hub):
+    async def scenario():
+        state.mark({1})
+        await asyncio.sleep(0.05)  # first change goes out at once
+        for n in range(1, 6):
+            state.buckets[0]["count"] = n
+            state.mark({1})
+            await asyncio.sleep(0.01)
+        state.buckets[1]["count"] = 3
+        state.mark({2})
+        assert len(hub.sent) == 1  # the rest wait for the next slot
+        await asyncio.sleep(0.3)
+        state.buckets[2].update(count=10, filled=True)
+        state.mark({3}, urgent=True)
+        await asyncio.sleep(0.02)  # well inside the 0.2 s interval
+        state._task.cancel()
+
+    state.buckets[0]["count"] = 1
+    asyncio.run(scenario())
+    assert [(m["seq"], m["changes"]) for m in hub.sent] == [
+        (1, [{"id": 1, "count": 1}]),
+        (2, [{"id": 1, "count": 5}, {"id": 2, "count": 3}]),
+        (3, [{"id": 3, "count": 10, "filled": True}]),
+    ]
+
+
+def test_resync_merges_the_deltas_a_client_missed(state):
+    bump(state, 1, count=1)
+    bump(state, 2, count=1)
+    bump(state, 1, count=2)
+    bump(state, 2, set_value=20)
+    msg = json.loads(state.resync_message(1))
+    assert msg == {"type": "buckets_delta", "seq": 4,
+                   "changes": [{"id": 2, "count": 1, "set_value": 20}, {"id": 1, "count": 2}]}
+
+
+def test_resync_when_up_to_date_is_an_empty_delta(state):
+    bump(state, 1, count=1)
+    assert json.loads(state.resync_message(1)) == {"type": "buckets_delta", "seq": 1, "changes": []}
+
+
+@pytest.mark.parametrize("since", [-1, 1, 99])
+def test_resync_falls_back_to_a_snapshot(state, buckets, since):
+    # history=4: seq 2 is the oldest delta left; 99 is from before a restart
+    for n in range(1, 7):
+        bump(state, 1, count=n)
+    msg = json.loads(state.resync_message(since))
+    assert msg == {"type": "buckets_update", "seq": 6, "buckets": buckets}
+
+
+def test_oldest_delta_still_held_is_enough_to_resync(state):
+    for n in range(1, 7):
+        bump(state, 1, count=n)
+    msg = json.loads(state.resync_message(2))  # deltas 3..6 are all still held
+    assert msg["type"] == "buckets_delta" and msg["changes"] == [{"id": 1, "count": 6}]
+
+
+def test_a_backed_up_client_gets_one_snapshot_instead_of_the_deltas(state, hub):
+    socket = RecordingSocket()
+
+    async def scenario():
+        sub = Subscriber(socket, max_texts=4, resync=state.snapshot_message)
+        hub.publish_text = sub.send_text
+        sub.send_json({"type": "ack", "n": 1})
+        for n in range(1, 6):
+            bump(state, 1, count=n)
+        sub.send_json({"type": "ack", "n": 2})
+        assert not sub.overflowed
+        task = asyncio.create_task(sub.run())
+        await asyncio.sleep(0.05)
+        sub.close()
+        await task
+
+    asyncio.run(scenario())
+    # deltas 1-4 overflowed into one snapshot, built when sent; delta 5 queued after it
+    assert [m["type"] for m in socket.texts] == ["ack", "buckets_update", "buckets_delta", "ack"]
+    assert socket.texts[1]["seq"] == 5 and socket.texts[1]["buckets"][0]["count"] == 5
+    assert socket.texts[2]["seq"] == 5
@@ -1,7 +1,8 @@
 // src/App.jsx
-import { useState, useEffect, useRef } from "react";
+import { useState, useEffect, useRef, useCallback } from "react";
 import Bucket from "./components/Bucket";
 import KeyboardComponent from "./components/KeyboardComponent";
+import PreviewOverlay from "./components/PreviewOverlay";
 import "./App.css";
 
 const STORAGE_KEY = "coconut_State_v1"; // still used for saving frontend metadata (optional)
@@ -55,10 +56,14 @@ export default function App() {
   const isStreamingRef = useRef(isStreaming);
   const [totalCoconutCount, setTotalCoconutCount] = useState(0);
   const [imgSrc, setImgSrc] = useState("");
+  // vector preview: the server sends an "overlay" message, then the bare JPEG
+  const [overlay, setOverlay] = useState(null);
+  const pendingOverlayRef = useRef(null);
 
   // Bucket related states (will be populated from server)
   const defaultBuckets = Array.from({ length: 14 }, (_, i) => ({ id: i + 1, count: 0, set_value: 800, filled: false }));
   const [buckets, setBuckets] = useState(defaultBuckets);
+  const bucketsSeqRef = useRef(null); // seq of the last buckets_update / buckets_delta applied
 
   // Keyboard related states
   const [isKeyboardVisible, setIsKeyboardVisible] = useState(false);
@@ -106,7 +111,7 @@ export default function App() {
 
   // WebSocket setup on mount — sends "start" automatically on open
   useEffect(() => {
-    ws.current = new WebSocket("ws://localhost:8000/ws");
+    ws.current = new WebSocket("ws://localhost:8000/ws?preview=vector");
     ws.current.binaryType = "blob";
 
     ws.current.onopen = () => {
@@ -159,12 +164,34 @@ export default function App() {
           return;
         }
 
+        if (parsed && parsed.type === "overlay") {
+          // belongs to the binary frame that follows
+          pendingOverlayRef.current = parsed;
+          return;
+        }
+
         if (parsed && parsed.type === "buckets_update") {
-          // authoritative state from server
+          // authoritative snapshot from server
+          bucketsSeqRef.current = parsed.seq ?? null;
           setBuckets(parsed.buckets);
           return;
         }
 
+        if (parsed && parsed.type === "buckets_delta") {
+          const last = bucketsSeqRef.current;
+          if (last !== null && parsed.seq > last + 1) {
+            // missed a delta: ask for everything since the last one we applied
+            ws.current.send(JSON.stringify({ type: "resync", seq: last }));
+            return;
+          }
+          if (last !== null && parsed.seq <= last) return; // already applied
+          bucketsSeqRef.current = parsed.seq;
+          const changes = new Map(parsed.changes.map((c) => [c.id, c]));
+          // only the changed buckets get new objects, so memoized Buckets skip re-rendering
+          setBuckets((prev) => prev.map((b) => (changes.has(b.id) ? { ...b, ...changes.get(b.id) } : b)));
+          return;
+        }
+
         if (parsed && parsed.type === "selected_bucket") {
           setSelectedBucket(parsed.bucket);
           return;
@@ -180,6 +207,7 @@ export default function App() {
         if (event.data === "reset") {
           setTotalCoconutCount(0);
           setImgSrc("");
+          setOverlay(null);
           setSelectedBucket(null);
           return;
         }
@@ -188,6 +216,20 @@ export default function App() {
         return;
       }
 
+      // vector preview: the blob is the JPEG itself, count and boxes came in the overlay
+      const pending = pendingOverlayRef.current;
+      if (pending) {
+        pendingOverlayRef.current = null;
+        const url = URL.createObjectURL(event.data.slice(0, event.data.size, "image/jpeg"));
+        setTotalCoconutCount(pending.count);
+        setOverlay(pending);
+        setImgSrc((prev) => {
+          try { if (prev) URL.revokeObjectURL(prev); } catch (e) {}
+          return url;
+        });
+        return;
+      }
+
       // binary frames: header + jpeg
       const reader = new FileReader();
       reader.onload = () => {
@@ -353,9 +395,9 @@ export default function App() {
   };
 
   // Called when user clicks a bucket in UI
-  const onBucketClicked = (id) => {
+  const onBucketClicked = useCallback((id) => {
     // toggle keyboard for same bucket, else set selected and open keyboard
-    if (selectedBucket === id) {
+    if (selectedBucketRef.current === id) {
       setIsKeyboardVisible((prev) => !prev);
     } else {
       setSelectedBucket(id);
@@ -369,7 +411,7 @@ export default function App() {
       }
       setIsKeyboardVisible(true);
     }
-  };
+  }, []);
 
   //-------------------------------------------//
   return (
@@ -396,7 +438,12 @@ export default function App() {
           <h2>Total Coconuts: {totalCoconutCount}</h2>
           <h2>Active Bucket: {selectedBucket ?? "—"}</h2>
           <div className="vidandtime">
-            {imgSrc && <img className="video_frame" src={imgSrc} alt="Stream" />}
+            {imgSrc && (
+              <div className="video_stage">
+                <img className="video_frame" src={imgSrc} alt="Stream" />
+                {overlay && <PreviewOverlay overlay={overlay} />}
+              </div>
+            )}
             <div className="clock">
               <div className="clock-date">{dateStr}</div>
               <div className="clock-time">{timeStr}</div>
@@ -428,7 +475,7 @@ export default function App() {
               set_value={bucket.set_value}
               isFilled={bucket.count >= bucket.set_value || !!bucket.filled}
               isSelected={bucket.id === selectedBucket}
-              handleClick={() => onBucketClicked(bucket.id)}
+              onSelect={onBucketClicked}
             />
           ))}
         </div>
@@ -1,10 +1,13 @@
-import React from 'react';
+import React, { memo } from 'react';
 
-export default function Bucket(props){
+// memo: a count change in one bucket should not re-render the other thirteen
+function Bucket(props){
     return (
-        <div onClick={props.handleClick} className={`bucket ${props.isFilled ? 'filled' : ''} ${props.isSelected ? 'selected' : ''}`}>
+        <div onClick={() => props.onSelect(props.id)} className={`bucket ${props.isFilled ? 'filled' : ''} ${props.isSelected ? 'selected' : ''}`}>
             <h3>Bucket {props.id}</h3>
             <p>{props.count}/<span>{props.set_value}</span></p>
         </div>
     )
-}
\ No newline at end of file
+}
+
+export default memo(Bucket);
@@ -0,0 +1,30 @@
+import React, { memo } from 'react';
+
+// Boxes, detector circles, trigger line and ROI from an "overlay" message,
+// drawn over the bare preview JPEG (the server sends ?preview=vector clients
+// the camera image untouched). Coordinates are processed-frame pixels.
+function PreviewOverlay({ overlay }) {
+    const [w, h] = overlay.frame_size || [320, 240];
+    return (
+        <svg className="preview_overlay" viewBox={`0 0 ${w} ${h}`} preserveAspectRatio="none">
+            {overlay.roi_box && (
+                <rect x={overlay.roi_box[0]} y={overlay.roi_box[1]}
+                      width={overlay.roi_box[2] - overlay.roi_box[0]} height={overlay.roi_box[3] - overlay.roi_box[1]}
+                      fill="none" stroke="yellow" strokeWidth="1" />
+            )}
+            {overlay.roi_polygon && (
+                <polygon points={overlay.roi_polygon.map(([x, y]) => `${x},${y}`).join(' ')}
+                         fill="none" stroke="yellow" strokeWidth="1" />
+            )}
+            {(overlay.circles || []).map(([x, y, r], i) => (
+                <circle key={`c${i}`} cx={x} cy={y} r={r} fill="none" stroke="blue" strokeWidth="2" />
+            ))}
+            {(overlay.boxes || []).map(([x1, y1, x2, y2], i) => (
+                <rect key={`b${i}`} x={x1} y={y1} width={x2 - x1} height={y2 - y1} fill="none" stroke="lime" strokeWidth="2" />
+            ))}
+            <line x1="0" y1={overlay.trigger_line_y} x2={w} y2={overlay.trigger_line_y} stroke="red" strokeWidth="2" />
+        </svg>
+    );
+}
+
+export default memo(PreviewOverlay);